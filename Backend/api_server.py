@@ -1,11 +1,17 @@
 import os
 import sys
-from typing import Optional
+import asyncio
+import hashlib
+from typing import Literal, Optional, Union
 import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 
-from fastapi import FastAPI
+import numpy as np
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
 
 # Ensure we can import sibling module
 CURRENT_DIR = os.path.dirname(__file__)
@@ -16,23 +22,69 @@ if CURRENT_DIR not in sys.path:
 from final_backend_code import (
     parse_dates_from_query,
     parse_coords_from_query,
-    load_txt_files,
-    filter_by_date,
-    build_and_search,
-    fetch_from_postgres,
-    to_json,
-    to_table_json,
+    parse_radius_from_query,
+    get_range_index,
+    search_range,
+    search_range_batch,
+    fetch_profile_columns_range_async,
     summarize,
-    conversation_chain,
+    predict_summary_async,
+    stream_summary_async,
+    llm_response_cache,
+    result_cache,
+    lookup_result,
+    SINGLE_FLIGHTS,
+    data_version,
+    warm_up,
     detect_visualization,
     detect_tabular,
     detect_requested_conditions,
     get_last_state,
     set_last_state,
-    geocode_region,
+    session_store,
+    geocode_first_async,
+    close_http_clients,
+    geocode_cache,
+    GEOCODE_STATS,
+    db_pool,
+    month_index_cache,
+    spatial_index_cache,
+    climatology_cube,
 )
+from columnar import ProfileColumns, ARROW_AVAILABLE, ARROW_MEDIA_TYPE, arrow_ipc, dumps_columns
+from vertical_profiles import STANDARD_PRESSURE_LEVELS, query_vertical_profiles
+from region_stats import query_region_stats
+from telemetry import (
+    configure_logging,
+    get_logger,
+    begin_trace,
+    end_trace,
+    register_collector,
+    render_metrics,
+    REQUEST_SECONDS,
+)
+
+configure_logging()
+logger = get_logger("api")
+
+# Heavy components are created on first use; warm them up in the background once the server
+# is accepting requests (WARMUP_ENABLED=0 leaves everything to the first request)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
 
-app = FastAPI(title="Oceanography Assistant API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the warm-up on startup; close the HTTP clients and the DB pool on shutdown."""
+    # Keep a reference: the event loop holds tasks only weakly
+    app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up)) if WARMUP_ENABLED else None
+    try:
+        yield
+    finally:
+        await close_http_clients()
+        db_pool.close()
+
+
+app = FastAPI(title="Oceanography Assistant API", lifespan=lifespan)
 
 # Allow Next.js dev and any local origins
 origins = [
@@ -50,16 +102,61 @@ app.add_middleware(
 
 class ChatRequest(BaseModel):
     message: str
+    fresh: bool = False  # skip the LLM response cache and generate a new answer
+    session_id: Optional[str] = None  # conversation id; a new one is issued when omitted
+    # Shape of `data`: list of row objects, one array per column, or an Arrow IPC stream
+    data_format: Literal["rows", "columns", "arrow"] = "rows"
 
 
 class ChatResponse(BaseModel):
     type: str  # 'answer' | 'visualization' | 'table'
     answer: Optional[str] = None
-    data: Optional[list] = None
+    data: Optional[Union[list, dict]] = None  # dict of column arrays when data_format="columns"
+    session_id: Optional[str] = None
+    data_format: Optional[str] = None
+
+
+# Bounds on a /profiles/vertical response: profiles × points × variables values at most
+MAX_VERTICAL_PROFILES = int(os.getenv("MAX_VERTICAL_PROFILES", "50"))
+MAX_PROFILE_POINTS = int(os.getenv("MAX_PROFILE_POINTS", "500"))
+
+
+class VerticalProfileRequest(BaseModel):
+    year: int
+    profile_ids: Optional[list[int]] = None  # e.g. from a visualization response
+    float_ids: Optional[list[int]] = None  # all profiles of these floats (within the window, if given)
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    # "levels": averages on standard pressure levels; "lttb": raw samples downsampled to `points`
+    mode: Literal["levels", "lttb"] = "levels"
+    points: int = Field(200, ge=3, le=MAX_PROFILE_POINTS)
+    levels: Optional[list[float]] = Field(None, min_length=2, max_length=MAX_PROFILE_POINTS)
+    variables: list[Literal["temperature", "salinity"]] = ["temperature", "salinity"]
+
+
+# Bounds on a /profiles/nearest:batch request
+MAX_BATCH_POINTS = int(os.getenv("MAX_BATCH_POINTS", "500"))
+MAX_BATCH_K = int(os.getenv("MAX_BATCH_K", "50"))
+
+
+class NearestPoint(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    start_date: datetime
+    end_date: datetime
+
+
+class NearestBatchRequest(BaseModel):
+    points: list[NearestPoint] = Field(min_length=1, max_length=MAX_BATCH_POINTS)
+    k: int = Field(10, ge=1, le=MAX_BATCH_K)
+    radius_km: Optional[float] = Field(None, gt=0)  # default SEARCH_RADIUS_KM
+    conditions: list[Literal["pressure", "temperature", "salinity"]] = []  # stats to include; all when empty
 
 
 # Utility: Extract best-effort region phrases and clean them for geocoding
 
+RADIUS_PATTERN = r"\bwithin\s+\d+(?:\.\d+)?\s*(?:km|kms|kilomet(?:er|re)s?|mi|miles?|nm|nautical\s+miles?)\b"
+
 def clean_region_query(query: str) -> str:
     """
     Normalize a free-form query into a geocoding-friendly phrase.
@@ -70,6 +167,8 @@ def clean_region_query(query: str) -> str:
 
     # Remove month-year and standalone years
     q = re.sub(r"\b(january|february|march|april|may|june|july|august|september|october|november|december)\b\s*\d{4}", " ", q, flags=re.I)
+    # Remove search radius phrases ("within 300 km") before bare numbers are stripped
+    q = re.sub(RADIUS_PATTERN, " ", q, flags=re.I)
     q = re.sub(r"\b\d{4}\b", " ", q)
 
     # Remove measurement/task words and fillers; keep coastal words
@@ -97,6 +196,7 @@ def extract_region_candidates(query: str) -> list[str]:
 
     # 1) Remove obvious non-location parts: dates, months, numbers with years
     text = re.sub(r"\b(January|February|March|April|May|June|July|August|September|October|November|December)\b\s*\d{4}", " ", text, flags=re.I)
+    text = re.sub(RADIUS_PATTERN, " ", text, flags=re.I)  # search radius
     text = re.sub(r"\b\d{4}\b", " ", text)  # years
 
     # 1a) Priority: extract coastal-focused phrases directly from the original (lower) text
@@ -176,87 +276,587 @@ def extract_region_candidates(query: str) -> list[str]:
     return ordered[:6]
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Trace each request: stage timings are returned in the Server-Timing header, logged
+    as one line, and the latency is observed per route in floatchat_request_seconds.
+    """
+    token, trace = begin_trace(f"{request.method} {request.url.path}", request.headers.get("x-request-id", "")[:64] or None)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Request-ID"] = trace.id
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(trace.elapsed(), route=getattr(route, "path", "unmatched"),
+                                method=request.method, status=status)
+        end_trace(token)
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
-@app.post("/chat/send", response_model=ChatResponse)
-def chat_send(req: ChatRequest):
-    user_input = req.message or ""
-    is_visualization = detect_visualization(user_input)
-    is_tabular = detect_tabular(user_input)
-    requested_conditions = detect_requested_conditions(user_input)
-    query_summary = ("summary" in user_input.lower()) or (not is_visualization and not is_tabular)
+@app.get("/stats")
+def stats():
+    """Cache and connection pool counters, for sizing and debugging."""
+    return {
+        "db_pool": db_pool.stats(),
+        "index_cache": month_index_cache.stats(),
+        "spatial_index": spatial_index_cache.stats(),
+        "geocode_cache": {**GEOCODE_STATS, "entries": len(geocode_cache)},
+        "llm_cache": llm_response_cache.stats(),
+        "result_cache": result_cache.stats(),
+        "sessions": session_store.stats(),
+        "singleflight": {flight.name: flight.stats() for flight in SINGLE_FLIGHTS},
+    }
+
+
+def _ratio(hits, total):
+    return hits / total if total else 0.0
+
+
+def stats_metrics():
+    """/stats as gauges (floatchat_<section>_<counter>) plus a hit ratio per cache."""
+    current = stats()
+    families = [
+        (f"floatchat_{section}_{key}", "gauge", f"{section} {key} (see /stats).", [({}, value)])
+        for section, values in current.items()
+        for key, value in values.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+    index, spatial, geocode = current["index_cache"], current["spatial_index"], current["geocode_cache"]
+    ratios = {
+        "index": _ratio(index["hits"] + index["disk_hits"], index["hits"] + index["disk_hits"] + index["misses"]),
+        "spatial_index": _ratio(spatial["hits"], spatial["hits"] + spatial["misses"]),
+        "geocode": _ratio(geocode["hits"], geocode["hits"] + geocode["misses"]),
+        "llm": current["llm_cache"]["hit_rate"],
+        "result": current["result_cache"]["hit_rate"],
+    }
+    families.append(("floatchat_cache_hit_ratio", "gauge", "Cache hits / lookups since start.",
+                     [({"cache": name}, value) for name, value in ratios.items()]))
+    return families
 
-    # Parse time window
-    year, month, start_date, end_date = parse_dates_from_query(user_input)
 
-    # Load and filter data
-    df = load_txt_files(year, month)
-    df_filtered = filter_by_date(df, start_date, end_date)
+register_collector(stats_metrics)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: request and stage latency histograms, row counts, cache and pool gauges."""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.post("/profiles/vertical")
+async def vertical_profiles(req: VerticalProfileRequest):
+    """Depth profiles of the selected floats/profiles, binned or downsampled server-side so
+    the payload stays bounded whatever the raw sample count.
+    """
+    if not req.profile_ids and not req.float_ids:
+        raise HTTPException(status_code=400, detail="Provide profile_ids or float_ids")
+    levels = sorted(req.levels) if req.levels else STANDARD_PRESSURE_LEVELS
+    profiles, truncated = await db_pool.run_async(
+        query_vertical_profiles, req.year, req.profile_ids, req.float_ids, req.start_date, req.end_date,
+        req.mode, req.points, tuple(dict.fromkeys(req.variables)), levels, MAX_VERTICAL_PROFILES,
+    )
+    payload = {"mode": req.mode, "profiles": profiles, "truncated": truncated}
+    return Response(content=orjson.dumps(payload), media_type="application/json")
+
+
+def naive_utc(when: datetime) -> datetime:
+    """Timezone-aware datetimes as naive UTC, matching the DB and index timestamps."""
+    return when.astimezone(timezone.utc).replace(tzinfo=None) if when.tzinfo else when
+
+
+def split_batch_results(columns: ProfileColumns, windows, nearest, conditions):
+    """Per-point slices of the batch fetch: the rows of the point's floats within its window."""
+    float_col = columns.columns["float_id"]
+    times = columns.columns["profile_datetime"]
+    results = []
+    for (start, end), ids in zip(windows, nearest):
+        wanted = [int(fid) for fid in ids if str(fid).isdigit()]
+        mask = np.isin(float_col, wanted) & (times >= np.datetime64(start)) & (times <= np.datetime64(end))
+        results.append(columns.take(np.flatnonzero(mask)).visualization_records(conditions))
+    return results
+
+
+@app.post("/profiles/nearest:batch")
+async def nearest_batch(req: NearestBatchRequest):
+    """Nearest floats and their profiles for many points (a ship track, a station grid).
+    Points sharing a date window are searched with one index call; the floats of every
+    point are deduplicated and fetched with one query per yearly partition. Results come
+    back in input order.
+    """
+    windows = [(naive_utc(p.start_date), naive_utc(p.end_date)) for p in req.points]
+    if any(end < start for start, end in windows):
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    by_window = {}
+    for i, window in enumerate(windows):
+        by_window.setdefault(window, []).append(i)
+
+    async def search_window(window, positions):
+        index = await asyncio.to_thread(get_range_index, *window)
+        lats = [req.points[i].latitude for i in positions]
+        lons = [req.points[i].longitude for i in positions]
+        return positions, await asyncio.to_thread(
+            search_range_batch, index, *window, lats, lons, req.k, req.radius_km,
+        )
+
+    nearest = [[] for _ in req.points]
+    for positions, found in await asyncio.gather(*(search_window(w, pos) for w, pos in by_window.items())):
+        for i, ids in zip(positions, found):
+            nearest[i] = ids
+
+    float_ids = list(dict.fromkeys(fid for ids in nearest for fid in ids))
+    columns = await fetch_profile_columns_range_async(
+        float_ids, min(start for start, _ in windows), max(end for _, end in windows),
+    )
+    conditions = list(dict.fromkeys(req.conditions))
+    profiles = await asyncio.to_thread(split_batch_results, columns, windows, nearest, conditions)
+    results = [
+        {
+            "latitude": point.latitude,
+            "longitude": point.longitude,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "float_ids": [str(fid) for fid in ids],
+            "profiles": point_profiles,
+        }
+        for point, (start, end), ids, point_profiles in zip(req.points, windows, nearest, profiles)
+    ]
+    logger.info(f"Batch of {len(req.points)} points: {len(by_window)} windows, {len(float_ids)} distinct floats, "
+                f"{len(columns)} profiles")
+    return Response(content=orjson.dumps({"results": results, "float_count": len(float_ids)}),
+                    media_type="application/json")
+
+
+def region_query(
+    lat_min: float = Query(ge=-90, le=90),
+    lat_max: float = Query(ge=-90, le=90),
+    lon_min: float = Query(ge=-180, le=180),  # lon_min > lon_max crosses the antimeridian
+    lon_max: float = Query(ge=-180, le=180),
+):
+    return lat_min, lat_max, lon_min, lon_max
+
+
+ClimateVariable = Literal["temperature", "salinity"]
+
+
+async def climatology_response(method, *args):
+    if not climatology_cube.available():
+        raise HTTPException(status_code=503, detail="Climatology cube has not been built")
+    result = await asyncio.to_thread(method, *args)
+    return Response(content=orjson.dumps(result), media_type="application/json")
+
+
+@app.get("/climatology/region")
+async def climatology_region(bbox: tuple = Depends(region_query), variable: ClimateVariable = "temperature",
+                             month: Optional[int] = Query(None, ge=1, le=12), year: Optional[int] = None):
+    """Mean profile over a box on the standard levels (climatology unless `year` is given)."""
+    return await climatology_response(climatology_cube.region_mean, variable, bbox, month, year)
+
+
+@app.get("/climatology/timeseries")
+async def climatology_timeseries(bbox: tuple = Depends(region_query), variable: ClimateVariable = "temperature",
+                                 pressure: float = Query(10, ge=0)):
+    """Monthly box means at the standard level nearest `pressure`, across the cube's years."""
+    return await climatology_response(climatology_cube.time_series, variable, bbox, pressure)
+
+
+@app.get("/climatology/anomaly")
+async def climatology_anomaly(year: int, month: int = Query(ge=1, le=12), bbox: tuple = Depends(region_query),
+                              variable: ClimateVariable = "temperature"):
+    """Box mean profile of one year-month against the climatology of that month."""
+    return await climatology_response(climatology_cube.anomaly, variable, bbox, year, month)
+
+
+# Structured, LLM-free endpoints for programmatic clients. Responses carry an ETag derived
+# from the request and the data version, so repeats revalidate with If-None-Match (304)
+# without touching the index or the DB, and can be served by caches for STRUCTURED_MAX_AGE.
+STRUCTURED_MAX_AGE = int(os.getenv("STRUCTURED_MAX_AGE", "300"))
+
+Condition = Literal["pressure", "temperature", "salinity"]
+
+
+def structured_window(start_date: datetime, end_date: datetime):
+    start_date, end_date = naive_utc(start_date), naive_utc(end_date)
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    return start_date, end_date
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+async def structured_response(request: Request, start_date, end_date, build):
+    """JSON of `await build()` with ETag/Cache-Control headers; 304 (and no work) when the
+    client's If-None-Match already names the current version."""
+    version = await asyncio.to_thread(data_version, start_date, end_date)
+    key = repr((request.url.path, sorted(request.query_params.multi_items()), version))
+    etag = '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={STRUCTURED_MAX_AGE}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    payload = await build()
+    return Response(content=orjson.dumps(payload), media_type="application/json", headers=headers)
+
+
+@app.get("/floats/nearest")
+async def floats_nearest(request: Request, lat: float = Query(ge=-90, le=90), lon: float = Query(ge=-180, le=180),
+                         start_date: datetime = Query(), end_date: datetime = Query(),
+                         k: int = Query(10, ge=1, le=MAX_BATCH_K), radius_km: Optional[float] = Query(None, gt=0),
+                         conditions: list[Condition] = Query([])):
+    """Nearest floats to a point within a window, with their profiles and stats."""
+    start_date, end_date = structured_window(start_date, end_date)
+
+    async def build():
+        index = await asyncio.to_thread(get_range_index, start_date, end_date)
+        nearest_ids, _ = await asyncio.to_thread(
+            search_range, index, start_date, end_date, lat, lon, k=k, radius_km=radius_km,
+        )
+        columns = await fetch_profile_columns_range_async(nearest_ids, start_date, end_date)
+        profiles = await asyncio.to_thread(columns.visualization_records, list(dict.fromkeys(conditions)))
+        return {
+            "latitude": lat, "longitude": lon,
+            "start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+            "float_ids": [str(fid) for fid in nearest_ids],
+            "profiles": profiles,
+        }
+
+    return await structured_response(request, start_date, end_date, build)
+
 
-    # Parse coordinates first
+@app.get("/floats/{float_id}/profiles")
+async def float_profiles(request: Request, float_id: int, start_date: datetime = Query(), end_date: datetime = Query(),
+                         conditions: list[Condition] = Query([])):
+    """Profiles and stats of one float within a window, in time order."""
+    start_date, end_date = structured_window(start_date, end_date)
+
+    async def build():
+        columns = await fetch_profile_columns_range_async([float_id], start_date, end_date)
+        profiles = await asyncio.to_thread(columns.visualization_records, list(dict.fromkeys(conditions)))
+        return {"float_id": str(float_id), "start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+                "profiles": profiles}
+
+    return await structured_response(request, start_date, end_date, build)
+
+
+@app.get("/regions/stats")
+async def region_stats(request: Request, bbox: tuple = Depends(region_query),
+                       start_date: datetime = Query(), end_date: datetime = Query()):
+    """Profile and float counts plus min/max/mean of each condition inside a box and window."""
+    start_date, end_date = structured_window(start_date, end_date)
+
+    async def build():
+        stats = await db_pool.run_async(query_region_stats, bbox, start_date, end_date)
+        return {"start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+                "bbox": dict(zip(("lat_min", "lat_max", "lon_min", "lon_max"), bbox)), **stats}
+
+    return await structured_response(request, start_date, end_date, build)
+
+
+# How often a running /chat/send checks whether the client has gone away
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.25"))
+
+
+async def resolve_location(user_input: str):
+    """Coordinates from the query text, else the first region candidate the geocoder resolves."""
     query_lat, query_lon = parse_coords_from_query(user_input)
+    if query_lat is not None and query_lon is not None:
+        return query_lat, query_lon
+
+    # If no coords, geocode all region candidates at once; the most specific hit wins
+    return await geocode_first_async(extract_region_candidates(user_input))
+
+
+async def run_until_disconnected(request: Request, coro):
+    """Run `coro`, cancelling it if the client disconnects first. Returns None on disconnect."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected; cancelling /chat/send")
+                task.cancel()
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
 
-    # If no coords, try progressively extracting multiple candidates and geocoding them
-    if query_lat is None or query_lon is None:
-        candidates = extract_region_candidates(user_input)
-        for cand in candidates:
-            geo_lat, geo_lon = geocode_region(cand)
-            if geo_lat is not None and geo_lon is not None:
-                query_lat, query_lon = geo_lat, geo_lon
-                break
 
-    json_data = None
-    answer = ""
+def _discard_task(task):
+    """Cancel a background task we no longer need, without leaking its exception."""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def get_session_for(req: ChatRequest, default_id: Optional[str] = None):
+    """Session named by the request; a fresh one (new id) when the client sent none."""
+    return session_store.get(req.session_id or default_id)
+
+
+VISUALIZATION_QUESTION = "Summarize the requested conditions and provide a concise description."
+SUMMARY_QUESTION = "Summarize ocean conditions near these coordinates."
+NO_LOCATION_ANSWER = "Could not determine location. Please provide lat/lon or a valid region."
+
+
+async def retrieve_profiles(user_input: str, session) -> dict:
+    """Steps shared by /chat/send and /chat/ws: time window, location, nearest floats, DB fetch.
+    Returns the resolved context; `lat`/`lon` are None when no location could be determined.
+    """
+    # Parse time window
+    year, month, start_date, end_date = parse_dates_from_query(user_input)
+
+    # Index loading (file I/O + index build) and location resolution (HTTP) are independent
+    requested_window = (start_date, end_date)
+    index_task = asyncio.create_task(asyncio.to_thread(get_range_index, *requested_window))
+    query_lat, query_lon = await resolve_location(user_input)
 
     # Try reusing last known context for follow-ups (e.g., "give me in table")
-    state = get_last_state()
+    radius_km = parse_radius_from_query(user_input)
+    state = get_last_state(session)
     if (query_lat is None or query_lon is None) and state:
         year, month, start_date, end_date = state["year"], state["month"], state["start_date"], state["end_date"]
         query_lat, query_lon = state["lat"], state["lon"]
-
-    if query_lat is not None and query_lon is not None:
-        if state and state["lat"] == query_lat and state["lon"] == query_lon and state["start_date"] == start_date and state["end_date"] == end_date:
-            profiles_data = state["profiles_data"]
-            measurement_summaries = state["measurement_summaries"]
-            nearest_ids = state["nearest_ids"]
+        radius_km = state.get("radius_km") if radius_km is None else radius_km
+
+    ctx = {
+        "year": year, "month": month, "start_date": start_date, "end_date": end_date,
+        "lat": query_lat, "lon": query_lon,
+        "nearest_ids": [], "profiles_data": [], "measurement_summaries": [],
+        "columns": ProfileColumns.from_rows([]),
+    }
+    if query_lat is None or query_lon is None:
+        _discard_task(index_task)
+        return ctx
+
+    if state and (state["lat"], state["lon"], state["start_date"], state["end_date"], state.get("radius_km")) == (
+            query_lat, query_lon, start_date, end_date, radius_km):
+        # Same place, window and radius as this session's previous query
+        _discard_task(index_task)
+        ctx.update(
+            profiles_data=state["profiles_data"],
+            measurement_summaries=state["measurement_summaries"],
+            nearest_ids=state["nearest_ids"],
+            columns=state.get("columns") or ProfileColumns.from_pairs(state["profiles_data"], state["measurement_summaries"]),
+        )
+        return ctx
+
+    # Queries in the same geohash cell, window and data version share one cached fetch
+    lookup_task = asyncio.create_task(
+        asyncio.to_thread(lookup_result, query_lat, query_lon, start_date, end_date, radius_km)
+    )
+    try:
+        # Cached per window; only built on the first query for that window
+        if (start_date, end_date) == requested_window:
+            index = await index_task
         else:
-            nearest_ids, _ = build_and_search(df_filtered, query_lat, query_lon)
-            # Pass start/end date to ensure we only return the requested month window
-            profiles_data, measurement_summaries = fetch_from_postgres(nearest_ids, int(year), start_date, end_date)
-            set_last_state(year, month, start_date, end_date, query_lat, query_lon, nearest_ids, profiles_data, measurement_summaries)
-
-        if is_visualization:
-            # Build both text answer and visualization data, filtered to requested conditions only
-            prompt_text = summarize(
-                profiles_data,
-                measurement_summaries,
-                "Summarize the requested conditions and provide a concise description.",
-                requested_conditions,
-            )
-            answer = conversation_chain.predict(input=prompt_text)
-            json_data = to_json(profiles_data, measurement_summaries, requested_conditions)
-            return ChatResponse(type="visualization", data=json_data, answer=answer)
-
-        if is_tabular:
-            # If user asked for specific conditions, only include those columns
-            json_data = to_table_json(profiles_data, measurement_summaries, requested_conditions)
-            return ChatResponse(type="table", data=json_data)
-
-        if query_summary:
-            prompt_text = summarize(
-                profiles_data,
-                measurement_summaries,
-                "Summarize ocean conditions near these coordinates.",
-                requested_conditions,
-            )
-            answer = conversation_chain.predict(input=prompt_text)
-            return ChatResponse(type="answer", answer=answer)
-
-        # Fallback
-        return ChatResponse(type="answer", answer="No specific request detected.")
+            # Follow-up switched to the previous query's window
+            _discard_task(index_task)
+            index = await asyncio.to_thread(get_range_index, start_date, end_date)
+        # Always searched from the real point; a cached entry is used only if it holds the same floats
+        nearest_ids, _ = await asyncio.to_thread(
+            search_range, index, start_date, end_date, query_lat, query_lon, radius_km=radius_km,
+        )
+    except BaseException:
+        _discard_task(lookup_task)
+        raise
+    cache_key, cached = await lookup_task
+    if cached is not None and {str(fid) for fid in cached[0]} == {str(fid) for fid in nearest_ids}:
+        columns = cached[1]
+        logger.info(f"Profiles for {cache_key} served from the result cache")
     else:
+        if cached is not None:
+            result_cache.record_mismatch()
+        # Pass start/end date to ensure we only return the requested window; a window spanning
+        # several years fans out over the yearly partitions concurrently.
+        # Columnar result straight from the DB rows; the row pair feeds the prompt and follow-ups
+        columns = await fetch_profile_columns_range_async(nearest_ids, start_date, end_date)
+        if cache_key:
+            await asyncio.to_thread(result_cache.set, cache_key, nearest_ids, columns)
+    profiles_data, measurement_summaries = columns.to_pairs()
+    set_last_state(year, month, start_date, end_date, query_lat, query_lon, nearest_ids, profiles_data,
+                   measurement_summaries, session=session, columns=columns, radius_km=radius_km)
+    ctx.update(nearest_ids=nearest_ids, profiles_data=profiles_data, measurement_summaries=measurement_summaries, columns=columns)
+    return ctx
+
+
+def build_data(columns: ProfileColumns, kind: str, conditions, data_format: str):
+    """`data` for a visualization/table response: row objects, or column arrays for the
+    "columns" and "arrow" formats (encoded later by render_chat_response/dumps_columns).
+    """
+    if kind == "visualization":
+        data = columns.visualization_records(conditions) if data_format == "rows" else columns.visualization_columns(conditions)
+    else:
+        data = columns.table_records(conditions) if data_format == "rows" else columns.table_columns(conditions)
+    logger.info(f"Built {kind} data ({len(columns)} profiles, {data_format}) for {', '.join(conditions) if conditions else 'all conditions'}")
+    return data
+
+
+def render_chat_response(payload: dict, data_format: str) -> Response:
+    """Encode a chat payload with orjson (no per-field model revalidation), or as an Arrow IPC
+    stream whose schema metadata carries type/answer/session_id.
+    """
+    if data_format == "arrow" and isinstance(payload.get("data"), dict):
+        metadata = {k: v for k, v in payload.items() if k != "data"}
+        return Response(arrow_ipc(payload["data"], metadata), media_type=ARROW_MEDIA_TYPE)
+    return Response(dumps_columns(payload), media_type="application/json")
+
+
+async def chat_pipeline(req: ChatRequest) -> dict:
+    session = get_session_for(req)
+    user_input = req.message or ""
+    is_visualization = detect_visualization(user_input)
+    is_tabular = detect_tabular(user_input)
+    requested_conditions = detect_requested_conditions(user_input)
+    query_summary = ("summary" in user_input.lower()) or (not is_visualization and not is_tabular)
+
+    ctx = await retrieve_profiles(user_input, session)
+    if ctx["lat"] is None or ctx["lon"] is None:
         # Could not determine a location
-        return ChatResponse(type="answer", answer="Could not determine location. Please provide lat/lon or a valid region.")
\ No newline at end of file
+        return {"type": "answer", "answer": NO_LOCATION_ANSWER, "session_id": session.id}
+    profiles_data, measurement_summaries = ctx["profiles_data"], ctx["measurement_summaries"]
+
+    if is_visualization:
+        # Build both text answer and visualization data, filtered to requested conditions only
+        prompt_text = await asyncio.to_thread(
+            summarize, profiles_data, measurement_summaries, VISUALIZATION_QUESTION, requested_conditions, ctx["nearest_ids"],
+        )
+        answer = await predict_summary_async(prompt_text, requested_conditions, use_cache=not req.fresh, session=session)
+        data = await asyncio.to_thread(build_data, ctx["columns"], "visualization", requested_conditions, req.data_format)
+        return {"type": "visualization", "answer": answer, "data": data, "session_id": session.id, "data_format": req.data_format}
+
+    if is_tabular:
+        # If user asked for specific conditions, only include those columns
+        data = await asyncio.to_thread(build_data, ctx["columns"], "table", requested_conditions, req.data_format)
+        return {"type": "table", "data": data, "session_id": session.id, "data_format": req.data_format}
+
+    if query_summary:
+        prompt_text = await asyncio.to_thread(
+            summarize, profiles_data, measurement_summaries, SUMMARY_QUESTION, requested_conditions, ctx["nearest_ids"],
+        )
+        answer = await predict_summary_async(prompt_text, requested_conditions, use_cache=not req.fresh, session=session)
+        return {"type": "answer", "answer": answer, "session_id": session.id}
+
+    # Fallback
+    return {"type": "answer", "answer": "No specific request detected.", "session_id": session.id}
+
+
+@app.post("/chat/send", response_model=ChatResponse)
+async def chat_send(req: ChatRequest, request: Request):
+    if req.data_format == "arrow" and not ARROW_AVAILABLE:
+        raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server")
+    payload = await run_until_disconnected(request, chat_pipeline(req))
+    if payload is None:
+        # Client is gone; nobody will read this
+        return Response(status_code=499)
+    return await asyncio.to_thread(render_chat_response, payload, req.data_format)
+
+
+async def send_data(websocket: WebSocket, columns: ProfileColumns, kind: str, conditions, data_format: str):
+    """Send a visualization/table message. For "arrow" the JSON message announces the format
+    and the Arrow IPC stream follows as one binary frame.
+    """
+    data = await asyncio.to_thread(build_data, columns, kind, conditions, data_format)
+    if data_format == "arrow":
+        await websocket.send_text(orjson.dumps({"type": kind, "data_format": "arrow"}).decode())
+        await websocket.send_bytes(await asyncio.to_thread(arrow_ipc, data))
+        return
+    message = await asyncio.to_thread(dumps_columns, {"type": kind, "data": data, "data_format": data_format})
+    await websocket.send_text(message.decode())
+
+
+async def stream_chat(websocket: WebSocket, req: ChatRequest, session):
+    """Answer one chat message over the socket, sending each piece as soon as it is ready:
+    `location` → `visualization`/`table` data → `token`* → `done` (or a single `answer`).
+    """
+    user_input = req.message or ""
+    is_visualization = detect_visualization(user_input)
+    is_tabular = detect_tabular(user_input)
+    requested_conditions = detect_requested_conditions(user_input)
+    query_summary = ("summary" in user_input.lower()) or (not is_visualization and not is_tabular)
+
+    ctx = await retrieve_profiles(user_input, session)
+    if ctx["lat"] is None or ctx["lon"] is None:
+        await websocket.send_json({"type": "answer", "answer": NO_LOCATION_ANSWER, "session_id": session.id})
+        return
+    await websocket.send_json({
+        "type": "location",
+        "session_id": session.id,
+        "latitude": ctx["lat"],
+        "longitude": ctx["lon"],
+        "start_date": ctx["start_date"].isoformat(),
+        "end_date": ctx["end_date"].isoformat(),
+        "float_ids": [str(fid) for fid in ctx["nearest_ids"]],
+    })
+    profiles_data, measurement_summaries = ctx["profiles_data"], ctx["measurement_summaries"]
+
+    if is_visualization:
+        # Data first: the chart can render while the summary is being generated
+        await send_data(websocket, ctx["columns"], "visualization", requested_conditions, req.data_format)
+        question = VISUALIZATION_QUESTION
+    elif is_tabular:
+        await send_data(websocket, ctx["columns"], "table", requested_conditions, req.data_format)
+        await websocket.send_json({"type": "done"})
+        return
+    elif query_summary:
+        question = SUMMARY_QUESTION
+    else:
+        await websocket.send_json({"type": "answer", "answer": "No specific request detected.", "session_id": session.id})
+        return
+
+    prompt_text = await asyncio.to_thread(
+        summarize, profiles_data, measurement_summaries, question, requested_conditions, ctx["nearest_ids"],
+    )
+    async for chunk in stream_summary_async(prompt_text, requested_conditions, use_cache=not req.fresh, session=session):
+        await websocket.send_json({"type": "token", "text": chunk})
+    await websocket.send_json({"type": "done"})
+
+
+@app.websocket("/chat/ws")
+async def chat_ws(websocket: WebSocket):
+    """Progressive chat: send {"message": "...", "fresh": false} per question on one socket.
+    Messages without a session_id share one session for the lifetime of the socket.
+    """
+    await websocket.accept()
+    socket_session_id = None
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            try:
+                req = ChatRequest(**payload)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "error": str(e)})
+                continue
+            if req.data_format == "arrow" and not ARROW_AVAILABLE:
+                await websocket.send_json({"type": "error", "error": "Arrow output requires pyarrow on the server"})
+                continue
+            session = get_session_for(req, default_id=socket_session_id)
+            socket_session_id = socket_session_id or session.id
+            token, trace = begin_trace("WS /chat/ws")
+            status = "ok"
+            try:
+                await stream_chat(websocket, req, session)
+            except WebSocketDisconnect:
+                status = "disconnected"
+                raise
+            except Exception as e:
+                status = "error"
+                logger.warning(f"/chat/ws request failed: {e}")
+                await websocket.send_json({"type": "error", "error": str(e)})
+            finally:
+                REQUEST_SECONDS.observe(trace.elapsed(), route="/chat/ws", method="WS", status=status)
+                end_trace(token)
+    except WebSocketDisconnect:
+        logger.info("/chat/ws client disconnected")
@@ -0,0 +1,398 @@
+"""End-to-end benchmark of /chat/send on synthetic data, with a fake LLM and geocoder.
+
+Generates synthetic floats (random-walk tracks, one profile every --cycle-days, with
+--samples levels each), loads them through ingest.Ingestor into an isolated schema and
+writes the monthly float-index files. It then replaces the Gemini client and the
+geocoder with deterministic fakes that sleep for --llm-latency / --geocode-latency ms,
+and drives /chat/send in-process (httpx ASGI transport, so the middleware and its
+Server-Timing stages are included) at --concurrency. Reports p50/p95/p99 and throughput
+for the whole request and for every stage.
+
+Usage:
+    python benchmarks/bench_e2e.py [--dsn "dbname=... user=..."] [--floats 200] [--months 6]
+        [--concurrency 8] [--requests 400] [--json out.json] [--baseline base.json]
+    python benchmarks/bench_e2e.py --embedded      # throwaway local Postgres via `pip install pgserver`
+
+Without --dsn (or BENCH_DSN) the DB_CONFIG from final_backend_code is used. The schema
+`bench_e2e` is rebuilt when the dataset parameters change (or with --reseed). With
+--baseline, exits 1 if any p95 grew by more than --max-regression over the baseline run.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+SCHEMA = "bench_e2e"
+FLOAT_ID_BASE = 5900000
+# Synthetic place names the fake geocoder resolves, with their coordinates
+REGIONS = {
+    "bench bay": (12.0, 85.0),
+    "bench gulf": (22.0, 62.0),
+    "bench reef": (-8.0, 72.0),
+    "bench shelf": (2.0, 95.0),
+    "bench trench": (-22.0, 105.0),
+}
+MONTH_NAMES = ("January", "February", "March", "April", "May", "June", "July",
+               "August", "September", "October", "November", "December")
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+
+
+def month_range(start: str, n_months: int):
+    """[(year, month), ...] for n_months from 'YYYY-MM'."""
+    year, month = (int(v) for v in start.split("-"))
+    out = []
+    for _ in range(n_months):
+        out.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return out
+
+
+def synthetic_float(rng, float_id, start, end, cycle_days, samples):
+    """One float as an ingest.read_argo_file()-shaped dict: a random-walk track from a random
+    start in the Indian Ocean, one profile per cycle, `samples` levels per profile."""
+    n_prof = max(1, int((end - start) / np.timedelta64(cycle_days, "D")))
+    when = start + (np.arange(n_prof) * cycle_days * 86_400 + rng.integers(0, 86_400)).astype("timedelta64[s]")
+    lat = np.clip(rng.uniform(-30, 25) + np.cumsum(rng.normal(0, 0.3, n_prof)), -60, 60)
+    lon = rng.uniform(45, 110) + np.cumsum(rng.normal(0, 0.3, n_prof))
+
+    pressure = np.sort(rng.uniform(5, 2000, (n_prof, samples)), axis=1)
+    day_of_year = pd.DatetimeIndex(when).dayofyear.to_numpy()
+    surface = 28 - np.abs(lat) * 0.25 + 1.5 * np.sin(2 * np.pi * day_of_year / 365.25)
+    temperature = 2 + (surface - 2)[:, None] * np.exp(-pressure / 600) + rng.normal(0, 0.2, pressure.shape)
+    salinity = 34.7 + 0.3 * np.exp(-pressure / 300) + rng.normal(0, 0.05, pressure.shape)
+
+    when_index = pd.DatetimeIndex(when)
+    path = f"bench/{float_id}.nc"
+    profiles = pd.DataFrame({
+        "year": when_index.year,
+        "month": when_index.month,
+        "float_id": np.int64(float_id),
+        "file_path": path,
+        "profile_datetime": when.astype("datetime64[us]"),
+        "latitude": lat,
+        "longitude": lon,
+        "depth_min": pressure[:, 0],
+        "depth_max": pressure[:, -1],
+    })
+    measurements = pd.DataFrame({
+        "profile_row": np.repeat(np.arange(n_prof), samples),
+        "pressure": pressure.ravel(),
+        "temperature": temperature.ravel(),
+        "salinity": salinity.ravel(),
+    })
+    return {"file_path": path, "file_size": 0, "file_mtime_ns": 0, "profiles": profiles, "measurements": measurements}
+
+
+def parent_table_ddl():
+    """The parent CREATE TABLE statements of queries.sql (partitions are created on demand)."""
+    with open(os.path.join(BACKEND_DIR, "queries.sql")) as fh:
+        sql = "\n".join(line.split("--", 1)[0] for line in fh)
+    return [stmt.strip() for stmt in sql.split(";") if stmt.strip().upper().startswith("CREATE TABLE PROFILE")
+            or stmt.strip().upper().startswith("CREATE TABLE MEASUREMENTS")]
+
+
+def seed(conn, index_dir, params):
+    """Rebuild the bench schema and index files from `params`; returns (profiles, measurements)."""
+    from ingest import Ingestor, write_month_index
+
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+        for stmt in parent_table_ddl():
+            cur.execute(stmt)
+    conn.commit()
+
+    months = month_range(params["start"], params["months"])
+    start = np.datetime64(datetime(*months[0], 1), "s")
+    last_year, last_month = month_range(params["start"], params["months"] + 1)[-1]
+    end = np.datetime64(datetime(last_year, last_month, 1), "s")
+
+    rng = np.random.default_rng(params["seed"])
+    ingestor = Ingestor(conn, batch_profiles=20000)
+    for i in range(params["floats"]):
+        ingestor.add(synthetic_float(rng, FLOAT_ID_BASE + i, start, end, params["cycle_days"], params["samples"]))
+    ingestor.flush()
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE")
+    conn.commit()
+    for year, month in sorted(ingestor.touched_months):
+        write_month_index(conn, index_dir, year, month)
+    return ingestor.profiles, ingestor.measurements
+
+
+# ---------------------------------------------------------------------------
+# Fakes
+
+
+class FakeLLM:
+    """Stands in for GoogleGenerativeAI: sleeps `latency` seconds and returns a canned answer
+    derived from the prompt length, so runs are deterministic."""
+
+    def __init__(self, latency: float, chunks: int = 8):
+        self.latency = latency
+        self.chunks = chunks
+
+    def _answer(self, prompt_value):
+        text = prompt_value.to_string()
+        return f"Synthetic summary of a {len(text)}-character prompt. " * 4
+
+    def invoke(self, prompt_value):
+        time.sleep(self.latency)
+        return self._answer(prompt_value)
+
+    async def ainvoke(self, prompt_value):
+        await asyncio.sleep(self.latency)
+        return self._answer(prompt_value)
+
+    async def astream(self, prompt_value):
+        answer = self._answer(prompt_value)
+        step = -(-len(answer) // self.chunks)
+        for i in range(0, len(answer), step):
+            await asyncio.sleep(self.latency / self.chunks)
+            yield answer[i:i + step]
+
+
+def fake_geocoder(latency: float):
+    def lookup(query):
+        lower = (query or "").lower()
+        for name, coords in REGIONS.items():
+            if name in lower:
+                return coords
+        return None, None
+
+    def geocode_region(query):
+        time.sleep(latency)
+        return lookup(query)
+
+    async def geocode_region_async(query):
+        await asyncio.sleep(latency)
+        return lookup(query)
+
+    return geocode_region, geocode_region_async
+
+
+def install_fakes(backend, llm_latency, geocode_latency):
+    """Replace the LLM client and the geocoder's HTTP lookups; request coalescing and
+    timing around them stay in place."""
+    backend.llm = FakeLLM(llm_latency)
+    backend._geocode_region, backend._geocode_region_async = fake_geocoder(geocode_latency)
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+
+
+def make_queries(n, months, seed_value=0):
+    """A deterministic mix of summary, chart and table questions over regions, coordinates,
+    single months and month ranges."""
+    rng = random.Random(seed_value)
+    queries = []
+    for _ in range(n):
+        place = rng.choice(list(REGIONS))
+        if rng.random() < 0.4:
+            lat, lon = REGIONS[place]
+            place = f"lat {lat + rng.uniform(-3, 3):.2f} lon {lon + rng.uniform(-3, 3):.2f}"
+        i = rng.randrange(len(months))
+        year, month = months[i]
+        if rng.random() < 0.3 and i + 1 < len(months):
+            j = min(len(months) - 1, i + rng.randint(1, 3))
+            when = f"{MONTH_NAMES[month - 1]} {year} to {MONTH_NAMES[months[j][1] - 1]} {months[j][0]}"
+        else:
+            when = f"{MONTH_NAMES[month - 1]} {year}"
+        kind = rng.random()
+        if kind < 0.5:
+            queries.append(f"Give me a summary of ocean conditions near {place} in {when}")
+        elif kind < 0.8:
+            queries.append(f"Show a chart of temperature near {place} in {when}")
+        else:
+            queries.append(f"Show salinity in a table near {place} in {when}")
+    return queries
+
+
+def parse_server_timing(header):
+    """{stage: ms} from a Server-Timing header."""
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, rest = part.strip().partition(";dur=")
+        if name and rest:
+            stages[name] = float(rest)
+    return stages
+
+
+async def drive(app, queries, concurrency, fresh):
+    import httpx
+
+    results = []
+    pending = list(reversed(queries))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def worker():
+            while pending:
+                message = pending.pop()
+                t0 = time.perf_counter()
+                resp = await client.post("/chat/send", json={"message": message, "fresh": fresh})
+                elapsed = (time.perf_counter() - t0) * 1000
+                results.append({
+                    "status": resp.status_code,
+                    "ms": elapsed,
+                    "stages": parse_server_timing(resp.headers.get("server-timing")),
+                })
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+    return results, wall
+
+
+def summarize_results(results, wall):
+    """{name: {count, p50, p95, p99, per_s}} for the request and for each stage."""
+    series = {"request": [r["ms"] for r in results]}
+    for r in results:
+        for name, ms in r["stages"].items():
+            if name != "total":
+                series.setdefault(name, []).append(ms)
+    report = {}
+    for name, values in series.items():
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        report[name] = {"count": len(values), "p50": round(float(p50), 3), "p95": round(float(p95), 3),
+                        "p99": round(float(p99), 3), "per_s": round(len(values) / wall, 2)}
+    return report
+
+
+def compare(report, baseline, max_regression, min_ms=5.0, min_count=20):
+    """Lines describing every p95 that grew by more than max_regression (and min_ms).
+    Stages seen fewer than min_count times (one-off index builds) are too noisy to compare.
+    """
+    regressions = []
+    for name, row in report.items():
+        base = baseline.get(name)
+        if not base or min(row["count"], base["count"]) < min_count:
+            continue
+        if row["p95"] > base["p95"] * (1 + max_regression) and row["p95"] - base["p95"] > min_ms:
+            regressions.append(f"{name}: p95 {base['p95']:.1f} → {row['p95']:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DSN"))
+    parser.add_argument("--embedded", action="store_true", help="run a throwaway Postgres with pgserver")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "floatchat_bench"),
+                        help="index files, caches and the embedded database")
+    parser.add_argument("--floats", type=int, default=200)
+    parser.add_argument("--start", default="2019-01", help="first month (YYYY-MM)")
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--cycle-days", type=int, default=10, help="days between a float's profiles")
+    parser.add_argument("--samples", type=int, default=100, help="measurements per profile")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reseed", action="store_true", help="rebuild the dataset even if unchanged")
+    parser.add_argument("--llm-latency", type=float, default=300, help="fake LLM latency (ms)")
+    parser.add_argument("--geocode-latency", type=float, default=50, help="fake geocoder latency (ms)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent first and not measured")
+    parser.add_argument("--llm-cache", action="store_true", help="allow LLM cache hits (default: fresh=true)")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="serve repeated cells from the query-result cache (emptied at start)")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 growth (fraction)")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    index_dir = os.path.join(args.workdir, "index")
+    # Settings read at import time
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("GOOGLE_API_KEY", "bench")
+    os.environ["CACHE_DIR"] = os.path.join(args.workdir, "cache")
+    os.environ["INDEX_CACHE_DIR"] = os.path.join(index_dir, ".index_cache")
+    os.environ["RESULT_CACHE_ENABLED"] = "1" if args.result_cache else "0"
+    for suffix in ("", "-wal", "-shm"):
+        path = os.path.join(args.workdir, "cache", "results.sqlite3" + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+
+    import final_backend_code as backend
+    import api_server
+    from db import ConnectionPool
+
+    if args.embedded:
+        try:
+            import pgserver
+        except ImportError:
+            parser.error("--embedded needs the pgserver package (pip install pgserver)")
+        base_config = {"dsn": pgserver.get_server(os.path.join(args.workdir, "pgdata")).get_uri()}
+    else:
+        base_config = {"dsn": args.dsn} if args.dsn else dict(backend.DB_CONFIG)
+
+    params = {k: getattr(args, k) for k in ("floats", "start", "months", "cycle_days", "samples", "seed")}
+    params_path = os.path.join(args.workdir, "dataset.json")
+    previous = json.load(open(params_path)) if os.path.exists(params_path) else None
+    if args.reseed or previous != {**params, "dsn": base_config}:
+        conn = psycopg2.connect(**base_config)
+        print(f"Seeding {args.floats} floats x {args.months} months into schema '{SCHEMA}'...")
+        t0 = time.perf_counter()
+        n_profiles, n_measurements = seed(conn, index_dir, params)
+        conn.close()
+        print(f"Loaded {n_profiles} profiles, {n_measurements} measurements in {time.perf_counter() - t0:.1f}s")
+        with open(params_path, "w") as fh:
+            json.dump({**params, "dsn": base_config}, fh)
+
+    backend.data_root = index_dir
+    backend.DB_CONFIG = {**base_config, "options": f"-c search_path={SCHEMA}"}
+    backend.db_pool = api_server.db_pool = ConnectionPool(backend.DB_CONFIG)
+    install_fakes(backend, args.llm_latency / 1000, args.geocode_latency / 1000)
+
+    months = month_range(args.start, args.months)
+    queries = make_queries(args.warmup + args.requests, months, args.seed)
+    fresh = not args.llm_cache
+    if args.warmup:
+        asyncio.run(drive(api_server.app, queries[:args.warmup], args.concurrency, fresh))
+    results, wall = asyncio.run(drive(api_server.app, queries[args.warmup:], args.concurrency, fresh))
+    backend.db_pool.close()
+
+    errors = sum(1 for r in results if r["status"] != 200)
+    report = summarize_results(results, wall)
+    print(f"\n{len(results)} requests at concurrency {args.concurrency} in {wall:.1f}s "
+          f"({len(results) / wall:.1f} req/s, {errors} errors); LLM {args.llm_latency:g} ms, "
+          f"geocoder {args.geocode_latency:g} ms")
+    print(f"{'stage':<24} {'count':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'per s':>7}")
+    for name, row in sorted(report.items(), key=lambda kv: (kv[0] != "request", -kv[1]["p95"])):
+        print(f"{name:<24} {row['count']:>6} {row['p50']:>9.1f} {row['p95']:>9.1f} {row['p99']:>9.1f} {row['per_s']:>7.1f}")
+    shared = {f.name: f.stats()["shared"] for f in backend.SINGLE_FLIGHTS if f.stats()["shared"]}
+    if shared:
+        print("coalesced: " + ", ".join(f"{name} {count}" for name, count in shared.items()))
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump({"params": params, "concurrency": args.concurrency, "errors": errors, "stages": report}, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(report, json.load(fh)["stages"], args.max_regression)
+        if regressions:
+            print("\nRegressions over baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nNo p95 regressions over baseline")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Benchmark fetch_from_postgres: per-profile N+1 queries vs. the single set-based aggregate
+vs. reading the precomputed profile_stats table.
+
+Seeds synthetic profiles/measurements into an isolated schema of the configured database
+and reports median latency as the number of matching profiles grows.
+
+Usage:
+    python benchmarks/bench_fetch.py [--dsn "dbname=... user=..."] [--counts 10,100,500] [--repeat 5]
+
+Without --dsn (or BENCH_DSN) the DB_CONFIG from final_backend_code is used. The schema
+`bench_fetch` is dropped and recreated on every run.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+import final_backend_code  # noqa: E402
+from db import ConnectionPool  # noqa: E402
+from profile_stats import refresh_profile_stats  # noqa: E402
+from schema import ensure_partition_indexes  # noqa: E402
+
+SCHEMA = "bench_fetch"
+YEAR = 2019
+PROFILES_PER_FLOAT = 10
+
+
+def fetch_n_plus_one(float_ids, year, start_date=None, end_date=None):
+    """The original implementation: one profile query plus one aggregate query per profile."""
+    conn = psycopg2.connect(**final_backend_code.DB_CONFIG)
+    cur = conn.cursor()
+    float_ids = [int(fid) for fid in float_ids if str(fid).isdigit()]
+    where_time = " AND profile_datetime BETWEEN %s AND %s" if (start_date and end_date) else ""
+    params = [float_ids]
+    if start_date and end_date:
+        params.extend([start_date, end_date])
+    cur.execute(f"""
+        SELECT profile_id, year, month, float_id, latitude, longitude, depth_min, depth_max, file_path, profile_datetime
+        FROM profiles_{year}
+        WHERE float_id = ANY(%s){where_time}
+        ORDER BY profile_datetime
+    """, params)
+    profiles_data = cur.fetchall()
+    measurement_summaries = []
+    for profile in profiles_data:
+        cur.execute("""
+            SELECT MIN(pressure), MAX(pressure), AVG(pressure),
+                   MIN(temperature), MAX(temperature), AVG(temperature),
+                   MIN(salinity), MAX(salinity), AVG(salinity)
+            FROM measurements
+            WHERE profile_id = %s
+        """, (profile[0],))
+        measurement_summaries.append(cur.fetchone())
+    cur.close()
+    conn.close()
+    return profiles_data, measurement_summaries
+
+
+def seed(conn, n_floats, samples_per_profile, seed_value=0, with_indexes=True):
+    rng = np.random.default_rng(seed_value)
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"SET search_path TO {SCHEMA}")
+    cur.execute("""
+        CREATE TABLE profiles (
+            profile_id SERIAL, year INT NOT NULL, month INT NOT NULL, float_id BIGINT, file_path TEXT,
+            profile_datetime TIMESTAMP, latitude DOUBLE PRECISION, longitude DOUBLE PRECISION,
+            depth_min DOUBLE PRECISION, depth_max DOUBLE PRECISION,
+            PRIMARY KEY (profile_id, year)
+        ) PARTITION BY LIST (year)
+    """)
+    cur.execute("""
+        CREATE TABLE measurements (
+            measurement_id SERIAL, profile_id INT NOT NULL, year INT NOT NULL,
+            pressure DOUBLE PRECISION, temperature DOUBLE PRECISION, salinity DOUBLE PRECISION,
+            PRIMARY KEY (measurement_id, year)
+        ) PARTITION BY LIST (year)
+    """)
+    cur.execute("""
+        CREATE TABLE profile_stats (
+            profile_id INT NOT NULL, year INT NOT NULL,
+            measurement_count INT NOT NULL, pressure_count INT NOT NULL,
+            temperature_count INT NOT NULL, salinity_count INT NOT NULL,
+            pressure_min DOUBLE PRECISION, pressure_max DOUBLE PRECISION, pressure_avg DOUBLE PRECISION,
+            temperature_min DOUBLE PRECISION, temperature_max DOUBLE PRECISION, temperature_avg DOUBLE PRECISION,
+            salinity_min DOUBLE PRECISION, salinity_max DOUBLE PRECISION, salinity_avg DOUBLE PRECISION,
+            updated_at TIMESTAMP NOT NULL DEFAULT now(),
+            PRIMARY KEY (profile_id, year)
+        ) PARTITION BY LIST (year)
+    """)
+    for parent in ("profiles", "measurements", "profile_stats"):
+        cur.execute(f"CREATE TABLE {parent}_{YEAR} PARTITION OF {parent} FOR VALUES IN ({YEAR})")
+
+    start = datetime(YEAR, 1, 1)
+    profile_rows = []
+    for f in range(n_floats):
+        for p in range(PROFILES_PER_FLOAT):
+            profile_rows.append((
+                YEAR, 1, 1900000 + f, f"bench/{f}.nc", start + timedelta(days=3 * p, hours=f % 24),
+                float(rng.uniform(-30, 30)), float(rng.uniform(40, 100)), 5.0, 2000.0,
+            ))
+    profile_ids = execute_values(cur, """
+        INSERT INTO profiles (year, month, float_id, file_path, profile_datetime, latitude, longitude, depth_min, depth_max)
+        VALUES %s RETURNING profile_id
+    """, profile_rows, page_size=1000, fetch=True)
+
+    measurement_rows = []
+    for (pid,) in profile_ids:
+        pressure = np.sort(rng.uniform(5, 2000, samples_per_profile))
+        temperature = 28 - pressure / 80 + rng.normal(0, 0.3, samples_per_profile)
+        salinity = 35 + rng.normal(0, 0.1, samples_per_profile)
+        measurement_rows.extend(zip([pid] * samples_per_profile, [YEAR] * samples_per_profile,
+                                    pressure.tolist(), temperature.tolist(), salinity.tolist()))
+    execute_values(cur, """
+        INSERT INTO measurements (profile_id, year, pressure, temperature, salinity) VALUES %s
+    """, measurement_rows, page_size=5000)
+    conn.commit()
+    if with_indexes:
+        ensure_partition_indexes(conn, YEAR)
+    refresh_profile_stats(conn, YEAR)
+    cur.execute("ANALYZE")
+    conn.commit()
+    cur.close()
+
+
+def time_call(fn, float_ids, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(float_ids, YEAR, datetime(YEAR, 1, 1), datetime(YEAR, 12, 31, 23, 59, 59))
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DSN"))
+    parser.add_argument("--counts", default="10,50,100,250,500,1000",
+                        help="comma-separated numbers of matching profiles to fetch")
+    parser.add_argument("--samples", type=int, default=100, help="measurements per profile")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--without-indexes", action="store_true",
+                        help="skip the partition indexes from schema.py (to measure their effect)")
+    args = parser.parse_args()
+
+    counts = sorted(int(c) for c in args.counts.split(","))
+    base_config = {"dsn": args.dsn} if args.dsn else dict(final_backend_code.DB_CONFIG)
+    n_floats = max(1, -(-counts[-1] // PROFILES_PER_FLOAT))
+
+    conn = psycopg2.connect(**base_config)
+    print(f"Seeding {n_floats * PROFILES_PER_FLOAT} profiles x {args.samples} measurements into schema '{SCHEMA}'...")
+    seed(conn, n_floats, args.samples, with_indexes=not args.without_indexes)
+    conn.close()
+
+    # Route both implementations to the benchmark schema. The old path connects per call,
+    # the current one borrows from a (warm) pool, as it does in the API server.
+    final_backend_code.DB_CONFIG = {**base_config, "options": f"-c search_path={SCHEMA}"}
+    final_backend_code.db_pool = ConnectionPool(final_backend_code.DB_CONFIG, minconn=1, maxconn=2)
+
+    print(f"{'profiles':>9} {'n+1 (ms)':>10} {'aggregate (ms)':>15} {'profile_stats (ms)':>19} {'speedup':>8}")
+    for count in counts:
+        float_ids = [str(1900000 + f) for f in range(max(1, count // PROFILES_PER_FLOAT))]
+        old_ms = time_call(fetch_n_plus_one, float_ids, args.repeat)
+        final_backend_code.USE_PROFILE_STATS = False
+        agg_ms = time_call(final_backend_code.fetch_from_postgres, float_ids, args.repeat)
+        final_backend_code.USE_PROFILE_STATS = True
+        stats_ms = time_call(final_backend_code.fetch_from_postgres, float_ids, args.repeat)
+        print(f"{len(float_ids) * PROFILES_PER_FLOAT:>9} {old_ms:>10.1f} {agg_ms:>15.1f} {stats_ms:>19.1f} "
+              f"{old_ms / stats_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
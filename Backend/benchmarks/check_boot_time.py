@@ -0,0 +1,119 @@
+"""Check that API workers start fast: import time budget and lazily imported dependencies.
+
+Imports final_backend_code and then api_server in fresh interpreters (--runs times) and
+fails when the median import time of either exceeds its budget, or when any of the heavy
+dependencies that are meant to load on first use (LangChain, Google GenAI, FAISS,
+pandas, pyarrow, httpx) is already imported once api_server is.
+
+Usage:
+    python benchmarks/check_boot_time.py [--runs 5] [--backend-budget-ms 400] [--api-budget-ms 1000]
+    python benchmarks/check_boot_time.py --importtime     # also list the slowest imports
+
+Exits 1 when a budget is exceeded or a lazy dependency was imported eagerly. The same
+check runs under pytest as tests/test_boot_time.py.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median import time allowed, in ms: `import final_backend_code`, and that plus `import api_server`
+BACKEND_IMPORT_BUDGET_MS = float(os.getenv("BACKEND_IMPORT_BUDGET_MS", "400"))
+API_IMPORT_BUDGET_MS = float(os.getenv("API_IMPORT_BUDGET_MS", "1000"))
+
+# Must not be imported by `import api_server`; they load on first use or in warm_up()
+LAZY_MODULES = ("langchain", "langchain_core", "langchain_google_genai", "faiss", "pandas", "pyarrow", "httpx")
+
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import final_backend_code
+backend = time.perf_counter()
+import api_server
+api = time.perf_counter()
+print(json.dumps({
+    "backend_ms": (backend - started) * 1000,
+    "api_ms": (api - started) * 1000,
+    "loaded": [m for m in LAZY if m in sys.modules],
+}))
+"""
+
+
+def probe_env():
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "boot-check")
+    env["LOG_LEVEL"] = "OFF"
+    return env
+
+
+def run_probe():
+    code = f"LAZY = {LAZY_MODULES!r}\n{PROBE}"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=probe_env(),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(runs=5):
+    """Median import times over `runs` fresh interpreters and the lazy modules any run loaded."""
+    run_probe()  # first run warms the filesystem and bytecode caches
+    results = [run_probe() for _ in range(runs)]
+    return {
+        "backend_ms": statistics.median(r["backend_ms"] for r in results),
+        "api_ms": statistics.median(r["api_ms"] for r in results),
+        "loaded": sorted({m for r in results for m in r["loaded"]}),
+    }
+
+
+def slowest_imports(limit):
+    """(cumulative ms, module) of the slowest imports under `import api_server`."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import api_server"], cwd=BACKEND_DIR,
+                         env=probe_env(), capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend-budget-ms", type=float, default=BACKEND_IMPORT_BUDGET_MS,
+                        help="median `import final_backend_code` time allowed")
+    parser.add_argument("--api-budget-ms", type=float, default=API_IMPORT_BUDGET_MS,
+                        help="median `import final_backend_code, api_server` time allowed")
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports")
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    backend_ms, api_ms, loaded = result["backend_ms"], result["api_ms"], result["loaded"]
+
+    failures = []
+    print(f"import final_backend_code: {backend_ms:7.1f} ms (budget {args.backend_budget_ms:g})")
+    print(f"import api_server (total): {api_ms:7.1f} ms (budget {args.api_budget_ms:g})")
+    if backend_ms > args.backend_budget_ms:
+        failures.append("final_backend_code import over budget")
+    if api_ms > args.api_budget_ms:
+        failures.append("api_server import over budget")
+    if loaded:
+        failures.append(f"imported eagerly: {', '.join(loaded)}")
+
+    if args.importtime or failures:
+        print("\nslowest imports (cumulative ms):")
+        for ms, name in slowest_imports(15):
+            print(f"  {ms:8.1f}  {name}")
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Gridded climatology cube: lat/lon cell × month × standard pressure level means of
+temperature and salinity, built from the measurements tables.
+
+    python climatology.py --all --out /data/climatology
+    python climatology.py --year 2024 --out /data/climatology
+
+Each profile is first averaged onto the standard levels (so densely sampled profiles do
+not dominate), then summed per cell in Postgres. The cube is stored as one directory per
+year plus "all" (every year summed), each holding tiles of TILE × TILE cells:
+
+    {out}/meta.json
+    {out}/{year|all}/tile_{row}_{col}.npy   float32 (4, 12, levels, TILE, TILE)
+
+with fields temperature sum/count and salinity sum/count. Only tiles with data are
+written. Queries memory-map the tiles and read only the cells a region overlaps;
+region means weight each cell's mean by cos(latitude).
+"""
+import os
+import sys
+import json
+import math
+import shutil
+import argparse
+
+import numpy as np
+import psycopg2
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.append(CURRENT_DIR)
+
+from schema import list_partition_years  # noqa: E402
+from vertical_profiles import STANDARD_PRESSURE_LEVELS, level_edges  # noqa: E402
+from columnar import to_list  # noqa: E402
+from telemetry import configure_logging, get_logger  # noqa: E402
+
+
+logger = get_logger("climatology")
+
+
+VARIABLES = ("temperature", "salinity")
+# Field positions in a tile: (sum, count) per variable
+FIELDS = {"temperature": (0, 1), "salinity": (2, 3)}
+CLIMATOLOGY_PERIOD = "all"
+DEFAULT_RESOLUTION = 1.0
+DEFAULT_TILE = 10
+
+
+def grid_shape(resolution):
+    return int(round(180 / resolution)), int(round(360 / resolution))
+
+
+def build_aggregate_sql(year):
+    return f"""
+        WITH binned AS (
+            SELECT p.profile_id, p.month, p.latitude, p.longitude,
+                   width_bucket(m.pressure, %(edges)s::double precision[]) AS level,
+                   AVG(m.temperature) AS temperature,
+                   AVG(m.salinity) AS salinity
+            FROM profiles_{year} p
+            JOIN measurements_{year} m ON m.profile_id = p.profile_id
+            WHERE p.latitude BETWEEN -90 AND 90 AND p.longitude IS NOT NULL AND p.month IS NOT NULL
+              AND m.pressure IS NOT NULL AND m.pressure <= %(max_pressure)s
+            GROUP BY p.profile_id, p.month, p.latitude, p.longitude, level
+        )
+        SELECT month, level,
+               LEAST(floor((latitude + 90) / %(res)s)::int, %(nlat)s - 1) AS lat_i,
+               LEAST(floor(mod(mod(longitude::numeric + 180, 360) + 360, 360) / %(res)s)::int, %(nlon)s - 1) AS lon_i,
+               SUM(temperature), COUNT(temperature), SUM(salinity), COUNT(salinity)
+        FROM binned
+        GROUP BY 1, 2, 3, 4
+    """
+
+
+def aggregate_year(conn, year, resolution=DEFAULT_RESOLUTION, levels=STANDARD_PRESSURE_LEVELS):
+    """Per (month, level, lat cell, lon cell) sums and counts of the profile-level means,
+    as an (n, 8) float64 array."""
+    nlat, nlon = grid_shape(resolution)
+    # Samples deeper than half a gap below the last level are left out
+    max_pressure = levels[-1] + (levels[-1] - levels[-2]) / 2
+    with conn.cursor() as cur:
+        cur.execute(build_aggregate_sql(int(year)), {
+            "edges": level_edges(levels),
+            "max_pressure": max_pressure,
+            "res": resolution,
+            "nlat": nlat,
+            "nlon": nlon,
+        })
+        rows = cur.fetchall()
+    return np.array(rows, dtype=np.float64).reshape(-1, 8)
+
+
+def scatter_tiles(cells, n_levels, tile=DEFAULT_TILE):
+    """Aggregated cell rows → {(row, col): float32 (4, 12, n_levels, tile, tile)}."""
+    if not len(cells):
+        return {}
+    month = cells[:, 0].astype(np.int64) - 1
+    level = cells[:, 1].astype(np.int64)
+    lat_i = cells[:, 2].astype(np.int64)
+    lon_i = cells[:, 3].astype(np.int64)
+    keys = (lat_i // tile) * 10_000 + lon_i // tile
+    order = np.argsort(keys, kind="stable")
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    tiles = {}
+    for key, idx in zip(unique_keys.tolist(), np.split(order, starts[1:])):
+        arr = np.zeros((4, 12, n_levels, tile, tile), dtype=np.float32)
+        for field in range(4):
+            arr[field, month[idx], level[idx], lat_i[idx] % tile, lon_i[idx] % tile] = cells[idx, 4 + field]
+        tiles[divmod(key, 10_000)] = arr
+    return tiles
+
+
+def _write_period(root, period, tiles):
+    """Write a period's tiles to a fresh directory and swap it in, so readers never see a
+    half-written period."""
+    final = os.path.join(root, str(period))
+    tmp = f"{final}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for (row, col), arr in tiles.items():
+        np.save(os.path.join(tmp, f"tile_{row}_{col}.npy"), arr)
+    old = f"{final}.old-{os.getpid()}"
+    if os.path.isdir(final):
+        os.replace(final, old)
+    os.replace(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _read_meta(root):
+    path = os.path.join(root, "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def _write_meta(root, meta):
+    path = os.path.join(root, "meta.json")
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as fh:
+        json.dump(meta, fh, indent=2)
+    os.replace(tmp, path)
+
+
+def build_climatology(root, years):
+    """Sum the tiles of `years` into the "all" period."""
+    totals = {}
+    for year in years:
+        folder = os.path.join(root, str(year))
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.startswith("tile_") and name.endswith(".npy"):
+                arr = np.load(os.path.join(folder, name))
+                totals[name] = arr if name not in totals else totals[name] + arr
+    tiles = {tuple(int(v) for v in name[5:-4].split("_")): arr for name, arr in totals.items()}
+    _write_period(root, CLIMATOLOGY_PERIOD, tiles)
+    return len(tiles)
+
+
+def build_cube(conn, root, years, resolution=DEFAULT_RESOLUTION, tile=DEFAULT_TILE,
+               levels=STANDARD_PRESSURE_LEVELS):
+    """(Re)build the given years, then the climatology over every year in the cube."""
+    os.makedirs(root, exist_ok=True)
+    meta = _read_meta(root)
+    grid = {"resolution": resolution, "tile": tile, "levels": list(levels)}
+    if meta and {k: meta[k] for k in grid} != grid:
+        # A different grid invalidates the years not rebuilt now
+        logger.info(f"Grid changed; dropping years {meta['years']} not in this build")
+        for year in set(meta["years"]) - set(years):
+            shutil.rmtree(os.path.join(root, str(year)), ignore_errors=True)
+        meta = None
+    all_years = sorted(set(meta["years"] if meta else []) | set(int(y) for y in years))
+
+    for year in years:
+        cells = aggregate_year(conn, year, resolution, levels)
+        tiles = scatter_tiles(cells, len(levels), tile)
+        _write_period(root, year, tiles)
+        logger.info(f"Climatology {year}: {len(cells)} cell-month-levels in {len(tiles)} tiles")
+
+    n_tiles = build_climatology(root, all_years)
+    _write_meta(root, {**grid, "years": all_years})
+    logger.info(f"Climatology over {all_years}: {n_tiles} tiles")
+    return all_years
+
+
+class ClimatologyCube:
+    """Read side of the cube. Tiles are memory-mapped on first use; the tile cache is
+    dropped when meta.json changes (i.e. after a rebuild).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._meta = None
+        self._meta_mtime = None
+        self._tiles = {}
+
+    def meta(self):
+        path = os.path.join(self.root, "meta.json")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._meta, self._meta_mtime, self._tiles = None, None, {}
+            return None
+        if mtime != self._meta_mtime:
+            with open(path) as fh:
+                self._meta = json.load(fh)
+            self._meta_mtime = mtime
+            self._tiles = {}
+        return self._meta
+
+    def available(self) -> bool:
+        return self.meta() is not None
+
+    def _tile(self, period, row, col):
+        key = (str(period), row, col)
+        if key not in self._tiles:
+            path = os.path.join(self.root, str(period), f"tile_{row}_{col}.npy")
+            self._tiles[key] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+        return self._tiles[key]
+
+    def _cell_ranges(self, lat_min, lat_max, lon_min, lon_max):
+        """Inclusive (i0, i1) latitude and list of (j0, j1) longitude cell ranges overlapping the
+        box; lon_min > lon_max means the box crosses the antimeridian."""
+        meta = self.meta()
+        res = meta["resolution"]
+        nlat, nlon = grid_shape(res)
+
+        def lat_index(lat):
+            return min(max(int(math.floor((lat + 90) / res)), 0), nlat - 1)
+
+        def lon_index(lon):
+            return min(int(math.floor(((lon + 180) % 360) / res)), nlon - 1)
+
+        lat_range = (lat_index(min(lat_min, lat_max)), lat_index(max(lat_min, lat_max)))
+        if lon_max - lon_min >= 360:
+            return lat_range, [(0, nlon - 1)]
+        j0, j1 = lon_index(lon_min), lon_index(lon_max)
+        if lon_max == 180:
+            j1 = nlon - 1
+        return lat_range, [(j0, j1)] if j0 <= j1 else [(j0, nlon - 1), (0, j1)]
+
+    def _aggregate(self, variable, bbox, period, months):
+        """Area-weighted mean, and sample count, per (month, level) over the box."""
+        meta = self.meta()
+        res, tile = meta["resolution"], meta["tile"]
+        n_levels = len(meta["levels"])
+        f_sum, f_count = FIELDS[variable]
+        months = np.asarray(months, dtype=np.int64)
+        weighted = np.zeros((len(months), n_levels))
+        weights = np.zeros((len(months), n_levels))
+        counts = np.zeros((len(months), n_levels))
+
+        (i0, i1), lon_ranges = self._cell_ranges(*bbox)
+        for j0, j1 in lon_ranges:
+            for row in range(i0 // tile, i1 // tile + 1):
+                for col in range(j0 // tile, j1 // tile + 1):
+                    arr = self._tile(period, row, col)
+                    if arr is None:
+                        continue
+                    r0, r1 = max(i0, row * tile) - row * tile, min(i1, row * tile + tile - 1) - row * tile + 1
+                    c0, c1 = max(j0, col * tile) - col * tile, min(j1, col * tile + tile - 1) - col * tile + 1
+                    # Only this block of the memory-mapped tile is read
+                    sums = np.asarray(arr[f_sum, :, :, r0:r1, c0:c1][months], dtype=np.float64)
+                    n = np.asarray(arr[f_count, :, :, r0:r1, c0:c1][months], dtype=np.float64)
+                    lat_centers = -90 + (row * tile + np.arange(r0, r1) + 0.5) * res
+                    w = np.cos(np.radians(lat_centers))[None, None, :, None] * (n > 0)
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        means = np.where(n > 0, sums / n, 0.0)
+                    weighted += (means * w).sum(axis=(2, 3))
+                    weights += w.sum(axis=(2, 3))
+                    counts += n.sum(axis=(2, 3))
+        return weighted, weights, counts
+
+    def _level_index(self, pressure):
+        levels = np.asarray(self.meta()["levels"], dtype=np.float64)
+        return int(np.argmin(np.abs(levels - pressure)))
+
+    @staticmethod
+    def _mean(weighted, weights):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(weights > 0, weighted / weights, np.nan)
+
+    def region_mean(self, variable, bbox, month=None, year=None):
+        """Mean profile over the box on the standard levels, for one month (1-12) or the whole
+        year, of one `year` or the climatology."""
+        months = [month - 1] if month else list(range(12))
+        period = str(year) if year else CLIMATOLOGY_PERIOD
+        weighted, weights, counts = self._aggregate(variable, bbox, period, months)
+        return {
+            "levels": self.meta()["levels"],
+            "mean": to_list(self._mean(weighted.sum(axis=0), weights.sum(axis=0))),
+            "count": counts.sum(axis=0).astype(np.int64).tolist(),
+        }
+
+    def time_series(self, variable, bbox, pressure, years=None):
+        """Monthly box means at the standard level nearest `pressure`, for each cube year."""
+        level = self._level_index(pressure)
+        series = []
+        for year in years or self.meta()["years"]:
+            weighted, weights, counts = self._aggregate(variable, bbox, str(year), range(12))
+            means = self._mean(weighted[:, level], weights[:, level])
+            for month, value, count in zip(range(1, 13), to_list(means), counts[:, level].astype(np.int64).tolist()):
+                if count:
+                    series.append({"year": int(year), "month": month, "mean": value, "count": count})
+        return {"level": self.meta()["levels"][level], "series": series}
+
+    def anomaly(self, variable, bbox, year, month):
+        """Box mean profile of one year-month minus the same month's climatology."""
+        current = self.region_mean(variable, bbox, month=month, year=year)
+        normal = self.region_mean(variable, bbox, month=month)
+        mean = np.array(current["mean"], dtype=np.float64)
+        clim = np.array(normal["mean"], dtype=np.float64)
+        return {
+            "levels": current["levels"],
+            "mean": current["mean"],
+            "climatology": normal["mean"],
+            "anomaly": to_list(mean - clim),
+            "count": current["count"],
+            "climatology_count": normal["count"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the gridded climatology cube from the measurements tables")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--year", type=int, action="append", help="year to (re)build (repeatable)")
+    group.add_argument("--all", action="store_true", help="rebuild every year that has a profiles partition")
+    parser.add_argument("--out", help="cube directory (default: CLIMATOLOGY_DIR)")
+    parser.add_argument("--resolution", type=float, default=DEFAULT_RESOLUTION, help="cell size in degrees")
+    parser.add_argument("--tile", type=int, default=DEFAULT_TILE, help="cells per tile side")
+    args = parser.parse_args()
+    configure_logging()
+
+    from final_backend_code import DB_CONFIG, CLIMATOLOGY_DIR
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        years = list_partition_years(conn, "profiles") if args.all else args.year
+        build_cube(conn, args.out or CLIMATOLOGY_DIR, years, args.resolution, args.tile)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import io
+import importlib.util
+
+import numpy as np
+import orjson
+
+
+# Column layout of the profile fetch queries (profile columns, then the stats)
+PROFILE_FIELDS = ("profile_id", "year", "month", "float_id", "latitude", "longitude",
+                  "depth_min", "depth_max", "file_path", "profile_datetime")
+STAT_FIELDS = ("pressure_min", "pressure_max", "pressure_avg",
+               "temperature_min", "temperature_max", "temperature_avg",
+               "salinity_min", "salinity_max", "salinity_avg")
+CONDITIONS = ("pressure", "temperature", "salinity")
+INT_FIELDS = ("profile_id", "year", "month", "float_id")
+OBJECT_FIELDS = ("file_path",)
+DATETIME_FIELDS = ("profile_datetime",)
+
+# Arrow IPC output is optional; pyarrow is only imported when a client asks for it
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def _int_column(values):
+    try:
+        return np.array(values, dtype=np.int64)
+    except (TypeError, ValueError):
+        # NULLs present; keep the Python objects
+        return np.array(values, dtype=object)
+
+
+def _column(name, values):
+    if name in INT_FIELDS:
+        return _int_column(values)
+    if name in OBJECT_FIELDS:
+        return np.array(values, dtype=object)
+    if name in DATETIME_FIELDS:
+        return np.array(values, dtype="datetime64[us]")
+    # float64 with NULL → NaN
+    return np.array(values, dtype=np.float64)
+
+
+def split_rows(rows):
+    """Split joined (profile + stats) rows into the (profiles_data, measurement_summaries) pair."""
+    n_profile = len(PROFILE_FIELDS)
+    profiles_data = []
+    measurement_summaries = []
+    for row in rows:
+        profiles_data.append(tuple(row[:n_profile]))
+        summary = {"profile_id": row[0]}
+        summary.update(zip(STAT_FIELDS, row[n_profile:]))
+        measurement_summaries.append(summary)
+    return profiles_data, measurement_summaries
+
+
+def to_list(values):
+    """Array → list of Python values with NaN/NaT as None."""
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return np.where(np.isnan(values), None, values.astype(object)).tolist()
+    return values.tolist()
+
+
+class ProfileColumns:
+    """Profile fetch result stored column-wise: one NumPy array per field of PROFILE_FIELDS
+    and STAT_FIELDS (floats as float64 with NaN for NULL, times as datetime64).
+
+    Built straight from the DB rows; the row-oriented (profiles_data, measurement_summaries)
+    pair the prompt code uses is derived lazily from the same rows.
+    """
+
+    def __init__(self, columns: dict, rows=None):
+        self.columns = columns
+        self._rows = rows
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Rows of PROFILE_FIELDS + STAT_FIELDS, as returned by the fetch queries."""
+        names = PROFILE_FIELDS + STAT_FIELDS
+        transposed = list(zip(*rows)) if rows else [()] * len(names)
+        return cls({name: _column(name, values) for name, values in zip(names, transposed)}, rows=rows)
+
+    @classmethod
+    def from_pairs(cls, profiles_data, measurement_summaries):
+        rows = [tuple(profile) + tuple(stats.get(k) for k in STAT_FIELDS)
+                for profile, stats in zip(profiles_data, measurement_summaries)]
+        return cls.from_rows(rows)
+
+    def __len__(self):
+        return len(self.columns["profile_id"])
+
+    @property
+    def rows(self):
+        """The joined DB rows the columns were built from."""
+        return self._rows or []
+
+    def take(self, indices):
+        """ProfileColumns of the rows at `indices`."""
+        indices = np.asarray(indices, dtype=np.int64)
+        rows = self.rows
+        return ProfileColumns({name: values[indices] for name, values in self.columns.items()},
+                              rows=[rows[i] for i in indices])
+
+    def to_pairs(self):
+        """(profiles_data, measurement_summaries) in the format fetch_from_postgres returns."""
+        return split_rows(self._rows or [])
+
+    def datetime_strings(self):
+        """profile_datetime as 'YYYY-MM-DDTHH:MM:SSZ' strings (None when missing)."""
+        times = self.columns["profile_datetime"]
+        text = np.char.add(np.datetime_as_string(times, unit="s"), "Z").astype(object)
+        text[np.isnat(times)] = None
+        return text
+
+    def table_columns(self, conditions=None) -> dict:
+        """Columns of the table view: float, position and depth range, plus the average of
+        each requested condition (all three when none are requested), rounded for display.
+        """
+        c = self.columns
+        out = {
+            "float_id": c["float_id"],
+            "latitude": np.round(c["latitude"], 4),
+            "longitude": np.round(c["longitude"], 4),
+            "depth_min": np.round(c["depth_min"], 3),
+            "depth_max": np.round(c["depth_max"], 3),
+        }
+        for cond in (conditions or CONDITIONS):
+            if cond in CONDITIONS:
+                out[cond] = np.round(c[f"{cond}_avg"], 3)
+        return out
+
+    def visualization_columns(self, conditions=None) -> dict:
+        """Flat columns of the visualization view: min/max/avg of the requested conditions."""
+        c = self.columns
+        out = {
+            "profile_id": c["profile_id"],
+            "float_id": c["float_id"],
+            "datetime": self.datetime_strings(),
+            "latitude": c["latitude"],
+            "longitude": c["longitude"],
+            "depth_min": c["depth_min"],
+            "depth_max": c["depth_max"],
+        }
+        allowed = set(conditions or [])
+        for cond in CONDITIONS:
+            if not allowed or cond in allowed:
+                for agg in ("min", "max", "avg"):
+                    out[f"{cond}_{agg}"] = c[f"{cond}_{agg}"]
+        return out
+
+    def table_records(self, conditions=None):
+        """table_columns() as a list of row dicts."""
+        cols = self.table_columns(conditions)
+        names = list(cols)
+        return [dict(zip(names, values)) for values in zip(*(to_list(v) for v in cols.values()))]
+
+    def visualization_records(self, conditions=None):
+        """Nested per-profile records (location, depth_range, measurements) for the charts."""
+        cols = self.visualization_columns(conditions)
+        stat_names = [name for name in cols if name.rsplit("_", 1)[0] in CONDITIONS]
+        base = ("profile_id", "float_id", "datetime", "latitude", "longitude", "depth_min", "depth_max")
+        columns = [to_list(cols[name]) for name in base + tuple(stat_names)]
+        return [
+            {
+                "profile_id": pid,
+                "float_id": fid,
+                "datetime": when,
+                "location": {"latitude": lat, "longitude": lon},
+                "depth_range": {"min": dmin, "max": dmax},
+                "measurements": dict(zip(stat_names, stats)),
+            }
+            for pid, fid, when, lat, lon, dmin, dmax, *stats in zip(*columns)
+        ]
+
+
+def dumps_columns(payload: dict) -> bytes:
+    """orjson-encode a response whose `data` may be a dict of column arrays. Numeric arrays
+    are written by orjson directly (NaN → null); other arrays go through to_list().
+    """
+    data = payload.get("data")
+    if isinstance(data, dict):
+        payload = dict(payload)
+        payload["data"] = {
+            name: values if isinstance(values, np.ndarray) and values.dtype.kind in "iufb" else to_list(values)
+            for name, values in data.items()
+        }
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def arrow_ipc(columns: dict, metadata: dict = None) -> bytes:
+    """Columns as an Arrow IPC stream; `metadata` is stored in the schema (JSON-encoded values)."""
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("Arrow output requires pyarrow")
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+    arrays = {name: pa.array(values, from_pandas=True) for name, values in columns.items()}
+    table = pa.table(arrays)
+    if metadata:
+        table = table.replace_schema_metadata({k: orjson.dumps(v) for k, v in metadata.items()})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
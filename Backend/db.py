@@ -0,0 +1,215 @@
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+from telemetry import get_logger
+
+
+logger = get_logger("db")
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the acquire timeout."""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe Postgres connection pool shared by the request handlers.
+
+    - Connections are opened lazily (importing the backend never touches the DB).
+    - At most `maxconn` connections are checked out; further callers wait up to
+      `acquire_timeout` seconds and then get PoolTimeout.
+    - Every connection runs with `statement_timeout` set, so a runaway query
+      cannot hold a pool slot forever.
+    - Connections idle for longer than `health_check_interval` are pinged with
+      SELECT 1 before being handed out, and replaced if the ping fails.
+    - run_async() executes blocking DB work on a dedicated executor sized to the
+      pool, so async endpoints can await it without starving the default threadpool.
+    """
+
+    def __init__(self, db_config: dict, minconn: int = 1, maxconn: int = 10,
+                 statement_timeout_ms: int = 15000, acquire_timeout: float = 10.0,
+                 health_check_interval: float = 30.0):
+        self.db_config = dict(db_config)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.statement_timeout_ms = statement_timeout_ms
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._last_used = {}
+        self._executor = None
+
+        self.in_use = 0
+        self.acquired = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.health_check_failures = 0
+
+    def _connect_kwargs(self) -> dict:
+        kwargs = dict(self.db_config)
+        if self.statement_timeout_ms:
+            options = kwargs.get("options", "")
+            kwargs["options"] = f"{options} -c statement_timeout={int(self.statement_timeout_ms)}".strip()
+        return kwargs
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pg_pool.ThreadedConnectionPool(self.minconn, self.maxconn, **self._connect_kwargs())
+                    logger.info(f"Opened DB pool (min={self.minconn}, max={self.maxconn})")
+        return self._pool
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, queued_at=None):
+        """Check out a connection. `queued_at` (monotonic time) lets run_async() count the
+        time a job spent queued on the executor as pool wait time.
+        """
+        started = queued_at if queued_at is not None else time.monotonic()
+        acquired_now = self._slots.acquire(blocking=False)
+        if not acquired_now or time.monotonic() - started > 0.001:
+            with self._stats_lock:
+                self.waits += 1
+        if not acquired_now and not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._stats_lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No DB connection available after {self.acquire_timeout}s (max={self.maxconn})")
+        waited = time.monotonic() - started
+
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            while not self._healthy(conn):
+                with self._stats_lock:
+                    self.health_check_failures += 1
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        try:
+            if not conn.closed and not close:
+                # Leave no open transaction behind for the next borrower
+                conn.rollback()
+                self._last_used[id(conn)] = time.monotonic()
+            else:
+                self._last_used.pop(id(conn), None)
+            self._get_pool().putconn(conn, close=close or bool(conn.closed))
+        except psycopg2.Error:
+            self._last_used.pop(id(conn), None)
+            self._get_pool().putconn(conn, close=True)
+        finally:
+            with self._stats_lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    @staticmethod
+    def _broken(conn, error) -> bool:
+        """Whether `error` left `conn` unusable. A statement cancelled by statement_timeout
+        (QueryCanceledError, an OperationalError) only aborts the transaction; putconn()
+        rolls it back and the connection goes back to the pool.
+        """
+        if isinstance(error, psycopg2.extensions.QueryCanceledError):
+            return False
+        return bool(conn.closed)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the block."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.Error as e:
+            broken = self._broken(conn, e)
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def _run(self, fn, args, kwargs, queued_at=None):
+        conn = self.getconn(queued_at)
+        broken = False
+        try:
+            return fn(conn, *args, **kwargs)
+        except psycopg2.Error as e:
+            broken = self._broken(conn, e)
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def run(self, fn, *args, **kwargs):
+        """Call `fn(conn, *args, **kwargs)` with a borrowed connection."""
+        return self._run(fn, args, kwargs)
+
+    async def run_async(self, fn, *args, **kwargs):
+        """Await `fn(conn, *args, **kwargs)` executed on the pool's executor."""
+        if self._executor is None:
+            with self._pool_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.maxconn, thread_name_prefix="db")
+        loop = asyncio.get_running_loop()
+        queued_at = time.monotonic()
+        # Carry the caller's context (request trace) onto the executor thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, lambda: context.run(self._run, fn, args, kwargs, queued_at))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            avg_wait = self.wait_time_total / self.acquired if self.acquired else 0.0
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self.in_use,
+                "utilization": self.in_use / self.maxconn if self.maxconn else 0.0,
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(avg_wait * 1000, 3),
+                "wait_ms_max": round(self.wait_time_max * 1000, 3),
+                "health_check_failures": self.health_check_failures,
+            }
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+        self._last_used.clear()
@@ -1,23 +1,63 @@
 import os
-import pandas as pd
-import numpy as np
+import time
+import hashlib
 from datetime import datetime, timezone
-import faiss
-import psycopg2
 from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAI
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import LLMChain
 import json
 import re
+import asyncio
+import sqlite3
+import threading
+import weakref
 import calendar
-import httpx
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote_plus
-
+from db import ConnectionPool
+from index_cache import MonthIndexCache, source_signature
+from spatial_index import MonthIndex, IndexLRU
+from sqlite_cache import SQLiteCache
+from llm_cache import LLMResponseCache, make_cache_key
+from result_cache import QueryResultCache, geohash_cell, make_result_key
+from singleflight import SingleFlight
+from sessions import SessionStore, estimate_tokens
+from columnar import ProfileColumns, PROFILE_FIELDS, STAT_FIELDS, split_rows
+from climatology import ClimatologyCube
+from schema import partition_exists
+from telemetry import configure_logging, get_logger, timed, stage, record_rows, submit_in_context
+
+
+logger = get_logger("backend")
+geocode_logger = get_logger("geocode")
 
 data_root = r"path_to_your_text_file"
 
+# Columnar cache of the monthly index files (built on first use, invalidated by file mtime/size)
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", os.path.join(data_root, ".index_cache"))
+INDEX_CACHE_MONTHS = int(os.getenv("INDEX_CACHE_MONTHS", "12"))
+month_index_cache = MonthIndexCache(INDEX_CACHE_DIR, max_months=INDEX_CACHE_MONTHS)
+
+# Built nearest-float indexes, one per (year, month, date window)
+SPATIAL_INDEX_CACHE_SIZE = int(os.getenv("SPATIAL_INDEX_CACHE_SIZE", "24"))
+spatial_index_cache = IndexLRU(max_entries=SPATIAL_INDEX_CACHE_SIZE)
+
+# Concurrent identical work (index loads/builds, DB fetches, geocoding, LLM summaries) runs
+# once and every waiter shares the result; counts are in /stats and /metrics.
+index_flight = SingleFlight("index")
+fetch_flight = SingleFlight("fetch")
+geocode_flight = SingleFlight("geocode")
+llm_flight = SingleFlight("llm")
+SINGLE_FLIGHTS = (index_flight, fetch_flight, geocode_flight, llm_flight)
+
+# Gridded lat/lon × month × level climatology (built with `python climatology.py --all`)
+CLIMATOLOGY_DIR = os.getenv("CLIMATOLOGY_DIR", os.path.join(data_root, "climatology"))
+climatology_cube = ClimatologyCube(CLIMATOLOGY_DIR)
+
+# "geodesic" searches by great-circle distance and drops floats beyond SEARCH_RADIUS_KM;
+# "planar" keeps the original L2 over raw (lat, lon) degrees.
+SEARCH_MODE = os.getenv("SEARCH_MODE", "geodesic")
+SEARCH_RADIUS_KM = float(os.getenv("SEARCH_RADIUS_KM", "1000"))
+
 DB_CONFIG = {
     "dbname": "DBNAME",
     "user": "postgres",
@@ -26,65 +66,218 @@ DB_CONFIG = {
     "port": "5432"
 }
 
+# Shared connection pool; connections are opened on first use
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    minconn=int(os.getenv("DB_POOL_MIN", "1")),
+    maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+    statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000")),
+    acquire_timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+)
+
 
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GEOCODER_API_KEY = "GEOCODER_API_KEY"
+GEOCODE_TIMEOUT = float(os.getenv("GEOCODE_TIMEOUT", "10"))
+# Max geocoder requests in flight per worker
+GEOCODE_CONCURRENCY = int(os.getenv("GEOCODE_CONCURRENCY", "6"))
+
+# Local caches shared by all workers on this host (geocoding, LLM answers)
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 86400)))
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", str(86400)))
+geocode_cache = SQLiteCache(os.path.join(CACHE_DIR, "geocode.sqlite3"), table="geocode", default_ttl=GEOCODE_CACHE_TTL)
+GEOCODE_STATS = {"hits": 0, "negative_hits": 0, "misses": 0}
+_geocode_stats_lock = threading.Lock()
 
 
 GEMINI_MODEL = "gemini-1.5-flash"
 
-llm = GoogleGenerativeAI(
-    model=GEMINI_MODEL,
-    google_api_key=GOOGLE_API_KEY,
-    temperature=0.2
+# The LLM client and prompt (LangChain + Google GenAI, slow to import) are created on first
+# use, or by warm_up() after startup, so importing this module stays cheap.
+llm = None
+prompt = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    global llm
+    if llm is None:
+        with _llm_lock:
+            if llm is None:
+                from langchain_google_genai import GoogleGenerativeAI
+                llm = GoogleGenerativeAI(
+                    model=GEMINI_MODEL,
+                    google_api_key=GOOGLE_API_KEY,
+                    temperature=0.2
+                )
+    return llm
+
+
+def get_prompt():
+    """Conversation prompt; history comes from the caller's session, not a process-wide buffer."""
+    global prompt
+    if prompt is None:
+        with _llm_lock:
+            if prompt is None:
+                from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+                prompt = ChatPromptTemplate.from_messages([
+                    ("system", "You are a helpful assistant specialized in oceanography."),
+                    MessagesPlaceholder("history"),
+                    ("human", "{input}")
+                ])
+    return prompt
+
+# Per-conversation state: a token-budgeted history window plus the last query's results.
+# Sessions idle for SESSION_TTL seconds, or beyond MAX_SESSIONS, are evicted.
+session_store = SessionStore(
+    max_sessions=int(os.getenv("MAX_SESSIONS", "1000")),
+    ttl=float(os.getenv("SESSION_TTL", "3600")),
+    history_token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "4000")),
 )
+# Used by the CLI and by callers that do not track conversations
+DEFAULT_SESSION_ID = "default"
+
+
+def get_session(session_id=None):
+    return session_store.get(session_id or DEFAULT_SESSION_ID)
+
 
-# Conversation setup
-memory = ConversationBufferMemory(memory_key="history", return_messages=True)
+@timed("llm_predict")
+def predict(prompt_text, session=None):
+    """One LLM turn with the session's history window; the exchange is appended to it."""
+    session = session or get_session()
+    answer = get_llm().invoke(get_prompt().format_prompt(history=session.history_messages(), input=prompt_text))
+    session.add_exchange(prompt_text, answer)
+    return answer
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", "You are a helpful assistant specialized in oceanography."),
-    MessagesPlaceholder("history"),
-    ("human", "{input}")
-])
 
-conversation_chain = LLMChain(
-    llm=llm,
-    prompt=prompt,
-    memory=memory
+@timed("llm_predict")
+async def apredict(prompt_text, session=None):
+    """Async predict()."""
+    session = session or get_session()
+    answer = await get_llm().ainvoke(get_prompt().format_prompt(history=session.history_messages(), input=prompt_text))
+    session.add_exchange(prompt_text, answer)
+    return answer
+
+
+# Summary answers keyed on (normalized prompt, requested conditions, model).
+# LLM_CACHE_ENABLED=0 turns it off globally; use_cache=False skips it per call.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+llm_response_cache = LLMResponseCache(
+    disk=SQLiteCache(os.path.join(CACHE_DIR, "llm.sqlite3"), table="llm_responses"),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 86400))),
 )
 
-# Lightweight in-memory session state for follow-ups
-LAST_STATE = {
-    "year": None,
-    "month": None,
-    "start_date": None,
-    "end_date": None,
-    "lat": None,
-    "lon": None,
-    "nearest_ids": None,
-    "profiles_data": None,
-    "measurement_summaries": None,
-}
 
-def set_last_state(year, month, start_date, end_date, lat, lon, nearest_ids, profiles_data, measurement_summaries):
-    LAST_STATE.update({
+def _cached_summary(prompt_text, requested_conditions, use_cache, session):
+    """Return (cache_key, answer); answer is None on a miss or when the cache is bypassed."""
+    if not (LLM_CACHE_ENABLED and use_cache):
+        llm_response_cache.record_bypass()
+        return None, None
+    key = make_cache_key(prompt_text, requested_conditions, GEMINI_MODEL)
+    answer = llm_response_cache.get(key)
+    if answer is not None:
+        logger.info("LLM response served from cache")
+        # Keep the conversation history identical to an uncached call
+        session.add_exchange(prompt_text, answer)
+    return key, answer
+
+
+def _generate_summary(prompt_text, key, session):
+    answer = predict(prompt_text, session)
+    llm_response_cache.set(key, answer)
+    return answer
+
+
+async def _generate_summary_async(prompt_text, key, session):
+    answer = await apredict(prompt_text, session)
+    llm_response_cache.set(key, answer)
+    return answer
+
+
+def predict_summary(prompt_text, requested_conditions=None, use_cache=True, session=None):
+    """predict() behind the LLM response cache. Concurrent misses for the same cache key
+    share one LLM call; the callers that waited record it in their history like a cache hit.
+    """
+    session = session or get_session()
+    key, answer = _cached_summary(prompt_text, requested_conditions, use_cache, session)
+    if answer is None:
+        if key is None:
+            return predict(prompt_text, session)
+        answer, shared = llm_flight.run(key, _generate_summary, prompt_text, key, session)
+        if shared:
+            session.add_exchange(prompt_text, answer)
+    return answer
+
+
+async def predict_summary_async(prompt_text, requested_conditions=None, use_cache=True, session=None):
+    """Async predict_summary() using apredict()."""
+    session = session or get_session()
+    key, answer = _cached_summary(prompt_text, requested_conditions, use_cache, session)
+    if answer is None:
+        if key is None:
+            return await apredict(prompt_text, session)
+        answer, shared = await llm_flight.arun(key, _generate_summary_async, prompt_text, key, session)
+        if shared:
+            session.add_exchange(prompt_text, answer)
+    return answer
+
+
+@timed("llm_stream")
+async def _astream(prompt_value):
+    async for chunk in get_llm().astream(prompt_value):
+        yield chunk
+
+
+async def stream_summary_async(prompt_text, requested_conditions=None, use_cache=True, session=None):
+    """Yield the summary answer in chunks as the LLM generates them.
+    Uses the same prompt, history and cache as predict_summary_async(); a cached answer
+    is yielded as a single chunk. History and cache are only updated once the stream completes.
+    """
+    session = session or get_session()
+    key, answer = _cached_summary(prompt_text, requested_conditions, use_cache, session)
+    if answer is not None:
+        yield answer
+        return
+
+    prompt_value = get_prompt().format_prompt(history=session.history_messages(), input=prompt_text)
+    chunks = []
+    async for chunk in _astream(prompt_value):
+        chunks.append(chunk)
+        yield chunk
+    answer = "".join(chunks)
+    session.add_exchange(prompt_text, answer)
+    if key is not None:
+        llm_response_cache.set(key, answer)
+
+
+def set_last_state(year, month, start_date, end_date, lat, lon, nearest_ids, profiles_data, measurement_summaries, session=None, columns=None, radius_km=None):
+    """Remember the last query's results on the session for follow-ups."""
+    session = session or get_session()
+    session.last_state = {
         "year": year,
         "month": month,
         "start_date": start_date,
         "end_date": end_date,
         "lat": lat,
         "lon": lon,
+        "radius_km": radius_km,
         "nearest_ids": nearest_ids,
         "profiles_data": profiles_data,
         "measurement_summaries": measurement_summaries,
-    })
-    print("[Checkpoint] Updated LAST_STATE for follow-up continuity")
+        "columns": columns,
+    }
+    logger.info(f"Updated last state of session {session.id} for follow-up continuity")
 
 
-def get_last_state():
-    return LAST_STATE if LAST_STATE.get("profiles_data") else None
+def get_last_state(session=None):
+    state = (session or get_session()).last_state
+    return state if state and state.get("profiles_data") else None
 
 # UTILITY FUNCTIONS
 def detect_visualization(query: str) -> bool:
@@ -127,141 +320,456 @@ def detect_requested_conditions(query: str):
     return found
 
 
+@timed("load_txt_files")
 def load_txt_files(year: str, month: str):
+    """Load the float index for one month.
+    Served from the in-process LRU or the on-disk columnar cache; the text files are
+    only parsed when the cache is missing or a source file changed.
+    The returned DataFrame is shared between callers and must not be modified in place.
+    """
     folder_path = os.path.join(data_root, year)
     if not os.path.exists(folder_path):
+        import pandas as pd
         return pd.DataFrame()
 
-    files = [f for f in os.listdir(folder_path) if f.endswith(".txt") and f"in{year}{month}" in f]
-    dfs = []
-    for file in files:
-        file_path = os.path.join(folder_path, file)
-        df = pd.read_csv(file_path)
-        df.columns = df.columns.str.strip().str.lower()
-        df['file_path'] = file_path
-        df['date_time_min'] = pd.to_datetime(df['date_time_min'], errors='coerce', utc=True)
-        df['date_time_max'] = pd.to_datetime(df['date_time_max'], errors='coerce', utc=True)
-        dfs.append(df)
-    print(f"[Checkpoint] Loaded {len(dfs)} files for {year}-{month}")
-    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+    df, _ = index_flight.run(("load", year, month), month_index_cache.load, folder_path, year, month)
+    record_rows("load_txt_files", len(df))
+    logger.info(f"Loaded {len(df)} index rows for {year}-{month}")
+    return df
 
+@timed("filter_by_date")
 def filter_by_date(df, start_date, end_date):
     if df.empty:
-        print("[Checkpoint] No data to filter")
+        logger.info("No data to filter")
         return df
     if start_date.tzinfo is None:
         start_date = start_date.replace(tzinfo=timezone.utc)
     if end_date.tzinfo is None:
         end_date = end_date.replace(tzinfo=timezone.utc)
     filtered = df[(df['date_time_min'] <= end_date) & (df['date_time_max'] >= start_date)].reset_index(drop=True)
-    print(f"[Checkpoint] Filtered data to {len(filtered)} records between {start_date} and {end_date}")
+    record_rows("filter_by_date", len(filtered))
+    logger.info(f"Filtered data to {len(filtered)} records between {start_date} and {end_date}")
     return filtered
 
 
 # FAISS SEARCH FUNCTION (NO TIME)
+@timed("build_and_search")
 def build_and_search(df, query_lat, query_lon, k=10):
-    if df.empty:
-        print("[Checkpoint] No data for FAISS search")
-        return [], []
+    """One-off search over an arbitrary DataFrame. Prefer search_month(), which reuses a cached index."""
+    return MonthIndex.from_frame(df).search(query_lat, query_lon, k=k)
 
-    vectors = np.stack([
-        np.array([(row['latitude_min'] + row['latitude_max']) / 2,
-                  (row['longitude_min'] + row['longitude_max']) / 2], dtype='float32')
-        for _, row in df.iterrows()
-    ])
-    
-    index_to_id = df['floatid'].astype(str).tolist()
-    index_to_file = df['file_path'].tolist()
-    latitudes = ((df['latitude_min'] + df['latitude_max']) / 2).tolist()
-    longitudes = ((df['longitude_min'] + df['longitude_max']) / 2).tolist()
-
-    dimension = 2
-    index = faiss.IndexFlatL2(dimension)
-    index.add(vectors)
-
-    query_vector = np.array([[query_lat, query_lon]], dtype='float32')
-    distances, indices = index.search(query_vector, k=min(k, len(df)))
-
-    closest_files = {}
-    closest_coords = []
-
-    for idx in indices[0]:
-        fid = index_to_id[idx]
-        if fid not in closest_files:
-            closest_files[fid] = index_to_file[idx]
-            closest_coords.append((latitudes[idx], longitudes[idx]))
-
-    print(f"[Checkpoint] FAISS search found {len(closest_files)} closest floats")
-    for i, (lat, lon) in enumerate(closest_coords, 1):
-        print(f"   → Closest #{i}: Latitude={lat:.4f}, Longitude={lon:.4f}")
-
-    exact_match = df[
-        (np.isclose((df['latitude_min'] + df['latitude_max']) / 2, query_lat, atol=1e-3)) &
-        (np.isclose((df['longitude_min'] + df['longitude_max']) / 2, query_lon, atol=1e-3))
-    ]
-    if not exact_match.empty:
-        exact_id = str(exact_match.iloc[0]['floatid'])
-        if exact_id not in closest_files:
-            print(f"[Checkpoint] Exact coordinate match found → Float ID {exact_id}")
-            return [exact_id] + list(closest_files.keys()), [exact_match.iloc[0]['file_path']] + list(closest_files.values())
 
-    return list(closest_files.keys()), list(closest_files.values())
+def get_month_index(year: str, month: str, start_date, end_date):
+    """Return the cached MonthIndex for a month and date window, building it on first use.
+    The key includes the source files' signature, so edited index files produce a fresh index.
+    """
+    signature = source_signature(os.path.join(data_root, year), year, month)
+    key = (year, month, str(start_date), str(end_date), signature)
+
+    def build():
+        df = filter_by_date(load_txt_files(year, month), start_date, end_date)
+        with stage("build_index"):
+            index = MonthIndex.from_frame(df)
+        logger.info(f"Built spatial index for {year}-{month} ({len(df)} records)")
+        return index
+
+    return spatial_index_cache.get_or_build(key, lambda: index_flight.run(key, build)[0])
+
+
+def search_month(year: str, month: str, start_date, end_date, query_lat, query_lon, k=10, radius_km=None, mode=None):
+    """Nearest floats to (query_lat, query_lon) within the month/date window, using the cached index.
+    In geodesic mode floats farther than `radius_km` (default SEARCH_RADIUS_KM) are dropped here,
+    so they are never fetched from Postgres or passed to the LLM.
+    Returns (float_ids, file_paths).
+    """
+    index = get_month_index(year, month, start_date, end_date)
+    return search_index(index, query_lat, query_lon, k=k, radius_km=radius_km, mode=mode)
+
+
+@timed("search_index")
+def search_index(index, query_lat, query_lon, k=10, radius_km=None, mode=None):
+    """Run the configured search mode against an already-built MonthIndex."""
+    if (mode or SEARCH_MODE) == "planar":
+        ids, files = index.search(query_lat, query_lon, k=k)
+    else:
+        radius_km = SEARCH_RADIUS_KM if radius_km is None else radius_km
+        ids, files, _ = index.search_geodesic(query_lat, query_lon, k=k, radius_km=radius_km)
+    record_rows("search_index", len(ids))
+    return ids, files
+
+
+def months_in_range(start_date, end_date):
+    """(year, month) zero-padded string pairs covering start_date..end_date."""
+    months = []
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append((str(year), str(month).zfill(2)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+# Threads loading the monthly index files of a multi-month range
+INDEX_LOAD_WORKERS = int(os.getenv("INDEX_LOAD_WORKERS", "8"))
+
+
+def get_range_index(start_date, end_date):
+    """Cached MonthIndex over every month of the window (one month → get_month_index()).
+    The months are loaded in parallel and their rows concatenated, so a float keeps one row
+    per month it was active in.
+    """
+    months = months_in_range(start_date, end_date)
+    if len(months) == 1:
+        return get_month_index(*months[0], start_date, end_date)
+    signatures = tuple(source_signature(os.path.join(data_root, y), y, m) for y, m in months)
+    key = ("range", str(start_date), str(end_date), signatures)
+
+    def build():
+        import pandas as pd
+        with ThreadPoolExecutor(max_workers=min(INDEX_LOAD_WORKERS, len(months))) as pool:
+            futures = [submit_in_context(pool, load_txt_files, *ym) for ym in months]
+            frames = [df for df in (f.result() for f in futures) if not df.empty]
+        df = filter_by_date(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(), start_date, end_date)
+        with stage("build_index"):
+            index = MonthIndex.from_frame(df)
+        logger.info(f"Built spatial index for {months[0][0]}-{months[0][1]} to "
+                    f"{months[-1][0]}-{months[-1][1]} ({len(df)} records)")
+        return index
+
+    return spatial_index_cache.get_or_build(key, lambda: index_flight.run(key, build)[0])
+
+
+def search_range(index, start_date, end_date, query_lat, query_lon, k=10, radius_km=None, mode=None):
+    """search_index() over a get_range_index() index. A float has up to one row per month,
+    so k rows per month are considered and the k nearest distinct floats kept.
+    """
+    n_months = len(months_in_range(start_date, end_date))
+    ids, files = search_index(index, query_lat, query_lon, k=k * n_months, radius_km=radius_km, mode=mode)
+    return ids[:k], files[:k]
+
+
+@timed("search_index")
+def search_index_batch(index, latitudes, longitudes, k=10, radius_km=None, mode=None):
+    """search_index() for many points with one index call; returns the float ids of each point."""
+    if (mode or SEARCH_MODE) == "planar":
+        found = [ids for ids, _ in index.search_batch(latitudes, longitudes, k=k)]
+    else:
+        radius_km = SEARCH_RADIUS_KM if radius_km is None else radius_km
+        found = [ids for ids, _, _ in index.search_geodesic_batch(latitudes, longitudes, k=k, radius_km=radius_km)]
+    record_rows("search_index", sum(len(ids) for ids in found))
+    return found
+
+
+def search_range_batch(index, start_date, end_date, latitudes, longitudes, k=10, radius_km=None, mode=None):
+    """search_range() for many points sharing one window."""
+    n_months = len(months_in_range(start_date, end_date))
+    found = search_index_batch(index, latitudes, longitudes, k=k * n_months, radius_km=radius_km, mode=mode)
+    return [ids[:k] for ids in found]
+
+
+# Nearest floats and their fetched profiles per (geohash cell, date window, search settings,
+# data version), so nearby queries for the same window skip the DB fetch. Shared by all
+# workers through the disk tier; RESULT_CACHE_ENABLED=0 turns it off.
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_PRECISION = int(os.getenv("RESULT_CACHE_PRECISION", "5"))
+result_cache = QueryResultCache(
+    disk=SQLiteCache(os.path.join(CACHE_DIR, "results.sqlite3"), table="query_results"),
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+)
+
+
+def result_cache_key(query_lat, query_lon, start_date, end_date, radius_km=None, k=10):
+    """Result-cache key for a query: its geohash cell (the cell only groups queries; searches
+    always run from the real point), window, search settings and data_version(). None when
+    the cache is disabled or the data version cannot be read. May query the DB.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None
+    try:
+        version = data_version(start_date, end_date)
+    except Exception as e:
+        logger.warning(f"Result cache skipped, data version unavailable: {e}")
+        return None
+    cell, _ = geohash_cell(query_lat, query_lon, RESULT_CACHE_PRECISION)
+    return make_result_key(cell, start_date, end_date, radius_km, k, SEARCH_MODE, version)
+
+
+def lookup_result(query_lat, query_lon, start_date, end_date, radius_km=None, k=10):
+    """(key, cached (nearest_ids, columns) or None) for a query; blocking (DB and disk tier)."""
+    key = result_cache_key(query_lat, query_lon, start_date, end_date, radius_km, k)
+    return key, (result_cache.get(key) if key else None)
 
 
 # POSTGRES FETCH FUNCTIONS
+
+# Read per-profile stats from the precomputed profile_stats table instead of aggregating measurements
+USE_PROFILE_STATS = os.getenv("USE_PROFILE_STATS", "1") == "1"
+
+
+def build_profiles_from_stats_sql(year, with_time_filter):
+    """SQL returning each matching profile joined to its row in profile_stats_{year}.
+    The last column flags whether a stats row existed, so stale profiles can be recomputed.
+    """
+    where_time = " AND p.profile_datetime BETWEEN %s AND %s" if with_time_filter else ""
+    return f"""
+        SELECT p.profile_id, p.year, p.month, p.float_id, p.latitude, p.longitude,
+               p.depth_min, p.depth_max, p.file_path, p.profile_datetime,
+               ps.pressure_min, ps.pressure_max, ps.pressure_avg,
+               ps.temperature_min, ps.temperature_max, ps.temperature_avg,
+               ps.salinity_min, ps.salinity_max, ps.salinity_avg,
+               ps.profile_id IS NOT NULL AS has_stats
+        FROM profiles_{year} p
+        LEFT JOIN profile_stats_{year} ps ON ps.profile_id = p.profile_id AND ps.year = p.year
+        WHERE p.float_id = ANY(%s){where_time}
+        ORDER BY p.profile_datetime, p.profile_id
+    """
+
+
+def build_profiles_with_stats_sql(year, with_time_filter):
+    """SQL returning each matching profile followed by its measurement aggregates.
+    Profiles are selected from profiles_{year} and aggregated over measurements_{year}
+    with one GROUP BY, so the whole result comes back in a single round trip.
+    """
+    where_time = " AND profile_datetime BETWEEN %s AND %s" if with_time_filter else ""
+    return f"""
+        WITH selected AS (
+            SELECT profile_id, year, month, float_id, latitude, longitude, depth_min, depth_max, file_path, profile_datetime
+            FROM profiles_{year}
+            WHERE float_id = ANY(%s){where_time}
+        ),
+        stats AS (
+            SELECT profile_id,
+                   MIN(pressure) AS pressure_min, MAX(pressure) AS pressure_max, AVG(pressure) AS pressure_avg,
+                   MIN(temperature) AS temperature_min, MAX(temperature) AS temperature_max, AVG(temperature) AS temperature_avg,
+                   MIN(salinity) AS salinity_min, MAX(salinity) AS salinity_max, AVG(salinity) AS salinity_avg
+            FROM measurements_{year}
+            WHERE profile_id = ANY(ARRAY(SELECT profile_id FROM selected))
+            GROUP BY profile_id
+        )
+        SELECT s.profile_id, s.year, s.month, s.float_id, s.latitude, s.longitude,
+               s.depth_min, s.depth_max, s.file_path, s.profile_datetime,
+               st.pressure_min, st.pressure_max, st.pressure_avg,
+               st.temperature_min, st.temperature_max, st.temperature_avg,
+               st.salinity_min, st.salinity_max, st.salinity_avg
+        FROM selected s
+        LEFT JOIN stats st ON st.profile_id = s.profile_id
+        ORDER BY s.profile_datetime, s.profile_id
+    """
+
+
+def fill_missing_stats(cur, year, rows):
+    """Drop the has_stats flag from profile_stats rows, aggregating measurements live for
+    profiles that have no stats row yet (ingested but not refreshed).
+    """
+    n_profile = len(PROFILE_FIELDS)
+    missing = [row[0] for row in rows if not row[-1]]
+    live = {}
+    if missing:
+        logger.warning(f"{len(missing)} profiles have no profile_stats row; aggregating live "
+                       f"(run `python profile_stats.py --year {year}` to backfill)")
+        cur.execute(f"""
+            SELECT profile_id,
+                   MIN(pressure), MAX(pressure), AVG(pressure),
+                   MIN(temperature), MAX(temperature), AVG(temperature),
+                   MIN(salinity), MAX(salinity), AVG(salinity)
+            FROM measurements_{year}
+            WHERE profile_id = ANY(%s)
+            GROUP BY profile_id
+        """, (missing,))
+        live = {r[0]: tuple(r[1:]) for r in cur.fetchall()}
+    out = []
+    for row in rows:
+        if row[-1]:
+            out.append(row[:-1])
+        else:
+            out.append(tuple(row[:n_profile]) + live.get(row[0], (None,) * len(STAT_FIELDS)))
+    return out
+
+
+
+@timed("fetch_from_postgres")
+def query_profile_rows(conn, float_ids, year, start_date=None, end_date=None):
+    """Run the profiles + measurement aggregates query on `conn`; rows are PROFILE_FIELDS + STAT_FIELDS."""
+    # Convert to integers to match BIGINT column
+    float_ids = [int(fid) for fid in float_ids if str(fid).isdigit()]
+    with_time_filter = bool(start_date and end_date)
+
+    params = [float_ids]
+    if with_time_filter:
+        params.extend([start_date, end_date])
+    with conn.cursor() as cur:
+        if USE_PROFILE_STATS:
+            cur.execute(build_profiles_from_stats_sql(int(year), with_time_filter), params)
+            rows = cur.fetchall()
+            rows = fill_missing_stats(cur, int(year), rows)
+        else:
+            cur.execute(build_profiles_with_stats_sql(int(year), with_time_filter), params)
+            rows = cur.fetchall()
+
+    record_rows("fetch_from_postgres", len(rows))
+    logger.info(f"Retrieved {len(rows)} profiles with measurement summaries from DB (with date filter: {with_time_filter})")
+    return rows
+
+
+def query_profiles_with_stats(conn, float_ids, year, start_date=None, end_date=None):
+    return split_rows(query_profile_rows(conn, float_ids, year, start_date, end_date))
+
+
+def query_profile_columns(conn, float_ids, year, start_date=None, end_date=None):
+    """Same query, returned as a columnar ProfileColumns."""
+    return ProfileColumns.from_rows(query_profile_rows(conn, float_ids, year, start_date, end_date))
+
+
 def fetch_from_postgres(float_ids, year, start_date=None, end_date=None):
     """Fetch profiles and aggregated measurements for given float_ids within optional time window.
 
-    - Only queries the yearly partition table (profiles_{year}).
+    - Only queries the yearly partitions (profiles_{year}, measurements_{year}).
     - If start_date/end_date provided, filters by profile_datetime BETWEEN those bounds.
+    - Profiles and their measurement aggregates come back from one query on a pooled connection.
+    - Concurrent calls for the same floats and window share one query.
     """
     if not float_ids:
-        print("[Checkpoint] No float IDs for DB fetch")
+        logger.info("No float IDs for DB fetch")
         return [], []
 
-    conn = psycopg2.connect(**DB_CONFIG)
-    cur = conn.cursor()
-    # Convert to integers to match BIGINT column
-    float_ids = [int(fid) for fid in float_ids if str(fid).isdigit()]
-    partition_table = f"profiles_{year}"
-
-    where_time = " AND profile_datetime BETWEEN %s AND %s" if (start_date and end_date) else ""
-    sql_profiles = f"""
-        SELECT profile_id, year, month, float_id, latitude, longitude, depth_min, depth_max, file_path, profile_datetime
-        FROM {partition_table}
-        WHERE float_id = ANY(%s){where_time}
-        ORDER BY profile_datetime
+    def fetch():
+        with db_pool.connection() as conn:
+            return query_profiles_with_stats(conn, float_ids, year, start_date, end_date)
+
+    result, _ = fetch_flight.run(fetch_key(float_ids, start_date, end_date, year), fetch)
+    return result
+
+
+async def fetch_from_postgres_async(float_ids, year, start_date=None, end_date=None):
+    """Async variant of fetch_from_postgres for FastAPI endpoints; runs on the pool's executor."""
+    if not float_ids:
+        logger.info("No float IDs for DB fetch")
+        return [], []
+    return await db_pool.run_async(query_profiles_with_stats, float_ids, year, start_date, end_date)
+
+
+async def fetch_profile_columns_async(float_ids, year, start_date=None, end_date=None):
+    """fetch_from_postgres_async() returning a ProfileColumns."""
+    if not float_ids:
+        logger.info("No float IDs for DB fetch")
+        return ProfileColumns.from_rows([])
+    return await db_pool.run_async(query_profile_columns, float_ids, year, start_date, end_date)
+
+
+def year_windows(start_date, end_date):
+    """Split a window into (year, start, end) pieces, one per yearly partition."""
+    return [
+        (year, max(start_date, datetime(year, 1, 1)), min(end_date, datetime(year, 12, 31, 23, 59, 59)))
+        for year in range(start_date.year, end_date.year + 1)
+    ]
+
+
+PROFILE_DATETIME_POS = PROFILE_FIELDS.index("profile_datetime")
+
+
+def merge_year_rows(results):
+    """Merge per-year row lists (each in profile_datetime order) into one time-ordered list."""
+    def key(row):
+        when = row[PROFILE_DATETIME_POS]
+        return (when is None, when or datetime.min, row[0])
+    return list(heapq.merge(*results, key=key))
+
+
+def query_partition_rows(conn, float_ids, year, start_date, end_date):
+    """query_profile_rows(), returning no rows for years without a partition."""
+    with conn.cursor() as cur:
+        if not partition_exists(cur, f"profiles_{int(year)}"):
+            return []
+    return query_profile_rows(conn, float_ids, year, start_date, end_date)
+
+
+def fetch_range_from_postgres(float_ids, start_date, end_date):
+    """fetch_from_postgres() over a window that may span several years: each yearly
+    partition is queried on its own pooled connection, concurrently, and the rows merged
+    in time order.
     """
-    params = [float_ids]
-    if start_date and end_date:
-        params.extend([start_date, end_date])
-    cur.execute(sql_profiles, params)
-    profiles_data = cur.fetchall()
-    print(f"[Checkpoint] Retrieved {len(profiles_data)} profiles from DB (with date filter: {bool(start_date and end_date)})")
-
-    measurement_summaries = []
-    for profile in profiles_data:
-        profile_id = profile[0]
-        sql_measurements = """
-            SELECT MIN(pressure), MAX(pressure), AVG(pressure),
-                   MIN(temperature), MAX(temperature), AVG(temperature),
-                   MIN(salinity), MAX(salinity), AVG(salinity)
-            FROM measurements
-            WHERE profile_id = %s
-        """
-        cur.execute(sql_measurements, (profile_id,))
-        stats = cur.fetchone()
-        measurement_summaries.append({
-            "profile_id": profile_id,
-            "pressure_min": stats[0], "pressure_max": stats[1], "pressure_avg": stats[2],
-            "temperature_min": stats[3], "temperature_max": stats[4], "temperature_avg": stats[5],
-            "salinity_min": stats[6], "salinity_max": stats[7], "salinity_avg": stats[8]
-        })
-
-    cur.close()
-    conn.close()
-    print(f"[Checkpoint] Computed measurement summaries for {len(measurement_summaries)} profiles")
-    return profiles_data, measurement_summaries
+    if not float_ids:
+        logger.info("No float IDs for DB fetch")
+        return [], []
+    windows = year_windows(start_date, end_date)
+
+    def fetch(window):
+        with db_pool.connection() as conn:
+            return query_partition_rows(conn, float_ids, *window)
+
+    with ThreadPoolExecutor(max_workers=len(windows)) as pool:
+        futures = [submit_in_context(pool, fetch, window) for window in windows]
+        results = [future.result() for future in futures]
+    return split_rows(merge_year_rows(results))
+
+
+def fetch_key(float_ids, start_date, end_date, year=None):
+    return (tuple(str(fid) for fid in float_ids), year, start_date, end_date)
+
+
+async def fetch_profile_columns_range_async(float_ids, start_date, end_date):
+    """fetch_profile_columns_async() over a window that may span several years (see
+    fetch_range_from_postgres()). Concurrent calls for the same floats and window share
+    one set of queries."""
+    columns, _ = await fetch_flight.arun(
+        fetch_key(float_ids, start_date, end_date), _fetch_profile_columns_range, float_ids, start_date, end_date,
+    )
+    return columns
+
+
+async def _fetch_profile_columns_range(float_ids, start_date, end_date):
+    windows = year_windows(start_date, end_date)
+    if len(windows) == 1:
+        return await fetch_profile_columns_async(float_ids, windows[0][0], start_date, end_date)
+    if not float_ids:
+        logger.info("No float IDs for DB fetch")
+        return ProfileColumns.from_rows([])
+    results = await asyncio.gather(*(
+        db_pool.run_async(query_partition_rows, float_ids, *window) for window in windows
+    ))
+    rows = merge_year_rows(results)
+    logger.info(f"Merged {len(rows)} profiles from {len(windows)} yearly partitions")
+    return ProfileColumns.from_rows(rows)
+
+
+# Data versions behind the ETags of the structured endpoints. The DB part is re-read at most
+# every DATA_VERSION_TTL seconds; the index-file part only stats the window's files.
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "30"))
+_db_version = {"checked": 0.0, "value": None}
+_db_version_lock = threading.Lock()
+
+
+def query_db_version(conn) -> str:
+    """Changes whenever profiles are loaded: the highest profile_id, plus the size and last
+    load time of the ingest log when ingest.py has created it."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(profile_id) FROM profiles")
+        version = [cur.fetchone()[0]]
+        cur.execute("SELECT to_regclass('ingest_files')")
+        if cur.fetchone()[0] is not None:
+            cur.execute("SELECT COUNT(*), MAX(ingested_at) FROM ingest_files")
+            version.extend(cur.fetchone())
+    return repr(version)
+
+
+def db_data_version() -> str:
+    with _db_version_lock:
+        if _db_version["value"] is not None and time.monotonic() - _db_version["checked"] < DATA_VERSION_TTL:
+            return _db_version["value"]
+    with db_pool.connection() as conn:
+        value = query_db_version(conn)
+    with _db_version_lock:
+        _db_version.update(checked=time.monotonic(), value=value)
+    return value
+
+
+def data_version(start_date, end_date) -> str:
+    """Short hash of the data answers for this window are built from: the DB version and
+    the signatures of the window's monthly index files."""
+    signatures = [source_signature(os.path.join(data_root, y), y, m) for y, m in months_in_range(start_date, end_date)]
+    return hashlib.sha256(repr((db_data_version(), signatures)).encode("utf-8")).hexdigest()[:20]
+
 
 def safe_float(val, precision=2):
     try:
@@ -272,89 +780,33 @@ def safe_float(val, precision=2):
 def to_json(profiles_data, measurement_summaries, conditions=None):
     """Return JSON for visualization. If `conditions` provided, include only those condition keys
     in the measurements dict (min/max/avg for each requested condition)."""
+    json_list = ProfileColumns.from_pairs(profiles_data, measurement_summaries).visualization_records(conditions)
     allowed = set(conditions or [])
-    def filter_measurements(stats):
-        if not allowed:
-            return {
-                "pressure_min": stats['pressure_min'], "pressure_max": stats['pressure_max'], "pressure_avg": stats['pressure_avg'],
-                "temperature_min": stats['temperature_min'], "temperature_max": stats['temperature_max'], "temperature_avg": stats['temperature_avg'],
-                "salinity_min": stats['salinity_min'], "salinity_max": stats['salinity_max'], "salinity_avg": stats['salinity_avg']
-            }
-        out = {}
-        if "pressure" in allowed:
-            out.update({
-                "pressure_min": stats['pressure_min'], "pressure_max": stats['pressure_max'], "pressure_avg": stats['pressure_avg']
-            })
-        if "temperature" in allowed:
-            out.update({
-                "temperature_min": stats['temperature_min'], "temperature_max": stats['temperature_max'], "temperature_avg": stats['temperature_avg']
-            })
-        if "salinity" in allowed:
-            out.update({
-                "salinity_min": stats['salinity_min'], "salinity_max": stats['salinity_max'], "salinity_avg": stats['salinity_avg']
-            })
-        return out
-
-    json_list = []
-    for profile, stats in zip(profiles_data, measurement_summaries):
-        json_list.append({
-            "profile_id": profile[0],
-            "float_id": profile[3],
-            "datetime": profile[9].strftime('%Y-%m-%dT%H:%M:%SZ') if profile[9] else None,
-            "location": {"latitude": profile[4], "longitude": profile[5]},
-            "depth_range": {"min": profile[6], "max": profile[7]},
-            "measurements": filter_measurements(stats)
-        })
-    print(f"[Checkpoint] Converted profiles to JSON ({len(json_list)} records) filtered for {', '.join(allowed) if allowed else 'all conditions'}")
+    logger.info(f"Converted profiles to JSON ({len(json_list)} records) filtered for {', '.join(allowed) if allowed else 'all conditions'}")
     return json_list
 
 
 def to_table_json(profiles_data, measurement_summaries, conditions=None):
     """Flatten profiles and measurement stats into row-wise JSON suitable for a table.
     If `conditions` is provided (list like ["temperature"]), limit columns to:
-    year, month, latitude, longitude + requested condition min/max/avg.
+    float_id, latitude, longitude, depth range + requested condition averages.
     """
-    rows = []
-    limit_fields = conditions and len(conditions) > 0
-    for profile, stats in zip(profiles_data, measurement_summaries):
-        if limit_fields:
-            lat = profile[4]
-            lon = profile[5]
-            row = {
-                "float_id": profile[3],
-                "latitude": round(lat, 4) if isinstance(lat, (int, float)) and lat is not None else lat,
-                "longitude": round(lon, 4) if isinstance(lon, (int, float)) and lon is not None else lon,
-                "depth_min": round(profile[6], 3) if isinstance(profile[6], (int, float)) and profile[6] is not None else profile[6],
-                "depth_max": round(profile[7], 3) if isinstance(profile[7], (int, float)) and profile[7] is not None else profile[7],
-            }
-            for cond in conditions:
-                if cond == "temperature":
-                    row["temperature"] = round(stats['temperature_avg'], 3) if stats['temperature_avg'] is not None else None
-                elif cond == "salinity":
-                    row["salinity"] = round(stats['salinity_avg'], 3) if stats['salinity_avg'] is not None else None
-                elif cond == "pressure":
-                    row["pressure"] = round(stats['pressure_avg'], 3) if stats['pressure_avg'] is not None else None
-            rows.append(row)
-        else:
-            # Compact, screen-friendly table: drop profile_id, file_path, datetime, year, month; keep averages only and round to 3 decimals
-            lat = profile[4]
-            lon = profile[5]
-            rows.append({
-                "float_id": profile[3],
-                "latitude": round(lat, 4) if isinstance(lat, (int, float)) and lat is not None else lat,
-                "longitude": round(lon, 4) if isinstance(lon, (int, float)) and lon is not None else lon,
-                "depth_min": round(profile[6], 3) if isinstance(profile[6], (int, float)) and profile[6] is not None else profile[6],
-                "depth_max": round(profile[7], 3) if isinstance(profile[7], (int, float)) and profile[7] is not None else profile[7],
-                "pressure": round(stats['pressure_avg'], 3) if stats['pressure_avg'] is not None else None,
-                "temperature": round(stats['temperature_avg'], 3) if stats['temperature_avg'] is not None else None,
-                "salinity": round(stats['salinity_avg'], 3) if stats['salinity_avg'] is not None else None,
-            })
-    print(f"[Checkpoint] Built table JSON ({len(rows)} rows) with {'filtered' if limit_fields else 'all'} columns")
+    rows = ProfileColumns.from_pairs(profiles_data, measurement_summaries).table_records(conditions)
+    logger.info(f"Built table JSON ({len(rows)} rows) with {'filtered' if conditions else 'all'} columns")
     return rows
 
-def summarize(profiles_data, measurement_summaries, user_question, requested_conditions=None):
+# Estimated tokens allowed for the profile section of the summary prompt. Larger results
+# are rolled up per float, and floats beyond the budget are folded into one line.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+
+
+@timed("summarize")
+def summarize(profiles_data, measurement_summaries, user_question, requested_conditions=None, float_order=None):
+    """Build the summary prompt. Profiles are listed one by one when they fit PROMPT_TOKEN_BUDGET,
+    otherwise compacted into per-float rollups (listed in `float_order`, e.g. nearest first).
+    """
     if not profiles_data:
-        print("[Checkpoint] No profiles to summarize")
+        logger.info("No profiles to summarize")
         return "No profiles found for the given floats."
     # Build condition lines depending on request
     def build_condition_lines(stats):
@@ -379,6 +831,15 @@ def summarize(profiles_data, measurement_summaries, user_question, requested_con
 {build_condition_lines(stats)}
 """ for profile, stats in zip(profiles_data, measurement_summaries)
     ])
+    if estimate_tokens(all_summaries) > PROMPT_TOKEN_BUDGET:
+        from prompt_compaction import compact_profiles  # pandas; only needed for oversized prompts
+        all_summaries, report = compact_profiles(
+            profiles_data, measurement_summaries, requested_conditions,
+            token_budget=PROMPT_TOKEN_BUDGET, float_order=float_order,
+        )
+        logger.info(f"Compacted prompt: {report['profiles']} profiles → {report['floats_listed']} float rollups "
+                    f"({report['profiles_folded']} profiles folded, {report['floats_omitted']} floats omitted, "
+                    f"~{report['estimated_tokens']} tokens)")
     # Add explicit instruction to restrict to requested conditions if provided
     restrict_text = "" if not requested_conditions else (
         "Only report the following conditions and nothing else: " + ", ".join(requested_conditions) + ".\n"
@@ -395,23 +856,69 @@ Profiles retrieved:
 
 Question: {user_question}
 """
-    print("[Checkpoint] Prepared summary prompt for LLM")
+    logger.info("Prepared summary prompt for LLM")
     return prompt_text
 
 
 # Parse date from user input
-def parse_dates_from_query(query):
-    match = re.search(r"(January|February|March|April|May|June|July|August|September|October|November|December)\s+(\d{4})", query, re.I)
+MONTH_PATTERN = (r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+                 r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b\.?")
+# A 19xx/20xx number followed by a distance or depth unit ("2000 km", "at 2000 m") is not a year
+UNIT_AFTER = r"\s*(?:k?ms?|kilomet(?:er|re)s?|met(?:er|re)s?|mi|miles?|nm|nautical|db|dbars?|decibars?)\b"
+YEAR_PATTERN = rf"((?:19|20)\d{{2}})(?!{UNIT_AFTER})"
+RANGE_SEPARATOR = r"\s*(?:-|–|—|to|through|thru|until|till|and)\s*"
+MONTH_RANGE_RE = re.compile(rf"\b{MONTH_PATTERN}(?:\s+{YEAR_PATTERN})?{RANGE_SEPARATOR}{MONTH_PATTERN}\s+{YEAR_PATTERN}\b", re.I)
+YEAR_RANGE_RE = re.compile(rf"\b{YEAR_PATTERN}{RANGE_SEPARATOR}{YEAR_PATTERN}\b", re.I)
+MONTH_YEAR_RE = re.compile(rf"\b{MONTH_PATTERN}\s+{YEAR_PATTERN}\b", re.I)
+# A lone year only counts after a date preposition: "in 2020", "during 2020", "for the year 2020"
+YEAR_RE = re.compile(rf"\b(?:in|during|for|throughout|year)\s+(?:the\s+year\s+)?{YEAR_PATTERN}\b", re.I)
+
+
+def month_number(name: str) -> int:
+    return [m.lower()[:3] for m in calendar.month_name[1:]].index(name.lower()[:3]) + 1
+
+
+def month_end(year: int, month: int) -> datetime:
+    return datetime(year, month, calendar.monthrange(year, month)[1], 23, 59, 59)
+
+
+def parse_date_range(query):
+    """Time window named in the query, as (start_date, end_date). Understands
+    "March to June 2021", "Nov 2020 - Feb 2021", "2019–2022", "March 2021" and "in 2020"
+    (a lone year needs a preposition and no unit, so "within 2000 km" is not a date);
+    defaults to January 2019.
+    """
+    query = query or ""
+    match = MONTH_RANGE_RE.search(query)
     if match:
-        month_str, year_str = match.groups()
-        month = str(list(calendar.month_name).index(month_str.capitalize())).zfill(2)
-        year = year_str
-        start_date = datetime(int(year), int(month), 1)
-        end_date = datetime(int(year), int(month), calendar.monthrange(int(year), int(month))[1], 23, 59, 59)
-        print(f" [Checkpoint] Parsed dates: {start_date} → {end_date}")
-        return year, month, start_date, end_date
-    print("[Checkpoint] No date found, defaulting to Jan 2019")
-    return "2019", "01", datetime(2019, 1, 1), datetime(2019, 1, 31, 23, 59, 59)
+        first, first_year, last, last_year = match.groups()
+        first, last, last_year = month_number(first), month_number(last), int(last_year)
+        # "November to February 2021" starts in the previous year
+        first_year = int(first_year) if first_year else (last_year if first <= last else last_year - 1)
+        start_date, end_date = datetime(first_year, first, 1), month_end(last_year, last)
+    elif YEAR_RANGE_RE.search(query):
+        first_year, last_year = sorted(int(y) for y in YEAR_RANGE_RE.search(query).groups())
+        start_date, end_date = datetime(first_year, 1, 1), month_end(last_year, 12)
+    elif MONTH_YEAR_RE.search(query):
+        month_str, year_str = MONTH_YEAR_RE.search(query).groups()
+        year, month = int(year_str), month_number(month_str)
+        start_date, end_date = datetime(year, month, 1), month_end(year, month)
+    elif YEAR_RE.search(query):
+        year = int(YEAR_RE.search(query).group(1))
+        start_date, end_date = datetime(year, 1, 1), month_end(year, 12)
+    else:
+        logger.info("No date found, defaulting to Jan 2019")
+        return datetime(2019, 1, 1), datetime(2019, 1, 31, 23, 59, 59)
+    if start_date > end_date:
+        start_date, end_date = datetime(end_date.year, end_date.month, 1), month_end(start_date.year, start_date.month)
+    logger.info(f"Parsed dates: {start_date} → {end_date}")
+    return start_date, end_date
+
+
+def parse_dates_from_query(query):
+    """parse_date_range() plus the year and month (zero-padded strings) the window starts in."""
+    start_date, end_date = parse_date_range(query)
+    return str(start_date.year), str(start_date.month).zfill(2), start_date, end_date
 
 
 # Extract coordinates from query
@@ -421,58 +928,282 @@ def parse_coords_from_query(query):
     if lat_match and lon_match:
         lat = float(re.search(r"[-+]?\d*\.?\d+", lat_match.group()).group())
         lon = float(re.search(r"[-+]?\d*\.?\d+", lon_match.group()).group())
-        print(f"[Checkpoint] Parsed coordinates: lat={lat}, lon={lon}")
+        logger.info(f"Parsed coordinates: lat={lat}, lon={lon}")
         return lat, lon
-    print("[Checkpoint] No coordinates found in query")
+    logger.info("No coordinates found in query")
     return None, None
 
 
+RADIUS_UNITS_KM = {"km": 1.0, "mi": 1.609344, "nm": 1.852}
+
+
+def parse_radius_from_query(query):
+    """Parse a search radius like "within 300 km" / "within 50 miles". Returns km or None."""
+    match = re.search(
+        r"within\s+(\d+(?:\.\d+)?)\s*(km|kms|kilomet(?:er|re)s?|mi|miles?|nm|nautical\s+miles?)\b",
+        query or "", re.I,
+    )
+    if not match:
+        return None
+    value, unit = float(match.group(1)), match.group(2).lower()
+    if unit.startswith("k"):
+        factor = RADIUS_UNITS_KM["km"]
+    elif unit.startswith("n"):
+        factor = RADIUS_UNITS_KM["nm"]
+    else:
+        factor = RADIUS_UNITS_KM["mi"]
+    logger.info(f"Parsed search radius: {value * factor:.1f} km")
+    return value * factor
+
+
+def geocode_cache_key(query: str) -> str:
+    return re.sub(r"\s+", " ", (query or "").strip().lower())
+
+
+def cached_geocode(query: str):
+    """Return (found, (lat, lon)) from the geocode cache. A found (None, None) is a cached miss."""
+    try:
+        found, value = geocode_cache.get(geocode_cache_key(query))
+    except sqlite3.Error as e:
+        geocode_logger.warning(f"Cache read failed: {e}")
+        return False, (None, None)
+    with _geocode_stats_lock:
+        GEOCODE_STATS["hits" if found else "misses"] += 1
+        if found and value[0] is None:
+            GEOCODE_STATS["negative_hits"] += 1
+    if found:
+        geocode_logger.info(f"Cache hit for query='{query}' -> {value}")
+        return True, (value[0], value[1])
+    return False, (None, None)
+
+
+def store_geocode(query: str, lat, lon):
+    """Cache a definitive geocoder answer; misses are kept for GEOCODE_NEGATIVE_TTL only."""
+    ttl = GEOCODE_CACHE_TTL if lat is not None else GEOCODE_NEGATIVE_TTL
+    try:
+        geocode_cache.set(geocode_cache_key(query), [lat, lon], ttl=ttl)
+    except sqlite3.Error as e:
+        geocode_logger.warning(f"Cache write failed: {e}")
+
+
+@timed("geocode")
 def geocode_region(query: str):
     """
     Geocode a natural language region/place name using https://geocode.maps.co.
     Returns (lat, lon) as floats, or (None, None) if not found.
+    Answers (including "not found") are cached; HTTP errors and timeouts are not.
+    Concurrent lookups of the same name share one request.
     """
+    if not query or not query.strip():
+        return None, None
+    coords, _ = geocode_flight.run(geocode_cache_key(query), _geocode_region, query)
+    return coords
+
+
+def _geocode_region(query: str):
     try:
-        if not query or not query.strip():
-            return None, None
+        found, coords = cached_geocode(query)
+        if found:
+            return coords
         # Build URL exactly like: https://geocode.maps.co/search?q=...&api_key=YOUR_SECRET_API_KEY
         q_enc = quote_plus(query.strip())
         url = f"https://geocode.maps.co/search?q={q_enc}&api_key={GEOCODER_API_KEY}"
-        # Short timeout to keep requests snappy
-        with httpx.Client(timeout=10.0) as client:
-            resp = client.get(url)
-            if resp.status_code != 200:
-                print(f"[Geocode] HTTP {resp.status_code} for query='{query}'")
-                return None, None
-            results = resp.json() or []
-            if not results:
-                print(f"[Geocode] No results for query='{query}'")
-                return None, None
-            item = results[0]
-            lat = float(item.get("lat")) if item.get("lat") is not None else None
-            lon = float(item.get("lon")) if item.get("lon") is not None else None
-            if lat is None or lon is None:
-                print(f"[Geocode] Missing lat/lon in first result for query='{query}'")
-                return None, None
-            print(f"[Geocode] '{query}' -> lat={lat}, lon={lon}")
-            return lat, lon
+        resp = get_http_client().get(url)
+        if resp.status_code != 200:
+            geocode_logger.warning(f"HTTP {resp.status_code} for query='{query}'")
+            return None, None
+        lat, lon = parse_geocode_results(query, resp.json() or [])
+        store_geocode(query, lat, lon)
+        return lat, lon
+    except Exception as e:
+        geocode_logger.warning(f"Error geocoding '{query}': {e}")
+        return None, None
+
+_http_client = None
+_http_client_lock = threading.Lock()
+# Async clients and semaphores are bound to the loop that created them, so keep one per loop
+# (the server's, plus any asyncio.run() in CLIs, benchmarks or tests)
+_async_http = weakref.WeakKeyDictionary()  # loop -> (httpx.AsyncClient, asyncio.Semaphore)
+
+
+def get_http_client():
+    """Shared httpx.Client for the sync geocoder (thread-safe, pooled connections), created on first use."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                import httpx
+                _http_client = httpx.Client(
+                    timeout=GEOCODE_TIMEOUT,
+                    limits=httpx.Limits(max_connections=GEOCODE_CONCURRENCY, max_keepalive_connections=GEOCODE_CONCURRENCY),
+                )
+    return _http_client
+
+
+def _loop_http():
+    loop = asyncio.get_running_loop()
+    entry = _async_http.get(loop)
+    if entry is None or entry[0].is_closed:
+        import httpx
+        client = httpx.AsyncClient(
+            timeout=GEOCODE_TIMEOUT,
+            limits=httpx.Limits(max_connections=GEOCODE_CONCURRENCY, max_keepalive_connections=GEOCODE_CONCURRENCY),
+        )
+        entry = _async_http[loop] = (client, asyncio.Semaphore(GEOCODE_CONCURRENCY))
+    return entry
+
+
+def get_async_http_client():
+    """Shared httpx.AsyncClient for the running event loop (connection pooling across requests)."""
+    return _loop_http()[0]
+
+
+async def close_http_clients():
+    """Close the running loop's AsyncClient and the sync client (app shutdown)."""
+    global _http_client
+    entry = _async_http.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[0].aclose()
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
+
+
+def parse_geocode_results(query, results):
+    """(lat, lon) from the first geocoder result, or (None, None)."""
+    if not results:
+        geocode_logger.info(f"No results for query='{query}'")
+        return None, None
+    item = results[0]
+    lat = float(item.get("lat")) if item.get("lat") is not None else None
+    lon = float(item.get("lon")) if item.get("lon") is not None else None
+    if lat is None or lon is None:
+        geocode_logger.info(f"Missing lat/lon in first result for query='{query}'")
+        return None, None
+    geocode_logger.info(f"'{query}' -> lat={lat}, lon={lon}")
+    return lat, lon
+
+
+async def geocode_region_async(query: str):
+    """Async variant of geocode_region() over the shared AsyncClient, with the same caching
+    and coalescing."""
+    if not query or not query.strip():
+        return None, None
+    coords, _ = await geocode_flight.arun(geocode_cache_key(query), _geocode_region_async, query)
+    return coords
+
+
+async def _geocode_region_async(query: str):
+    try:
+        found, coords = cached_geocode(query)
+        if found:
+            return coords
+        q_enc = quote_plus(query.strip())
+        url = f"https://geocode.maps.co/search?q={q_enc}&api_key={GEOCODER_API_KEY}"
+        client, semaphore = _loop_http()
+        async with semaphore:
+            resp = await client.get(url)
+        if resp.status_code != 200:
+            geocode_logger.warning(f"HTTP {resp.status_code} for query='{query}'")
+            return None, None
+        lat, lon = parse_geocode_results(query, resp.json() or [])
+        store_geocode(query, lat, lon)
+        return lat, lon
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        print(f"[Geocode] Error geocoding '{query}': {e}")
+        geocode_logger.warning(f"Error geocoding '{query}': {e}")
+        return None, None
+
+
+@timed("geocode")
+async def geocode_first_async(candidates):
+    """Geocode all candidates concurrently and return the first hit in priority (list) order.
+    Lower-priority lookups still in flight are cancelled once the winner is known.
+    """
+    tasks = [asyncio.create_task(geocode_region_async(cand)) for cand in candidates]
+    try:
+        for cand, task in zip(candidates, tasks):
+            lat, lon = await task
+            if lat is not None and lon is not None:
+                geocode_logger.info(f"Resolved location from candidate '{cand}'")
+                return lat, lon
         return None, None
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
 
-def extract_last_coords_from_memory():
-    history_messages = memory.load_memory_variables({})["history"]
+def extract_last_coords_from_memory(session=None):
+    history_messages = (session or get_session()).history_messages()
     for msg in reversed(history_messages):
         match = re.search(r"lat\s*([-+]?\d*\.?\d*)\s*.lon\s([-+]?\d*\.?\d*)", msg.content, re.I)
         if match:
-            print(f"[Checkpoint] Extracted last coords from memory: lat={match.group(1)}, lon={match.group(2)}")
+            logger.info(f"Extracted last coords from memory: lat={match.group(1)}, lon={match.group(2)}")
             return float(match.group(1)), float(match.group(2))
-    print("[Checkpoint] No previous coordinates in memory")
+    logger.info("No previous coordinates in memory")
     return None, None
 
 
+# Months whose indexes warm_up() prebuilds: WARMUP_MONTHS ("2019-01,2019-02"), or else the
+# month of the default window plus the WARMUP_RECENT_MONTHS latest months under data_root.
+WARMUP_MONTHS = os.getenv("WARMUP_MONTHS", "")
+WARMUP_RECENT_MONTHS = int(os.getenv("WARMUP_RECENT_MONTHS", "1"))
+INDEX_FILE_MONTH_RE = re.compile(r"in(\d{4})(\d{2})")
+
+
+def available_months():
+    """(year, month) strings with index files under data_root, oldest first."""
+    found = set()
+    if not os.path.isdir(data_root):
+        return []
+    for year in os.listdir(data_root):
+        folder = os.path.join(data_root, year)
+        if not (year.isdigit() and os.path.isdir(folder)):
+            continue
+        for name in os.listdir(folder):
+            match = INDEX_FILE_MONTH_RE.search(name)
+            if name.endswith(".txt") and match and match.group(1) == year:
+                found.add(match.groups())
+    return sorted(found)
+
+
+def hot_months():
+    if WARMUP_MONTHS:
+        return [tuple(ym.strip().split("-")) for ym in WARMUP_MONTHS.split(",") if ym.strip()]
+    default_start, _ = parse_date_range("")
+    months = [(str(default_start.year), str(default_start.month).zfill(2))]
+    recent = available_months()[-WARMUP_RECENT_MONTHS:] if WARMUP_RECENT_MONTHS > 0 else []
+    return list(dict.fromkeys(months + recent))
+
+
+def warm_up(months=None):
+    """Do the slow first-use work before the first request needs it: create the LLM client
+    and prompt, and build the full-month indexes of `months` (default hot_months()), which
+    also imports pandas and FAISS. Failures are logged; requests still build lazily.
+    """
+    started = time.perf_counter()
+    try:
+        get_llm()
+        get_prompt()
+    except Exception as e:
+        logger.warning(f"Warm-up could not create the LLM client: {e}")
+    built = 0
+    for year, month in (hot_months() if months is None else months):
+        try:
+            y, m = int(year), int(month)
+            get_month_index(str(y), str(m).zfill(2), datetime(y, m, 1), month_end(y, m))
+            built += 1
+        except Exception as e:
+            logger.warning(f"Warm-up could not build the {year}-{month} index: {e}")
+    logger.info(f"Warm-up done in {time.perf_counter() - started:.2f}s ({built} month indexes)")
+
+
 # CHATBOT LOOP
 if __name__ == "__main__":
+    configure_logging()
     print(f" Oceanography Chatbot is ready! (using {GEMINI_MODEL}) Type 'exit' to quit.\n")
 
     while True:
@@ -487,8 +1218,6 @@ if __name__ == "__main__":
             query_summary = "summary" in user_input.lower() or (not is_visualization and not is_tabular)
 
             year, month, start_date, end_date = parse_dates_from_query(user_input)
-            df = load_txt_files(year, month)
-            df_filtered = filter_by_date(df, start_date, end_date)
 
             query_lat, query_lon = parse_coords_from_query(user_input)
             if query_lat is None or query_lon is None:
@@ -512,8 +1241,10 @@ if __name__ == "__main__":
                     # Reuse last query results
                     profiles_data, measurement_summaries, nearest_ids = state["profiles_data"], state["measurement_summaries"], state["nearest_ids"]
                 else:
-                    nearest_ids, _ = build_and_search(df_filtered, query_lat, query_lon)
-                    profiles_data, measurement_summaries = fetch_from_postgres(nearest_ids, int(year), start_date, end_date)
+                    index = get_range_index(start_date, end_date)
+                    nearest_ids, _ = search_range(index, start_date, end_date, query_lat, query_lon,
+                                                  radius_km=parse_radius_from_query(user_input))
+                    profiles_data, measurement_summaries = fetch_range_from_postgres(nearest_ids, start_date, end_date)
                     set_last_state(year, month, start_date, end_date, query_lat, query_lon, nearest_ids, profiles_data, measurement_summaries)
 
                 if is_visualization:
@@ -523,13 +1254,13 @@ if __name__ == "__main__":
 
                 if query_summary:
                     prompt_text = summarize(profiles_data, measurement_summaries, "Summarize ocean conditions near these coordinates.")
-                    answer = conversation_chain.predict(input=prompt_text)
+                    answer = predict_summary(prompt_text)
                 elif json_data is not None:
                     answer = "Structured data ready for frontend."
                 else:
                     answer = "Visualization data ready. Use the JSON provided to render the graph."
             else:
-                answer = conversation_chain.predict(input=user_input)
+                answer = predict(user_input)
 
         except Exception as e:
             answer = f"Error: {e}"
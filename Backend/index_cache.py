@@ -0,0 +1,238 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from telemetry import get_logger
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas is imported where it is used (first index load), not at module import, to keep
+# API worker startup fast.
+
+
+logger = get_logger("index_cache")
+
+
+# Bump when the on-disk layout changes so stale caches are rebuilt
+CACHE_VERSION = 1
+DATE_COLUMNS = ("date_time_min", "date_time_max")
+
+
+def ingested_index_name(year, month) -> str:
+    """File name of the month index that ingest.py writes from the profiles table."""
+    return f"argo_in{int(year)}{int(month):02d}.txt"
+
+
+def source_signature(folder_path: str, year: str, month: str):
+    """Return a sorted tuple of (file_name, mtime_ns, size) for the month's source text files.
+    Only stats the files; the contents are never read here.
+    When ingest.py has written the month's index it is the only source: it is rebuilt from
+    every profile of the month in the DB, so the original files would only add duplicates.
+    """
+    if not os.path.isdir(folder_path):
+        return ()
+    pattern = f"in{year}{month}"
+    ingested = ingested_index_name(year, month)
+    entries = []
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if entry.name.endswith(".txt") and pattern in entry.name and entry.is_file():
+                st = entry.stat()
+                entries.append((entry.name, st.st_mtime_ns, st.st_size))
+    if any(name == ingested for name, _, _ in entries):
+        entries = [e for e in entries if e[0] == ingested]
+    return tuple(sorted(entries))
+
+
+def read_month_from_text(folder_path: str, files):
+    """Parse the given index text files into a single normalized DataFrame."""
+    import pandas as pd
+    dfs = []
+    for file in files:
+        file_path = os.path.join(folder_path, file)
+        df = pd.read_csv(file_path)
+        df.columns = df.columns.str.strip().str.lower()
+        df['file_path'] = file_path
+        df['date_time_min'] = pd.to_datetime(df['date_time_min'], errors='coerce', utc=True)
+        df['date_time_max'] = pd.to_datetime(df['date_time_max'], errors='coerce', utc=True)
+        dfs.append(df)
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+
+
+def _signature_key(signature) -> str:
+    raw = json.dumps([CACHE_VERSION, list(signature)]).encode()
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+def _column_kind(series: "pd.Series") -> str:
+    import pandas as pd
+    if series.name in DATE_COLUMNS:
+        return "datetime"
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    return "string"
+
+
+def write_columnar(df: "pd.DataFrame", target_dir: str, signature):
+    """Write `df` as one .npy file per column plus a manifest, atomically.
+    The directory is built under a temporary name and renamed into place, so
+    concurrent readers never see a half-written cache.
+    """
+    parent = os.path.dirname(target_dir)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = f"{target_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        kind = _column_kind(series)
+        if kind == "datetime":
+            # Stored as naive UTC datetime64[ns]; NaT survives the round trip
+            arr = series.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+        elif kind == "numeric":
+            arr = series.to_numpy()
+        else:
+            # Fixed-width unicode keeps the column memory-mappable (object arrays are not)
+            arr = series.fillna("").astype(str).to_numpy(dtype=str)
+        np.save(os.path.join(tmp_dir, f"col{i}.npy"), arr, allow_pickle=False)
+        columns.append({"name": name, "kind": kind, "file": f"col{i}.npy"})
+
+    manifest = {
+        "version": CACHE_VERSION,
+        "signature": [list(s) for s in signature],
+        "rows": int(len(df)),
+        "columns": columns,
+    }
+    with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    try:
+        os.rename(tmp_dir, target_dir)
+    except OSError:
+        # Another worker published the same signature first; theirs is identical
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def read_columnar(target_dir: str):
+    """Load a columnar month cache with memory-mapped column arrays.
+    Returns None if the cache directory is missing or unreadable.
+    """
+    import pandas as pd
+    manifest_path = os.path.join(target_dir, "manifest.json")
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != CACHE_VERSION:
+            return None
+        data = {}
+        for col in manifest["columns"]:
+            arr = np.load(os.path.join(target_dir, col["file"]), mmap_mode="r", allow_pickle=False)
+            if col["kind"] == "datetime":
+                data[col["name"]] = pd.Series(arr, copy=False).dt.tz_localize("UTC")
+            elif col["kind"] == "string":
+                # Strings are handed to pandas as Python objects, like read_csv produces
+                data[col["name"]] = arr.astype(object)
+            else:
+                data[col["name"]] = arr
+    except (OSError, ValueError, KeyError):
+        return None
+    if not data:
+        return pd.DataFrame()
+    return pd.DataFrame(data, copy=False)
+
+
+class MonthIndexCache:
+    """Two-tier cache for the monthly float index files.
+
+    - Disk tier: one directory of memory-mapped .npy columns per (year, month) and
+      source signature, built the first time a month is requested.
+    - Memory tier: an LRU of the most recently used months, so repeat queries skip
+      even the .npy loads. Both tiers are invalidated when any source file's
+      mtime or size changes (or a file is added/removed).
+    """
+
+    def __init__(self, cache_root: str, max_months: int = 12):
+        self.cache_root = cache_root
+        self.max_months = max_months
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _month_dir(self, year: str, month: str, signature) -> str:
+        return os.path.join(self.cache_root, f"{year}{month}-{_signature_key(signature)}")
+
+    def _evict_stale_dirs(self, year: str, month: str, keep_dir: str):
+        if not os.path.isdir(self.cache_root):
+            return
+        prefix = f"{year}{month}-"
+        for name in os.listdir(self.cache_root):
+            path = os.path.join(self.cache_root, name)
+            if name.startswith(prefix) and path != keep_dir and ".tmp-" not in name:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def load(self, folder_path: str, year: str, month: str) -> "pd.DataFrame":
+        signature = source_signature(folder_path, year, month)
+        if not signature:
+            import pandas as pd
+            return pd.DataFrame()
+        key = (year, month)
+
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is not None and cached[0] == signature:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+
+        month_dir = self._month_dir(year, month, signature)
+        df = read_columnar(month_dir)
+        if df is not None:
+            with self._lock:
+                self.disk_hits += 1
+            logger.info(f"Loaded columnar cache for {year}-{month} ({len(df)} rows)")
+        else:
+            with self._lock:
+                self.misses += 1
+            df = read_month_from_text(folder_path, [name for name, _, _ in signature])
+            try:
+                write_columnar(df, month_dir, signature)
+                self._evict_stale_dirs(year, month, month_dir)
+                # Serve the memory-mapped copy so every caller sees the same dtypes
+                mapped = read_columnar(month_dir)
+                if mapped is not None:
+                    df = mapped
+                logger.info(f"Built columnar cache for {year}-{month} ({len(df)} rows)")
+            except OSError as e:
+                logger.warning(f"Could not write columnar cache for {year}-{month}: {e}")
+
+        with self._lock:
+            self._lru[key] = (signature, df)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_months:
+                self._lru.popitem(last=False)
+        return df
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_months": len(self._lru),
+                "max_months": self.max_months,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
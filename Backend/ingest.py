@@ -0,0 +1,399 @@
+"""Bulk load of Argo profile NetCDF files into the year-partitioned Postgres schema.
+
+    python ingest.py /data/argo/2019 --workers 8
+    python ingest.py /data/argo --index-dir /data/index --force
+
+Files are parsed in a process pool and written with COPY in batches of about
+--batch-profiles profiles. Each batch is one transaction: its profiles, measurements,
+profile_stats rows and ingest_files entries commit together, so an interrupted run
+loses at most the batch in flight. Files already recorded in ingest_files with the
+same size and mtime are skipped; a file that changed is deleted and loaded again.
+Missing yearly partitions are created on the fly. At the end the monthly float-index
+text files that load_txt_files() reads are rewritten for every month touched.
+"""
+import io
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.append(CURRENT_DIR)
+
+from schema import ensure_year_partitions  # noqa: E402
+from profile_stats import refresh_profile_stats  # noqa: E402
+from index_cache import ingested_index_name  # noqa: E402
+from telemetry import configure_logging, get_logger  # noqa: E402
+
+
+logger = get_logger("ingest")
+
+
+# JULD in Argo files is days since this reference date (UTC)
+ARGO_EPOCH = np.datetime64("1950-01-01T00:00:00", "us")
+
+PROFILE_COPY_COLUMNS = ("profile_id", "year", "month", "float_id", "file_path", "profile_datetime",
+                        "latitude", "longitude", "depth_min", "depth_max")
+MEASUREMENT_COPY_COLUMNS = ("profile_id", "year", "pressure", "temperature", "salinity")
+
+INGEST_LOG_DDL = """
+    CREATE TABLE IF NOT EXISTS ingest_files (
+        file_path TEXT PRIMARY KEY,
+        file_size BIGINT NOT NULL,
+        file_mtime_ns BIGINT NOT NULL,
+        profiles INT NOT NULL,
+        measurements INT NOT NULL,
+        ingested_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+"""
+
+
+def find_netcdf_files(paths):
+    """Absolute paths of all .nc files under `paths` (files or directories), sorted."""
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(os.path.abspath(path))
+            continue
+        for root, _, files in os.walk(path):
+            found.extend(os.path.abspath(os.path.join(root, f)) for f in files if f.endswith(".nc"))
+    return sorted(set(found))
+
+
+def _values(nc, name, n_prof, n_levels):
+    """Variable as a float64 (n_prof, n_levels) array with fill values as NaN."""
+    if name not in nc.variables:
+        return np.full((n_prof, n_levels), np.nan)
+    data = nc.variables[name][:]
+    return np.ma.filled(np.ma.asarray(data, dtype="f8"), np.nan).reshape(n_prof, n_levels)
+
+
+def _strings(nc, name, n_prof):
+    import netCDF4
+
+    data = nc.variables[name][:]
+    if getattr(data, "dtype", None) is not None and data.dtype.kind == "S":
+        data = netCDF4.chartostring(data)
+    return np.asarray([str(v).strip() for v in np.ravel(data)][:n_prof])
+
+
+def _data_mode(nc, n_prof):
+    """One of R (real time), A (adjusted) or D (delayed mode) per profile."""
+    if "DATA_MODE" not in nc.variables:
+        return np.full(n_prof, "R")
+    modes = np.ma.filled(np.ravel(nc.variables["DATA_MODE"][:]), b"R")
+    return np.char.decode(modes.astype("S1"), "ascii")[:n_prof]
+
+
+def _choose_adjusted(raw, adjusted, data_mode):
+    """Use the *_ADJUSTED values for profiles in adjusted/delayed mode when they exist."""
+    use_adjusted = np.isin(data_mode, ("A", "D")) & ~np.all(np.isnan(adjusted), axis=1)
+    return np.where(use_adjusted[:, None], adjusted, raw)
+
+
+def read_argo_file(path):
+    """Parse one Argo profile file (runs in a worker process).
+
+    Returns a dict with the file's size/mtime and two DataFrames: `profiles` (one row per
+    profile with a valid time and position) and `measurements` (one row per level with at
+    least one value, keyed by the row number of its profile in `profiles`).
+    """
+    import netCDF4
+
+    st = os.stat(path)
+    with netCDF4.Dataset(path) as nc:
+        nc.set_auto_chartostring(False)
+        n_prof = len(nc.dimensions["N_PROF"])
+        n_levels = len(nc.dimensions["N_LEVELS"])
+
+        juld = _values(nc, "JULD", n_prof, 1)[:, 0]
+        lat = _values(nc, "LATITUDE", n_prof, 1)[:, 0]
+        lon = _values(nc, "LONGITUDE", n_prof, 1)[:, 0]
+        float_ids = _strings(nc, "PLATFORM_NUMBER", n_prof)
+        data_mode = _data_mode(nc, n_prof)
+
+        levels = {}
+        for column, var in (("pressure", "PRES"), ("temperature", "TEMP"), ("salinity", "PSAL")):
+            levels[column] = _choose_adjusted(
+                _values(nc, var, n_prof, n_levels),
+                _values(nc, f"{var}_ADJUSTED", n_prof, n_levels),
+                data_mode,
+            )
+
+    valid = ~(np.isnan(juld) | np.isnan(lat) | np.isnan(lon))
+    valid &= np.char.isdigit(float_ids.astype(str))
+    keep = np.flatnonzero(valid)
+    when = ARGO_EPOCH + np.round(juld[keep] * 86_400_000_000).astype("timedelta64[us]")
+
+    pressure = levels["pressure"][keep]
+    with np.errstate(all="ignore"):
+        depth_min = np.nanmin(np.where(np.isnan(pressure), np.inf, pressure), axis=1)
+        depth_max = np.nanmax(np.where(np.isnan(pressure), -np.inf, pressure), axis=1)
+    has_pressure = ~np.all(np.isnan(pressure), axis=1)
+
+    when_index = pd.DatetimeIndex(when)
+    profiles = pd.DataFrame({
+        "year": when_index.year,
+        "month": when_index.month,
+        "float_id": float_ids[keep].astype(np.int64),
+        "file_path": path,
+        "profile_datetime": when,
+        "latitude": lat[keep],
+        "longitude": lon[keep],
+        "depth_min": np.where(has_pressure, depth_min, np.nan),
+        "depth_max": np.where(has_pressure, depth_max, np.nan),
+    })
+
+    stacked = np.stack([levels[c][keep] for c in ("pressure", "temperature", "salinity")], axis=-1)
+    row, level = np.nonzero(~np.all(np.isnan(stacked), axis=-1))
+    measurements = pd.DataFrame(stacked[row, level], columns=["pressure", "temperature", "salinity"])
+    measurements.insert(0, "profile_row", row)
+
+    return {
+        "file_path": path,
+        "file_size": st.st_size,
+        "file_mtime_ns": st.st_mtime_ns,
+        "profiles": profiles,
+        "measurements": measurements,
+    }
+
+
+def _copy(cur, table, columns, df):
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False, na_rep="", date_format="%Y-%m-%d %H:%M:%S.%f")
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+class Ingestor:
+    """Accumulates parsed files and writes them to Postgres one batch per transaction."""
+
+    def __init__(self, conn, batch_profiles=5000):
+        self.conn = conn
+        self.batch_profiles = batch_profiles
+        self.pending = []
+        self.pending_profiles = 0
+        self.known_years = set()
+        self.touched_months = set()
+        self.files = 0
+        self.profiles = 0
+        self.measurements = 0
+        with conn.cursor() as cur:
+            cur.execute(INGEST_LOG_DDL)
+            cur.execute("SELECT pg_get_serial_sequence('profiles', 'profile_id')")
+            self.profile_sequence = cur.fetchone()[0]
+        conn.commit()
+
+    def already_loaded(self):
+        """{file_path: (size, mtime_ns)} of files recorded by previous runs."""
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT file_path, file_size, file_mtime_ns FROM ingest_files")
+            return {path: (size, mtime) for path, size, mtime in cur.fetchall()}
+
+    def add(self, parsed):
+        self.pending.append(parsed)
+        self.pending_profiles += len(parsed["profiles"])
+        if self.pending_profiles >= self.batch_profiles:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending, self.pending_profiles = self.pending, [], 0
+        profiles = pd.concat([p["profiles"] for p in batch], ignore_index=True)
+        offsets = np.cumsum([0] + [len(p["profiles"]) for p in batch])[:-1]
+        measurements = pd.concat(
+            [p["measurements"].assign(profile_row=p["measurements"]["profile_row"] + off)
+             for p, off in zip(batch, offsets)],
+            ignore_index=True,
+        )
+
+        years = set(profiles["year"].unique().tolist())
+        for year in years - self.known_years:
+            ensure_year_partitions(self.conn, year)
+        self.known_years |= years
+
+        try:
+            with self.conn.cursor() as cur:
+                # Reloading a changed file replaces its previous rows (measurements and
+                # profile_stats follow through ON DELETE CASCADE). Only files recorded in
+                # ingest_files can have rows, so new files skip the DELETE entirely.
+                cur.execute(
+                    "SELECT file_path FROM ingest_files WHERE file_path = ANY(%s)",
+                    ([p["file_path"] for p in batch],),
+                )
+                reloaded = [row[0] for row in cur.fetchall()]
+                if reloaded:
+                    cur.execute("DELETE FROM profiles WHERE file_path = ANY(%s)", (reloaded,))
+                cur.execute(
+                    "SELECT nextval(%s) FROM generate_series(1, %s)",
+                    (self.profile_sequence, len(profiles)),
+                )
+                profile_ids = np.fromiter((r[0] for r in cur.fetchall()), dtype=np.int64, count=len(profiles))
+                profiles.insert(0, "profile_id", profile_ids)
+                rows = measurements.pop("profile_row").to_numpy()
+                measurements.insert(0, "profile_id", profile_ids[rows])
+                measurements.insert(1, "year", profiles["year"].to_numpy()[rows])
+
+                _copy(cur, "profiles", PROFILE_COPY_COLUMNS, profiles[list(PROFILE_COPY_COLUMNS)])
+                _copy(cur, "measurements", MEASUREMENT_COPY_COLUMNS, measurements[list(MEASUREMENT_COPY_COLUMNS)])
+                for year, ids in profiles.groupby("year")["profile_id"]:
+                    refresh_profile_stats(self.conn, year, ids.tolist(), commit=False)
+
+                cur.executemany(
+                    """
+                    INSERT INTO ingest_files (file_path, file_size, file_mtime_ns, profiles, measurements)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (file_path) DO UPDATE SET
+                        file_size = EXCLUDED.file_size, file_mtime_ns = EXCLUDED.file_mtime_ns,
+                        profiles = EXCLUDED.profiles, measurements = EXCLUDED.measurements,
+                        ingested_at = now()
+                    """,
+                    [(p["file_path"], p["file_size"], p["file_mtime_ns"], len(p["profiles"]), len(p["measurements"]))
+                     for p in batch],
+                )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        self.touched_months |= set(zip(profiles["year"].tolist(), profiles["month"].tolist()))
+        self.files += len(batch)
+        self.profiles += len(profiles)
+        self.measurements += len(measurements)
+
+
+def write_month_index(conn, index_dir, year, month):
+    """Rewrite {index_dir}/{year}/argo_in{year}{month}.txt (one row per float: position
+    extent and time span within the month) from the profiles table. The loader then reads
+    this file instead of any original index files for the month (see source_signature()).
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT float_id, MIN(latitude), MAX(latitude), MIN(longitude), MAX(longitude),
+                   MIN(profile_datetime), MAX(profile_datetime)
+            FROM profiles_{int(year)}
+            WHERE month = %s
+            GROUP BY float_id
+            ORDER BY float_id
+        """, (int(month),))
+        rows = cur.fetchall()
+    df = pd.DataFrame(rows, columns=["floatid", "latitude_min", "latitude_max", "longitude_min",
+                                     "longitude_max", "date_time_min", "date_time_max"])
+    folder = os.path.join(index_dir, str(year))
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, ingested_index_name(year, month))
+    tmp = f"{path}.tmp-{os.getpid()}"
+    df.to_csv(tmp, index=False, date_format="%Y-%m-%d %H:%M:%S")
+    # Atomic swap so the index cache never sees a half-written file
+    os.replace(tmp, path)
+    return path, len(df)
+
+
+def ingest(conn, paths, workers=None, batch_profiles=5000, index_dir=None, force=False):
+    """Load every NetCDF file under `paths` that is new or changed since the last run."""
+    started = time.perf_counter()
+    ingestor = Ingestor(conn, batch_profiles=batch_profiles)
+    files = find_netcdf_files(paths)
+    loaded = {} if force else ingestor.already_loaded()
+    todo = []
+    for path in files:
+        st = os.stat(path)
+        if loaded.get(path) != (st.st_size, st.st_mtime_ns):
+            todo.append(path)
+    logger.info(f"{len(files)} NetCDF files found, {len(files) - len(todo)} already loaded, {len(todo)} to ingest")
+
+    failed = []
+    last_report = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        queue = iter(todo)
+        in_flight = {}
+        # Keep a bounded number of parsed files in memory while the DB catches up
+        max_in_flight = workers * 4
+        while True:
+            while len(in_flight) < max_in_flight:
+                path = next(queue, None)
+                if path is None:
+                    break
+                in_flight[pool.submit(read_argo_file, path)] = path
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    parsed = future.result()
+                except Exception as e:
+                    logger.warning(f"Skipping {path}: {e}")
+                    failed.append(path)
+                    continue
+                ingestor.add(parsed)
+            if time.perf_counter() - last_report > 10:
+                last_report = time.perf_counter()
+                elapsed = last_report - started
+                logger.info(f"{ingestor.files}/{len(todo)} files, {ingestor.profiles} profiles "
+                            f"({ingestor.profiles / elapsed:.0f} profiles/s)")
+    ingestor.flush()
+
+    if ingestor.touched_months:
+        with conn.cursor() as cur:
+            for year in sorted(ingestor.known_years):
+                for parent in ("profiles", "measurements", "profile_stats"):
+                    cur.execute(f"ANALYZE {parent}_{int(year)}")
+        conn.commit()
+    if index_dir:
+        for year, month in sorted(ingestor.touched_months):
+            path, n_floats = write_month_index(conn, index_dir, year, month)
+            logger.info(f"Wrote {path} ({n_floats} floats)")
+
+    elapsed = time.perf_counter() - started
+    rate = ingestor.profiles / elapsed if elapsed else 0.0
+    logger.info(f"Ingested {ingestor.files} files, {ingestor.profiles} profiles, "
+                f"{ingestor.measurements} measurements in {elapsed:.1f}s ({rate:.0f} profiles/s, "
+                f"{ingestor.measurements / elapsed if elapsed else 0.0:.0f} measurements/s); {len(failed)} files failed")
+    return {
+        "files": ingestor.files,
+        "skipped": len(files) - len(todo),
+        "failed": failed,
+        "profiles": ingestor.profiles,
+        "measurements": ingestor.measurements,
+        "seconds": elapsed,
+        "profiles_per_second": rate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load Argo profile NetCDF files into Postgres")
+    parser.add_argument("paths", nargs="+", help="NetCDF files or directories to scan for *.nc")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--batch-profiles", type=int, default=5000, help="profiles per COPY batch/transaction")
+    parser.add_argument("--index-dir", default=None, help="where to write the monthly index files (default: data_root)")
+    parser.add_argument("--no-index", action="store_true", help="do not rewrite the monthly index files")
+    parser.add_argument("--force", action="store_true", help="reload files even if already ingested")
+    args = parser.parse_args()
+    configure_logging()
+
+    from final_backend_code import DB_CONFIG, data_root
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        ingest(
+            conn, args.paths,
+            workers=args.workers,
+            batch_profiles=args.batch_profiles,
+            index_dir=None if args.no_index else (args.index_dir or data_root),
+            force=args.force,
+        )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
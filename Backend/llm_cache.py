@@ -0,0 +1,131 @@
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from telemetry import get_logger
+
+
+logger = get_logger("llm_cache")
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so prompts that differ only in formatting share a cache entry."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def make_cache_key(prompt_text: str, conditions=None, model: str = "") -> str:
+    conditions_part = ",".join(sorted(set(conditions or [])))
+    raw = "\x1f".join([model, conditions_part, normalize_prompt(prompt_text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier cache of LLM answers keyed by make_cache_key().
+
+    - Memory tier: LRU bounded by entry count and total bytes of cached text.
+    - Disk tier: optional SQLiteCache shared by all workers; disk hits are promoted
+      into memory.
+    Entries expire after `ttl` seconds (default: the disk tier's) in both tiers; a promoted
+    entry keeps the expiry it was written with.
+    """
+
+    def __init__(self, disk=None, max_entries: int = 512, max_bytes: int = 8 * 1024 * 1024, ttl: float = None):
+        self.disk = disk
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, text)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _ttl(self):
+        if self.ttl is not None:
+            return self.ttl
+        return self.disk.default_ttl if self.disk is not None else None
+
+    def _remember(self, key: str, text: str, expires_at: float):
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1].encode("utf-8"))
+            self._entries[key] = (expires_at, text)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[1].encode("utf-8"))
+
+    def get(self, key: str):
+        """Cached answer for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                self._entries.pop(key)
+                self._bytes -= len(entry[1].encode("utf-8"))
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+        if self.disk is not None:
+            try:
+                found, payload = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk read failed: {e}")
+                found, payload = False, None
+            if found:
+                if isinstance(payload, str):
+                    # Written before expiries were stored; the disk tier still enforces its own
+                    ttl = self._ttl()
+                    payload = {"text": payload, "expires_at": now + ttl if ttl is not None else float("inf")}
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, payload["text"], payload["expires_at"])
+                return payload["text"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, text: str):
+        if not text:
+            return
+        ttl = self._ttl()
+        expires_at = time.time() + ttl if ttl is not None else float("inf")
+        self._remember(key, text, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, {"text": text, "expires_at": expires_at}, ttl=ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk write failed: {e}")
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
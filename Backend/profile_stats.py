@@ -0,0 +1,108 @@
+"""Maintenance of the precomputed profile_stats table.
+
+Ingest calls refresh_profile_stats(conn, year, profile_ids) for the profiles it just
+loaded. To rebuild from scratch:
+
+    python profile_stats.py --year 2019
+    python profile_stats.py --all
+"""
+import os
+import sys
+import argparse
+
+import psycopg2
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.append(CURRENT_DIR)
+
+from schema import ensure_year_partitions, list_partition_years  # noqa: E402
+from telemetry import configure_logging, get_logger  # noqa: E402
+
+
+logger = get_logger("profile_stats")
+
+
+STAT_COLUMNS = (
+    "measurement_count", "pressure_count", "temperature_count", "salinity_count",
+    "pressure_min", "pressure_max", "pressure_avg",
+    "temperature_min", "temperature_max", "temperature_avg",
+    "salinity_min", "salinity_max", "salinity_avg",
+)
+
+
+def build_upsert_sql(year, all_profiles=False):
+    """INSERT ... SELECT computing stats from measurements_{year} for a set of profiles (or all).
+    Profiles without measurements still get a row, with zero counts and NULL aggregates.
+    """
+    where = "" if all_profiles else "WHERE p.profile_id = ANY(%s)"
+    updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in STAT_COLUMNS)
+    return f"""
+        INSERT INTO profile_stats_{year} (profile_id, year, {", ".join(STAT_COLUMNS)}, updated_at)
+        SELECT p.profile_id, p.year,
+               COUNT(m.profile_id), COUNT(m.pressure), COUNT(m.temperature), COUNT(m.salinity),
+               MIN(m.pressure), MAX(m.pressure), AVG(m.pressure),
+               MIN(m.temperature), MAX(m.temperature), AVG(m.temperature),
+               MIN(m.salinity), MAX(m.salinity), AVG(m.salinity),
+               now()
+        FROM profiles_{year} p
+        LEFT JOIN measurements_{year} m ON m.profile_id = p.profile_id
+        {where}
+        GROUP BY p.profile_id, p.year
+        ON CONFLICT (profile_id, year) DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at
+    """
+
+
+def refresh_profile_stats(conn, year, profile_ids=None, commit=True):
+    """Recompute stats for `profile_ids` of `year` (or every profile of that year when None).
+    Returns the number of rows written.
+    """
+    year = int(year)
+    with conn.cursor() as cur:
+        if profile_ids is None:
+            cur.execute(build_upsert_sql(year, all_profiles=True))
+        else:
+            ids = [int(pid) for pid in profile_ids]
+            if not ids:
+                return 0
+            cur.execute(build_upsert_sql(year), (ids,))
+        written = cur.rowcount
+    if commit:
+        conn.commit()
+    return written
+
+
+def rebuild_year(conn, year):
+    """Drop and recompute all stats for one year."""
+    ensure_year_partitions(conn, year)
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE profile_stats_{int(year)}")
+    written = refresh_profile_stats(conn, year, commit=False)
+    with conn.cursor() as cur:
+        cur.execute(f"ANALYZE profile_stats_{int(year)}")
+    conn.commit()
+    logger.info(f"Rebuilt profile_stats_{year}: {written} profiles")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the precomputed profile_stats table")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--year", type=int, action="append", help="year to rebuild (repeatable)")
+    group.add_argument("--all", action="store_true", help="rebuild every year that has a profiles partition")
+    args = parser.parse_args()
+    configure_logging()
+
+    from final_backend_code import DB_CONFIG
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        years = list_partition_years(conn, "profiles") if args.all else args.year
+        for year in years:
+            rebuild_year(conn, year)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from columnar import CONDITIONS, PROFILE_FIELDS
+from sessions import estimate_tokens
+
+
+# Positions in a profiles_data row
+FLOAT_ID, LATITUDE, LONGITUDE, DEPTH_MIN, DEPTH_MAX, PROFILE_DATETIME = (
+    PROFILE_FIELDS.index(name)
+    for name in ("float_id", "latitude", "longitude", "depth_min", "depth_max", "profile_datetime")
+)
+
+
+def _fmt(val, precision=2):
+    return "Unknown" if val is None or pd.isna(val) else f"{float(val):.{precision}f}"
+
+
+def _frame(profiles_data, measurement_summaries) -> pd.DataFrame:
+    rows = list(profiles_data)
+    stats = pd.DataFrame.from_records(list(measurement_summaries), index=range(len(rows)))
+    df = pd.DataFrame({
+        "float_id": [r[FLOAT_ID] for r in rows],
+        "latitude": pd.to_numeric([r[LATITUDE] for r in rows], errors="coerce"),
+        "longitude": pd.to_numeric([r[LONGITUDE] for r in rows], errors="coerce"),
+        "depth_min": pd.to_numeric([r[DEPTH_MIN] for r in rows], errors="coerce"),
+        "depth_max": pd.to_numeric([r[DEPTH_MAX] for r in rows], errors="coerce"),
+        "datetime": pd.to_datetime([r[PROFILE_DATETIME] for r in rows], errors="coerce", utc=True),
+    })
+    for cond in CONDITIONS:
+        for agg in ("min", "max", "avg"):
+            col = f"{cond}_{agg}"
+            df[col] = pd.to_numeric(stats[col], errors="coerce") if col in stats else np.nan
+    return df
+
+
+def rollup_floats(profiles_data, measurement_summaries) -> pd.DataFrame:
+    """One row per float: profile count, time span, track extent, depth range, and for each
+    condition the min/max, mean of the profile averages and a linear trend (units per day)
+    of the profile averages over time. Floats keep their first-appearance order.
+    """
+    df = _frame(profiles_data, measurement_summaries)
+    days = (df["datetime"] - pd.Timestamp("1970-01-01", tz="UTC")) / pd.Timedelta(days=1)
+
+    aggs = {
+        "profiles": ("float_id", "size"),
+        "first": ("datetime", "min"),
+        "last": ("datetime", "max"),
+        "lat_min": ("latitude", "min"),
+        "lat_max": ("latitude", "max"),
+        "lon_min": ("longitude", "min"),
+        "lon_max": ("longitude", "max"),
+        "depth_min": ("depth_min", "min"),
+        "depth_max": ("depth_max", "max"),
+    }
+    for cond in CONDITIONS:
+        y = df[f"{cond}_avg"]
+        valid = y.notna() & days.notna()
+        # Per-float least squares slope from grouped sums: (nΣty − ΣtΣy) / (nΣt² − (Σt)²)
+        df[f"_{cond}_n"] = valid.astype(float)
+        df[f"_{cond}_t"] = days.where(valid, 0.0)
+        df[f"_{cond}_y"] = y.where(valid, 0.0)
+        df[f"_{cond}_ty"] = df[f"_{cond}_t"] * df[f"_{cond}_y"]
+        df[f"_{cond}_tt"] = df[f"_{cond}_t"] ** 2
+        aggs.update({
+            f"{cond}_min": (f"{cond}_min", "min"),
+            f"{cond}_max": (f"{cond}_max", "max"),
+            f"{cond}_avg": (f"{cond}_avg", "mean"),
+        })
+        for part in ("n", "t", "y", "ty", "tt"):
+            aggs[f"_{cond}_{part}"] = (f"_{cond}_{part}", "sum")
+
+    out = df.groupby("float_id", sort=False).agg(**aggs)
+    for cond in CONDITIONS:
+        n, t, y = out[f"_{cond}_n"], out[f"_{cond}_t"], out[f"_{cond}_y"]
+        denom = n * out[f"_{cond}_tt"] - t ** 2
+        slope = (n * out[f"_{cond}_ty"] - t * y) / denom.where(denom > 1e-9)
+        out[f"{cond}_trend"] = slope.where(n >= 2)
+    return out.drop(columns=[c for c in out.columns if c.startswith("_")])
+
+
+def _condition_lines(row, conditions):
+    lines = []
+    for cond in conditions:
+        line = (f"   • {cond.capitalize()}: min {_fmt(row[f'{cond}_min'])}, max {_fmt(row[f'{cond}_max'])}, "
+                f"avg {_fmt(row[f'{cond}_avg'])}")
+        trend = row.get(f"{cond}_trend")
+        if trend is not None and not pd.isna(trend):
+            line += ", trend flat" if abs(trend) < 5e-4 else f", trend {float(trend):+.3f}/day"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _date(val):
+    return val.strftime("%Y-%m-%d") if not pd.isna(val) else "Unknown"
+
+
+def format_float_rollup(float_id, row, conditions) -> str:
+    return f"""
+- Float ID: {float_id} ({int(row['profiles'])} profiles folded)
+- Dates: {_date(row['first'])} to {_date(row['last'])}
+- Track: Latitude {_fmt(row['lat_min'])} to {_fmt(row['lat_max'])}, Longitude {_fmt(row['lon_min'])} to {_fmt(row['lon_max'])}
+- Depth Range: {_fmt(row['depth_min'])} - {_fmt(row['depth_max'])} meters
+- Conditions:
+{_condition_lines(row, conditions)}
+"""
+
+
+def format_omitted(rollups: pd.DataFrame, conditions) -> str:
+    """One line covering the floats that did not fit the budget."""
+    ranges = "; ".join(
+        f"{cond} {_fmt(rollups[f'{cond}_min'].min())} to {_fmt(rollups[f'{cond}_max'].max())}"
+        for cond in conditions
+    )
+    return (f"\n- {len(rollups)} further floats ({int(rollups['profiles'].sum())} profiles) omitted to fit "
+            f"the prompt budget; combined ranges: {ranges}\n")
+
+
+def compact_profiles(profiles_data, measurement_summaries, requested_conditions=None,
+                     token_budget=1500, float_order=None):
+    """Per-float rollups of the profiles, cut to `token_budget` (estimated tokens).
+
+    Floats are listed in `float_order` (e.g. nearest first) when given; floats that do
+    not fit are summarized in a single trailing line. Returns (text, report) where the
+    report counts profiles, floats, profiles folded into rollups and floats omitted.
+    """
+    conditions = [c for c in CONDITIONS if not requested_conditions or c in requested_conditions]
+    rollups = rollup_floats(profiles_data, measurement_summaries)
+    if float_order is not None:
+        rank = {str(fid): i for i, fid in enumerate(float_order)}
+        order = sorted(range(len(rollups)), key=lambda i: rank.get(str(rollups.index[i]), len(rank)))
+        rollups = rollups.iloc[order]
+
+    header = (f"{len(profiles_data)} profiles from {len(rollups)} floats, rolled up per float "
+              f"(each entry folds all of that float's profiles in the time window).\n")
+    blocks = []
+    used = estimate_tokens(header)
+    # Reserve room for the trailing omitted-floats line
+    reserve = estimate_tokens(format_omitted(rollups.iloc[:1], conditions)) + 10
+    for float_id, row in rollups.iterrows():
+        block = format_float_rollup(float_id, row, conditions)
+        cost = estimate_tokens(block)
+        if blocks and used + cost + reserve > token_budget:
+            break
+        blocks.append(block)
+        used += cost
+
+    omitted = rollups.iloc[len(blocks):]
+    text = header + "".join(blocks)
+    if len(omitted):
+        text += format_omitted(omitted, conditions)
+
+    kept = rollups.iloc[:len(blocks)]
+    report = {
+        "profiles": len(profiles_data),
+        "floats": len(rollups),
+        "floats_listed": len(kept),
+        "floats_omitted": len(omitted),
+        "profiles_folded": int(kept["profiles"][kept["profiles"] > 1].sum()),
+        "profiles_omitted": int(omitted["profiles"].sum()),
+        "estimated_tokens": estimate_tokens(text),
+    }
+    return text, report
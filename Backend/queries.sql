@@ -70,3 +70,77 @@ BEGIN
                  FOR VALUES IN ({year});';
     END IF;
 END $$;
+
+
+-- PROFILE_STATS TABLE (Parent)
+-- Precomputed per-profile measurement statistics (min/max/avg and counts).
+-- Measurements never change once loaded, so these are computed once at
+-- ingest time instead of aggregating raw measurements on every request.
+-- Rebuild with: python profile_stats.py --year {year}   (or --all)
+CREATE TABLE profile_stats (
+    profile_id INT NOT NULL,                    -- Links back to profile_id
+    year INT NOT NULL,                          -- Year (used for partitioning)
+    measurement_count INT NOT NULL,             -- Number of measurement rows
+    pressure_count INT NOT NULL,                -- Non-null pressure values
+    temperature_count INT NOT NULL,             -- Non-null temperature values
+    salinity_count INT NOT NULL,                -- Non-null salinity values
+    pressure_min DOUBLE PRECISION,
+    pressure_max DOUBLE PRECISION,
+    pressure_avg DOUBLE PRECISION,
+    temperature_min DOUBLE PRECISION,
+    temperature_max DOUBLE PRECISION,
+    temperature_avg DOUBLE PRECISION,
+    salinity_min DOUBLE PRECISION,
+    salinity_max DOUBLE PRECISION,
+    salinity_avg DOUBLE PRECISION,
+    updated_at TIMESTAMP NOT NULL DEFAULT now(), -- When the row was last recomputed
+    PRIMARY KEY (profile_id, year),             -- One row per profile
+    FOREIGN KEY (profile_id, year)              -- Reference to profiles table
+        REFERENCES profiles(profile_id, year)
+        ON DELETE CASCADE                       -- Drop stats with their profile
+) PARTITION BY LIST (year);                     -- Partitioning strategy (list by year)
+
+
+-- PARTITION CREATION BLOCK FOR PROFILE_STATS
+-- Same as above, one partition per year.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'profile_stats_{year}' AND n.nspname = 'public'
+    ) THEN
+        EXECUTE 'CREATE TABLE profile_stats_{year} 
+                 PARTITION OF profile_stats 
+                 FOR VALUES IN ({year});';
+    END IF;
+END $$;
+
+
+-- INGEST_FILES TABLE
+-- One row per NetCDF file loaded by ingest.py (created by it if missing).
+-- Files whose size and mtime still match are skipped on the next run,
+-- which makes ingest runs resumable and idempotent.
+CREATE TABLE IF NOT EXISTS ingest_files (
+    file_path TEXT PRIMARY KEY,                 -- Absolute path of the source file
+    file_size BIGINT NOT NULL,                  -- Size when it was loaded
+    file_mtime_ns BIGINT NOT NULL,              -- Modification time when it was loaded
+    profiles INT NOT NULL,                      -- Profiles loaded from the file
+    measurements INT NOT NULL,                  -- Measurement rows loaded from the file
+    ingested_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+
+-- PARTITION INDEXES
+-- Created per year partition by schema.py (automatically for partitions it
+-- creates; `python schema.py --all --ensure-indexes --concurrently` backfills
+-- existing ones, `python schema.py --all --check` verifies the query plans).
+-- NOTE: Replace {year} with the actual year before running.
+CREATE INDEX IF NOT EXISTS profiles_{year}_float_time_idx
+    ON profiles_{year} USING btree (float_id, profile_datetime);   -- nearest-float fetch by time window
+CREATE INDEX IF NOT EXISTS profiles_{year}_time_brin
+    ON profiles_{year} USING brin (profile_datetime);              -- time window scans
+CREATE INDEX IF NOT EXISTS profiles_{year}_file_path_idx
+    ON profiles_{year} USING btree (file_path);                    -- replace a re-ingested file's rows
+CREATE INDEX IF NOT EXISTS measurements_{year}_profile_id_idx
+    ON measurements_{year} USING btree (profile_id);               -- per-profile aggregates
@@ -0,0 +1,45 @@
+from columnar import CONDITIONS
+
+
+def build_region_stats_sql(crosses_antimeridian: bool):
+    """Profile count, distinct floats and per-condition min/max/mean over a box and window,
+    read from the precomputed profile_stats rows (one scan of the pruned yearly partitions).
+    Means are over the per-profile averages, so every profile weighs the same.
+    """
+    aggregates = ",\n               ".join(
+        f"MIN(s.{c}_min), MAX(s.{c}_max), AVG(s.{c}_avg)" for c in CONDITIONS
+    )
+    lon_clause = ("(p.longitude >= %s OR p.longitude <= %s)" if crosses_antimeridian
+                  else "p.longitude BETWEEN %s AND %s")
+    return f"""
+        SELECT COUNT(*), COUNT(DISTINCT p.float_id), COUNT(s.profile_id),
+               {aggregates}
+        FROM profiles p
+        LEFT JOIN profile_stats s ON s.profile_id = p.profile_id AND s.year = p.year
+        WHERE p.year BETWEEN %s AND %s
+          AND p.profile_datetime BETWEEN %s AND %s
+          AND p.latitude BETWEEN %s AND %s
+          AND {lon_clause}
+    """
+
+
+def query_region_stats(conn, bbox, start_date, end_date):
+    """Summary of the profiles inside `bbox` (lat_min, lat_max, lon_min, lon_max; lon_min >
+    lon_max crosses the antimeridian) between start_date and end_date.
+    """
+    lat_min, lat_max, lon_min, lon_max = bbox
+    params = (start_date.year, end_date.year, start_date, end_date, lat_min, lat_max, lon_min, lon_max)
+    with conn.cursor() as cur:
+        cur.execute(build_region_stats_sql(lon_min > lon_max), params)
+        row = cur.fetchone()
+    profiles, floats, with_stats = row[:3]
+    stats = {}
+    for i, condition in enumerate(CONDITIONS):
+        low, high, mean = row[3 + 3 * i:6 + 3 * i]
+        stats[condition] = {"min": low, "max": high, "mean": mean}
+    return {
+        "profiles": profiles,
+        "floats": floats,
+        "profiles_with_stats": with_stats,
+        **stats,
+    }
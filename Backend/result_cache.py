@@ -0,0 +1,178 @@
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+
+import orjson
+
+from columnar import ProfileColumns, PROFILE_FIELDS
+from telemetry import get_logger
+
+
+logger = get_logger("result_cache")
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+PROFILE_DATETIME_POS = PROFILE_FIELDS.index("profile_datetime")
+
+
+def geohash_cell(lat: float, lon: float, precision: int = 5):
+    """Geohash of (lat, lon) at `precision` characters and the centre of its cell.
+    Precision 5 cells are about 4.9 × 4.9 km at the equator, 4 about 39 × 20 km.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    lon = ((lon + 180.0) % 360.0) - 180.0
+    chars = []
+    bits, value, even = 0, 0, True
+    while len(chars) < precision:
+        target, span = (lon, lon_range) if even else (lat, lat_range)
+        mid = (span[0] + span[1]) / 2
+        value <<= 1
+        if target >= mid:
+            value |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    center = ((lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2)
+    return "".join(chars), center
+
+
+def make_result_key(cell: str, start_date, end_date, radius_km=None, k=10, mode="", version="") -> str:
+    """`version` identifies the loaded data (see data_version()), so an ingest starts fresh entries."""
+    window = f"{start_date.isoformat() if start_date else ''}/{end_date.isoformat() if end_date else ''}"
+    return "|".join([cell, window, str(radius_km or ""), str(k), mode or "", version or ""])
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "item"):  # NumPy scalar
+        return value.item()
+    return value
+
+
+def encode_rows(rows):
+    """Fetch rows as JSON-safe lists (datetimes as ISO strings)."""
+    return [[_plain(v) for v in row] for row in rows]
+
+
+def decode_rows(rows):
+    out = []
+    for row in rows:
+        row = list(row)
+        when = row[PROFILE_DATETIME_POS]
+        if isinstance(when, str):
+            row[PROFILE_DATETIME_POS] = datetime.fromisoformat(when)
+        out.append(tuple(row))
+    return out
+
+
+class QueryResultCache:
+    """Nearest-float ids and fetched profiles per quantized query (see make_result_key).
+    Callers verify a hit against their own search (see record_mismatch()).
+
+    - Memory tier: LRU bounded by entry count and the encoded size of the cached rows.
+    - Disk tier: optional SQLiteCache shared by all workers; disk hits are promoted
+      into memory.
+    Entries expire after `ttl` seconds in both tiers so newly ingested profiles show up.
+    """
+
+    def __init__(self, disk=None, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024, ttl: float = 3600.0):
+        self.disk = disk
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, nearest_ids, columns)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.mismatches = 0
+
+    def _remember(self, key: str, nearest_ids, columns, size: int, expires_at: float):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (expires_at, size, nearest_ids, columns)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[1]
+
+    def get(self, key: str):
+        """(nearest_ids, ProfileColumns) cached for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                self._entries.pop(key)
+                self._bytes -= entry[1]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return list(entry[2]), entry[3]
+        if self.disk is not None:
+            try:
+                found, payload = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk read failed: {e}")
+                found, payload = False, None
+            if found:
+                columns = ProfileColumns.from_rows(decode_rows(payload["rows"]))
+                self._remember(key, payload["nearest_ids"], columns, payload["size"], payload["expires_at"])
+                with self._lock:
+                    self.disk_hits += 1
+                return list(payload["nearest_ids"]), columns
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, nearest_ids, columns: ProfileColumns):
+        nearest_ids = [_plain(fid) for fid in nearest_ids]
+        rows = encode_rows(columns.rows)
+        size = len(orjson.dumps(rows))
+        expires_at = time.time() + self.ttl
+        self._remember(key, nearest_ids, columns, size, expires_at)
+        if self.disk is not None and size <= self.max_bytes:
+            payload = {"nearest_ids": nearest_ids, "rows": rows, "size": size, "expires_at": expires_at}
+            try:
+                self.disk.set(key, payload, ttl=self.ttl)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk write failed: {e}")
+
+    def record_mismatch(self):
+        """Count a hit the caller rejected because its own search found other floats."""
+        with self._lock:
+            self.mismatches += 1
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits - self.mismatches
+            return {
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "mismatches": self.mismatches,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,248 @@
+"""Partition and index management for the year-partitioned tables defined in queries.sql.
+
+    python schema.py --all --ensure-indexes --concurrently
+    python schema.py --year 2019 --check
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+import psycopg2
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+if CURRENT_DIR not in sys.path:
+    sys.path.append(CURRENT_DIR)
+
+from telemetry import configure_logging, get_logger  # noqa: E402
+
+
+logger = get_logger("schema")
+
+# Parent tables partitioned by LIST (year), in dependency order
+PARTITIONED_TABLES = ("profiles", "measurements", "profile_stats")
+
+# Secondary indexes every year partition gets, as (name suffix, method, columns):
+# - profiles: float_id = ANY(...) AND profile_datetime BETWEEN ... (nearest-float fetch),
+#   and BRIN on time for window scans (tiny, since rows arrive roughly in time order),
+#   and file_path for replacing the rows of a re-ingested file
+# - measurements: the per-profile aggregates and ingest-time stats refresh filter on profile_id
+# profile_stats is covered by its (profile_id, year) primary key.
+PARTITION_INDEXES = {
+    "profiles": (
+        ("float_time_idx", "btree", "(float_id, profile_datetime)"),
+        ("time_brin", "brin", "(profile_datetime)"),
+        ("file_path_idx", "btree", "(file_path)"),
+    ),
+    "measurements": (
+        ("profile_id_idx", "btree", "(profile_id)"),
+    ),
+}
+
+
+def partition_exists(cur, table: str) -> bool:
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return cur.fetchone()[0]
+
+
+def ensure_year_partitions(conn, year, tables=PARTITIONED_TABLES):
+    """Create `{table}_{year}` partitions that do not exist yet. Returns the names created."""
+    year = int(year)
+    created = []
+    with conn.cursor() as cur:
+        for parent in tables:
+            name = f"{parent}_{year}"
+            if partition_exists(cur, name):
+                continue
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} FOR VALUES IN ({year})")
+            created.append(name)
+    conn.commit()
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+        ensure_partition_indexes(conn, year, tables=[t for t in tables if f"{t}_{year}" in created])
+    return created
+
+
+def existing_indexes(cur, table: str):
+    """[(indexdef, is_valid)] for the indexes on `table`."""
+    cur.execute("""
+        SELECT pg_get_indexdef(i.indexrelid), i.indisvalid
+        FROM pg_index i
+        WHERE i.indrelid = to_regclass(%s)
+    """, (table,))
+    return cur.fetchall()
+
+
+def missing_indexes(conn, year, tables=PARTITIONED_TABLES):
+    """[(table, name, method, columns)] of the PARTITION_INDEXES not present (or invalid) on
+    the year's partitions. Indexes are matched by definition, not by name.
+    """
+    year = int(year)
+    missing = []
+    with conn.cursor() as cur:
+        for parent in tables:
+            table = f"{parent}_{year}"
+            if not partition_exists(cur, table):
+                continue
+            defs = existing_indexes(cur, table)
+            for suffix, method, columns in PARTITION_INDEXES.get(parent, ()):
+                wanted = f"USING {method} {columns}"
+                if not any(wanted in indexdef and valid for indexdef, valid in defs):
+                    missing.append((table, f"{table}_{suffix}", method, columns))
+    return missing
+
+
+def ensure_partition_indexes(conn, year, tables=PARTITIONED_TABLES, concurrently=False):
+    """Create the PARTITION_INDEXES missing on the year's partitions. Returns the names created.
+
+    With `concurrently`, indexes are built with CREATE INDEX CONCURRENTLY (no write lock on
+    a live partition; runs outside a transaction, so the connection is switched to autocommit
+    for the duration).
+    """
+    todo = missing_indexes(conn, year, tables)
+    if not todo:
+        return []
+    created = []
+    previous_autocommit = conn.autocommit
+    if concurrently and not previous_autocommit:
+        conn.commit()
+        conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for table, name, method, columns in todo:
+                # Drop a leftover invalid build (e.g. an interrupted CONCURRENTLY run) first
+                cur.execute(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}")
+                cur.execute(
+                    f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} ON {table} USING {method} {columns}"
+                )
+                created.append(name)
+        if not conn.autocommit:
+            conn.commit()
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        raise
+    finally:
+        if conn.autocommit != previous_autocommit:
+            conn.autocommit = previous_autocommit
+    logger.info(f"Created indexes: {', '.join(created)}")
+    return created
+
+
+def list_partition_years(conn, parent: str = "profiles"):
+    """Years that currently have a partition of `parent`."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s
+        """, (parent,))
+        names = [row[0] for row in cur.fetchall()]
+    prefix = f"{parent}_"
+    return sorted(int(n[len(prefix):]) for n in names if n.startswith(prefix) and n[len(prefix):].isdigit())
+
+
+def _full_scans(plan, relations):
+    """Relation names from `relations` read in full somewhere in an EXPLAIN plan: a Seq Scan,
+    or an index scan without an Index Cond (walks the whole index, e.g. the primary key).
+    """
+    found = []
+    node = plan.get("Node Type")
+    if plan.get("Relation Name") in relations and (
+        node == "Seq Scan" or (node in ("Index Scan", "Index Only Scan") and "Index Cond" not in plan)
+    ):
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        found.extend(_full_scans(child, relations))
+    return found
+
+
+def hot_queries(conn, year):
+    """(label, sql, params) for the queries the API runs on every request, with parameters
+    sampled from the partition.
+    """
+    from final_backend_code import build_profiles_from_stats_sql, build_profiles_with_stats_sql
+
+    year = int(year)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT DISTINCT float_id FROM profiles_{year} LIMIT 10")
+        float_ids = [row[0] for row in cur.fetchall()] or [0]
+    conn.rollback()
+    start, end = datetime(year, 1, 1), datetime(year, 1, 31, 23, 59, 59)
+    return [
+        ("profiles + profile_stats by float and time", build_profiles_from_stats_sql(year, True), (float_ids, start, end)),
+        ("profiles + measurement aggregates by float and time", build_profiles_with_stats_sql(year, True), (float_ids, start, end)),
+        ("profiles in a time window",
+         f"SELECT profile_id, float_id FROM profiles_{year} WHERE profile_datetime BETWEEN %s AND %s",
+         (start, end)),
+    ]
+
+
+def check_query_plans(conn, year, natural=False):
+    """EXPLAIN the hot queries for `year` and return [(label, fully scanned relations)] for
+    the ones that read a whole partition.
+
+    By default sequential scans, hash joins and merge joins are disabled for the check, so
+    the planner picks the index-driven plan it would use on large partitions and falls back
+    to a full scan only when no index can serve the query; that makes the result independent
+    of table size. With `natural`, the planner's own choice is checked (meaningful on
+    production-size data, where small partitions would otherwise always seq scan).
+    """
+    year = int(year)
+    relations = {f"{parent}_{year}" for parent in PARTITIONED_TABLES}
+    failures = []
+    for label, sql, params in hot_queries(conn, year):
+        with conn.cursor() as cur:
+            if not natural:
+                for setting in ("enable_seqscan", "enable_hashjoin", "enable_mergejoin"):
+                    cur.execute(f"SET LOCAL {setting} = off")
+            cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+        conn.rollback()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scanned = sorted(set(_full_scans(plan[0]["Plan"], relations)))
+        if scanned:
+            logger.warning(f"{year} {label}: FULL SCAN of {', '.join(scanned)}")
+            failures.append((label, scanned))
+        else:
+            logger.info(f"{year} {label}: ok")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage partition indexes and check query plans")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--year", type=int, action="append", help="year to process (repeatable)")
+    group.add_argument("--all", action="store_true", help="every year that has a profiles partition")
+    parser.add_argument("--ensure-indexes", action="store_true", help="create missing partition indexes")
+    parser.add_argument("--concurrently", action="store_true", help="build indexes with CREATE INDEX CONCURRENTLY")
+    parser.add_argument("--check", action="store_true", help="fail if a hot query reads a whole partition")
+    parser.add_argument("--natural", action="store_true", help="check the planner's own choice (seq scans allowed)")
+    args = parser.parse_args()
+    configure_logging()
+
+    from final_backend_code import DB_CONFIG
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    failed = False
+    try:
+        years = list_partition_years(conn, "profiles") if args.all else args.year
+        for year in years:
+            if args.ensure_indexes:
+                ensure_partition_indexes(conn, year, concurrently=args.concurrently)
+            missing = missing_indexes(conn, year)
+            for table, name, method, columns in missing:
+                logger.warning(f"Missing index on {table}: {method} {columns}")
+            if args.check:
+                failed |= bool(missing) or bool(check_query_plans(conn, year, natural=args.natural))
+    finally:
+        conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
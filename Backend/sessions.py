@@ -0,0 +1,104 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting history."""
+    return len(text or "") // 4 + 1
+
+
+class Session:
+    """Conversation state for one client: a token-budgeted history window and the
+    last query's results for follow-ups ("give me in table").
+    """
+
+    def __init__(self, session_id: str, history_token_budget: int):
+        self.id = session_id
+        self.history_token_budget = history_token_budget
+        self.history = []
+        self.history_tokens = 0
+        self.last_state = None
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+
+    def history_messages(self):
+        with self.lock:
+            return list(self.history)
+
+    def add_exchange(self, human_text: str, ai_text: str):
+        """Append one question/answer pair, then drop the oldest pairs until the window
+        fits the token budget. An exchange larger than the whole budget is not kept.
+        """
+        from langchain_core.messages import AIMessage, HumanMessage  # deferred: slow to import
+        with self.lock:
+            self.history.extend([HumanMessage(content=human_text), AIMessage(content=ai_text or "")])
+            self.history_tokens += estimate_tokens(human_text) + estimate_tokens(ai_text)
+            while self.history and self.history_tokens > self.history_token_budget:
+                for msg in self.history[:2]:
+                    self.history_tokens -= estimate_tokens(msg.content)
+                del self.history[:2]
+
+    def clear_history(self):
+        with self.lock:
+            self.history = []
+            self.history_tokens = 0
+
+
+class SessionStore:
+    """Sessions keyed by conversation id, evicted after `ttl` seconds of inactivity or
+    when more than `max_sessions` exist (least recently used first).
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600.0, history_token_budget: int = 2000):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.history_token_budget = history_token_budget
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _evict(self, now: float):
+        while self._sessions:
+            _, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_seen <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def get(self, session_id: str = None) -> Session:
+        """Return the session for `session_id`, creating it (with a new id if none was given)."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex, self.history_token_budget)
+                self._sessions[session.id] = session
+                self.created += 1
+            session.last_seen = now
+            self._sessions.move_to_end(session.id)
+            self._evict(now)
+        return session
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl,
+                "history_token_budget": self.history_token_budget,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+
+from telemetry import Counter, METRICS
+
+
+COALESCED_TOTAL = Counter(
+    "floatchat_singleflight_total",
+    "Calls through a single-flight group, by whether they ran the work or shared another call's result.",
+    ("group", "outcome"),
+)
+METRICS.append(COALESCED_TOTAL)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent identical work: while a call for `key` is running, further calls
+    with the same key wait for it and share its result (or exception) instead of running
+    again. Nothing is kept once the call finishes; caching is the caller's job.
+
+    `run()` coordinates threads, `arun()` coroutines on the event loop. Both return
+    (result, shared) where shared is True for callers that reused another call's result.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._tasks = {}  # key -> [task, waiters]
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def _count(self, shared: bool):
+        with self._lock:
+            if shared:
+                self.shared += 1
+            else:
+                self.executed += 1
+        COALESCED_TOTAL.inc(group=self.name, outcome="shared" if shared else "executed")
+
+    def run(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        self._count(not leader)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn(*args)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def arun(self, key, fn, *args):
+        """`await fn(*args)` shared by concurrent callers. The work runs as its own task and
+        is cancelled only when every caller waiting on it has been cancelled.
+        """
+        with self._lock:
+            entry = self._tasks.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._tasks[key] = [asyncio.ensure_future(fn(*args)), 0]
+                entry[0].add_done_callback(lambda _: self._forget(key, entry))
+            entry[1] += 1
+        self._count(not leader)
+        task = entry[0]
+        try:
+            return await asyncio.shield(task), not leader
+        except asyncio.CancelledError:
+            if not task.done():
+                with self._lock:
+                    entry[1] -= 1
+                    abandoned = entry[1] == 0
+                    if abandoned and self._tasks.get(key) is entry:
+                        # Later callers start fresh rather than joining a cancelled task
+                        del self._tasks[key]
+                if abandoned:
+                    task.cancel()
+            raise
+
+    def _forget(self, key, entry):
+        with self._lock:
+            if self._tasks.get(key) is entry:
+                del self._tasks[key]
+        # The work's exception is re-raised to its waiters; don't report it as never retrieved
+        if not entry[0].cancelled():
+            entry[0].exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._tasks),
+                "executed": self.executed,
+                "shared": self.shared,
+            }
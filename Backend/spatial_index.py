@@ -0,0 +1,270 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from telemetry import get_logger
+
+
+logger = get_logger("spatial_index")
+
+
+# np.isclose(a, b, atol=1e-3) tolerance used for the exact coordinate match
+EXACT_MATCH_ATOL = 1e-3
+EXACT_MATCH_RTOL = 1e-5
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vectors(latitudes, longitudes):
+    """Embed (lat, lon) degrees as 3D points on the unit sphere.
+    Euclidean (chord) distance between them is monotonic in great-circle distance,
+    so an L2 kNN over these vectors returns geodesically nearest neighbours.
+    """
+    lat = np.radians(np.asarray(latitudes, dtype="float64"))
+    lon = np.radians(np.asarray(longitudes, dtype="float64"))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; broadcasts over NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype="float64")) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def km_to_chord(radius_km):
+    """Straight-line distance on the unit sphere for an arc of `radius_km`."""
+    angle = min(float(radius_km) / EARTH_RADIUS_KM, np.pi)
+    return 2.0 * np.sin(angle / 2.0)
+
+
+def normalize_longitude(lon):
+    """Map longitudes into [-180, 180)."""
+    return (np.asarray(lon, dtype="float64") + 180.0) % 360.0 - 180.0
+
+
+class MonthIndex:
+    """Nearest-float search structure for one filtered slice of the float index.
+
+    Holds the FAISS index over profile centroids together with the side arrays
+    (float id, file path, centroid lat/lon) needed to answer a query, so it can be
+    built once and reused for every query against the same month/date window.
+    """
+
+    def __init__(self, latitudes, longitudes, float_ids, file_paths):
+        import faiss  # deferred to the first index build; it is slow to import
+        self.latitudes = np.asarray(latitudes, dtype="float64")
+        self.longitudes = np.asarray(longitudes, dtype="float64")
+        self.float_ids = np.asarray(float_ids, dtype=object)
+        self.file_paths = np.asarray(file_paths, dtype=object)
+        self.size = len(self.latitudes)
+
+        self.vectors = np.ascontiguousarray(
+            np.column_stack([self.latitudes, self.longitudes]), dtype="float32"
+        )
+        self.index = faiss.IndexFlatL2(2)
+        if self.size:
+            self.index.add(self.vectors)
+
+        # Same points on the unit sphere for geodesic queries
+        self.sphere_vectors = np.ascontiguousarray(to_unit_vectors(self.latitudes, self.longitudes), dtype="float32")
+        self.sphere_index = faiss.IndexFlatL2(3)
+        if self.size:
+            self.sphere_index.add(self.sphere_vectors)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a (filtered) index DataFrame using vectorized column math."""
+        if df.empty:
+            return cls([], [], [], [])
+        latitudes = ((df['latitude_min'] + df['latitude_max']) / 2).to_numpy(dtype="float64")
+        longitudes = ((df['longitude_min'] + df['longitude_max']) / 2).to_numpy(dtype="float64")
+        return cls(latitudes, longitudes, df['floatid'].astype(str).to_numpy(), df['file_path'].to_numpy())
+
+    def exact_match(self, query_lat, query_lon):
+        """Return the first row whose centroid matches the query within np.isclose tolerance, or None."""
+        idx = self.exact_matches([query_lat], [query_lon])[0]
+        return None if idx < 0 else int(idx)
+
+    def exact_matches(self, latitudes, longitudes):
+        """exact_match() for many queries with one range search; -1 where nothing matches."""
+        lats = np.asarray(latitudes, dtype="float64")
+        lons = np.asarray(longitudes, dtype="float64")
+        out = np.full(len(lats), -1, dtype=np.int64)
+        if not self.size or not len(lats):
+            return out
+        tol_lat = EXACT_MATCH_ATOL + EXACT_MATCH_RTOL * np.abs(lats)
+        tol_lon = EXACT_MATCH_ATOL + EXACT_MATCH_RTOL * np.abs(lons)
+        # Any match lies inside the L2 ball that circumscribes the (largest) tolerance box
+        radius_sq = float(np.max(tol_lat ** 2 + tol_lon ** 2)) * 1.0001
+        queries = np.ascontiguousarray(np.column_stack([lats, lons]), dtype="float32")
+        lims, _, labels = self.index.range_search(queries, radius_sq)
+        for q in range(len(lats)):
+            candidates = np.sort(labels[lims[q]:lims[q + 1]])
+            ok = ((np.abs(self.latitudes[candidates] - lats[q]) <= tol_lat[q])
+                  & (np.abs(self.longitudes[candidates] - lons[q]) <= tol_lon[q]))
+            if ok.any():
+                out[q] = candidates[np.argmax(ok)]
+        return out
+
+    def _collect(self, labels, k, distances=None):
+        """Float ids, file paths (and distances) of the first k rows, one entry per float."""
+        ids, files, dists = [], [], []
+        seen = set()
+        for i, idx in enumerate(labels[:k]):
+            fid = self.float_ids[idx]
+            if fid in seen:
+                continue
+            seen.add(fid)
+            ids.append(fid)
+            files.append(self.file_paths[idx])
+            if distances is not None:
+                dists.append(float(distances[i]))
+        return ids, files, dists
+
+    def search(self, query_lat, query_lon, k=10):
+        """kNN over centroids in (lat, lon) degrees.
+        Returns (float_ids, file_paths) deduplicated by float id, nearest first, with an
+        exact coordinate match (if any) promoted to the front.
+        """
+        if not self.size:
+            logger.info("No data for FAISS search")
+            return [], []
+        ids, files = self.search_batch([query_lat], [query_lon], k=k)[0]
+        logger.info(f"FAISS search found {len(ids)} closest floats")
+        return ids, files
+
+    def search_batch(self, latitudes, longitudes, k=10):
+        """search() for many points with one FAISS call; one (float_ids, file_paths) per point."""
+        if not self.size:
+            return [([], []) for _ in latitudes]
+        queries = np.ascontiguousarray(np.column_stack([latitudes, longitudes]), dtype="float32")
+        _, indices = self.index.search(queries, k=min(k, self.size))
+        exact = self.exact_matches(latitudes, longitudes)
+        results = []
+        for row, exact_idx in zip(indices, exact):
+            ids, files, _ = self._collect(row[row >= 0], k)
+            if exact_idx >= 0 and self.float_ids[exact_idx] not in ids:
+                logger.info(f"Exact coordinate match found → Float ID {self.float_ids[exact_idx]}")
+                ids.insert(0, self.float_ids[exact_idx])
+                files.insert(0, self.file_paths[exact_idx])
+            results.append((ids, files))
+        return results
+
+    def search_geodesic(self, query_lat, query_lon, k=10, radius_km=None):
+        """kNN by great-circle distance, optionally restricted to floats within `radius_km`.
+        Returns (float_ids, file_paths, distances_km) deduplicated by float id, nearest first.
+        Correct at high latitudes and across the antimeridian, unlike search().
+        """
+        if not self.size:
+            logger.info("No data for geodesic search")
+            return [], [], []
+        ids, files, dists = self.search_geodesic_batch([query_lat], [query_lon], k=k, radius_km=radius_km)[0]
+        within = f" within {radius_km:g} km" if radius_km is not None else ""
+        logger.info(f"Geodesic search found {len(ids)} closest floats{within}")
+        for i, (fid, dist) in enumerate(zip(ids, dists), 1):
+            logger.debug(f"   → Closest #{i}: Float ID {fid} at {dist:.1f} km")
+        return ids, files, dists
+
+    def search_geodesic_batch(self, latitudes, longitudes, k=10, radius_km=None):
+        """search_geodesic() for many points with one FAISS call; one
+        (float_ids, file_paths, distances_km) per point.
+        """
+        lats = np.asarray(latitudes, dtype="float64")
+        lons = np.asarray(longitudes, dtype="float64")
+        if not self.size:
+            return [([], [], []) for _ in lats]
+        queries = np.ascontiguousarray(to_unit_vectors(lats, lons), dtype="float32")
+        if radius_km is not None:
+            # FAISS L2 indexes compare squared distances
+            chord = km_to_chord(radius_km)
+            lims, dist_sq, all_labels = self.sphere_index.range_search(queries, chord * chord)
+            per_point = []
+            for q in range(len(lats)):
+                labels = all_labels[lims[q]:lims[q + 1]]
+                per_point.append(labels[np.argsort(dist_sq[lims[q]:lims[q + 1]], kind="stable")])
+        else:
+            _, indices = self.sphere_index.search(queries, k=min(k, self.size))
+            per_point = [row[row >= 0] for row in indices]
+
+        exact = self.exact_matches(lats, lons)
+        results = []
+        for q, labels in enumerate(per_point):
+            # Only the first k rows count, as in search(); floats with several rows collapse to one
+            labels = labels[:k]
+            distances = haversine_km(lats[q], lons[q], self.latitudes[labels], self.longitudes[labels])
+            ids, files, dists = self._collect(labels, k, distances)
+            exact_idx = exact[q]
+            if exact_idx >= 0 and self.float_ids[exact_idx] not in ids:
+                logger.info(f"Exact coordinate match found → Float ID {self.float_ids[exact_idx]}")
+                ids.insert(0, self.float_ids[exact_idx])
+                files.insert(0, self.file_paths[exact_idx])
+                dists.insert(0, 0.0)
+            results.append((ids, files, dists))
+        return results
+
+    def search_bbox(self, lat_min, lat_max, lon_min, lon_max):
+        """Floats whose centroid lies in the box. If lon_min > lon_max the box crosses the
+        antimeridian (e.g. 170 → -170). Returns (float_ids, file_paths) in index order.
+        """
+        if not self.size:
+            return [], []
+        lons = normalize_longitude(self.longitudes)
+        lo, hi = normalize_longitude(lon_min), normalize_longitude(lon_max)
+        if lon_max - lon_min >= 360:
+            in_lon = np.ones(self.size, dtype=bool)
+        elif lo <= hi:
+            in_lon = (lons >= lo) & (lons <= hi)
+        else:
+            in_lon = (lons >= lo) | (lons <= hi)
+        mask = in_lon & (self.latitudes >= lat_min) & (self.latitudes <= lat_max)
+
+        ids, files = [], []
+        seen = set()
+        for idx in np.flatnonzero(mask):
+            fid = self.float_ids[idx]
+            if fid not in seen:
+                seen.add(fid)
+                ids.append(fid)
+                files.append(self.file_paths[idx])
+        logger.info(f"Bounding box search found {len(ids)} floats")
+        return ids, files
+
+
+class IndexLRU:
+    """Bounded LRU of built MonthIndex objects keyed by (year, month, window, source signature)."""
+
+    def __init__(self, max_entries: int = 24):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, builder):
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return index
+            self.misses += 1
+
+        index = builder()
+        with self._lock:
+            self._entries[key] = index
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {"entries": size, "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,71 @@
+import os
+import time
+import sqlite3
+import threading
+
+import orjson
+
+
+class SQLiteCache:
+    """Small persistent key/value cache with per-entry TTL, shared across worker processes.
+
+    Values are stored as JSON. The database runs in WAL mode so several uvicorn workers
+    can read and write the same file concurrently. Each thread gets its own connection.
+    """
+
+    def __init__(self, path: str, table: str = "cache", default_ttl: float = 86400.0):
+        self.path = path
+        self.table = table
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                        "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+                    )
+                    self._initialized = True
+        return conn
+
+    def get(self, key: str):
+        """Return (found, value). Expired entries count as not found."""
+        row = self._conn().execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return False, None
+        if row[1] < time.time():
+            self.delete(key)
+            return False, None
+        return True, orjson.loads(row[0])
+
+    def set(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, orjson.dumps(value), expires_at),
+        )
+
+    def delete(self, key: str):
+        self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        cur = self._conn().execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+        return cur.rowcount
+
+    def __len__(self):
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
@@ -0,0 +1,297 @@
+"""Logging setup, per-request stage tracing and Prometheus metrics.
+
+Stages are timed with `@timed("name")` (sync, async and async-generator functions) or
+`with stage("name"):`. Each stage is observed in the `floatchat_stage_seconds` histogram
+and, when a request trace is active, appended to it; the API returns the trace as a
+`Server-Timing` header and logs a one-line summary per request. `render_metrics()`
+produces the Prometheus text exposition format for `/metrics`.
+
+LOG_LEVEL sets the level of the "floatchat" loggers (DEBUG, INFO, WARNING, ...; OFF
+disables logging).
+"""
+import os
+import time
+import uuid
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s %(levelname)s %(name)s: %(message)s")
+# Requests slower than this are logged at WARNING instead of INFO
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+
+# Seconds; from in-memory index hits up to slow LLM calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("floatchat.telemetry")
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"floatchat.{name}")
+
+
+def configure_logging(level=None):
+    """Attach a stream handler to the "floatchat" loggers at `level` (default LOG_LEVEL)."""
+    level = (level or LOG_LEVEL).upper()
+    root = logging.getLogger("floatchat")
+    if level in ("OFF", "NONE"):
+        root.disabled = True
+        return
+    root.disabled = False
+    root.setLevel(level)
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.propagate = False
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("floatchat_request_seconds", "End-to-end request latency.", ("route", "method", "status"))
+STAGE_SECONDS = Histogram("floatchat_stage_seconds", "Latency of a pipeline stage.", ("stage",))
+ROWS_TOTAL = Counter("floatchat_rows_total", "Rows produced by a pipeline stage.", ("stage",))
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, ROWS_TOTAL]
+
+# Callables returning [(name, type, help, [(labels dict, value), ...])] evaluated at scrape time
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception as e:
+            logger.warning(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Tracing
+
+
+class RequestTrace:
+    """Stage timings and row counts of one request."""
+
+    def __init__(self, name: str, trace_id: str = None):
+        self.id = trace_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = []  # (stage, seconds), in completion order
+        self.rows = {}
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages.append((name, seconds))
+
+    def add_rows(self, name: str, count: int):
+        self.rows[name] = self.rows.get(name, 0) + count
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def totals(self):
+        """{stage: (seconds, calls)} in first-seen order."""
+        out = {}
+        for name, seconds in list(self.stages):
+            total, calls = out.get(name, (0.0, 0))
+            out[name] = (total + seconds, calls + 1)
+        return out
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in self.totals().items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        stages = " ".join(
+            f"{name}={seconds * 1000:.1f}ms" + (f"x{calls}" if calls > 1 else "")
+            for name, (seconds, calls) in self.totals().items()
+        )
+        rows = " ".join(f"{name}={count}" for name, count in self.rows.items())
+        text = f"trace={self.id} {self.name} total={self.elapsed() * 1000:.1f}ms"
+        if stages:
+            text += f" stages: {stages}"
+        if rows:
+            text += f" rows: {rows}"
+        return text
+
+
+_current_trace = contextvars.ContextVar("floatchat_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def begin_trace(name: str, trace_id: str = None):
+    """Start a trace for the current context. Returns (token, trace); pass the token to end_trace()."""
+    trace = RequestTrace(name, trace_id)
+    return _current_trace.set(trace), trace
+
+
+def end_trace(token):
+    """Log the trace summary (WARNING when slower than SLOW_REQUEST_MS) and detach it."""
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is not None:
+        level = logging.WARNING if trace.elapsed() * 1000 >= SLOW_REQUEST_MS else logging.INFO
+        logger.log(level, trace.summary())
+    return trace
+
+
+def _record(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+def record_rows(name: str, count: int):
+    ROWS_TOTAL.inc(count, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_rows(name, count)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - started)
+
+
+def timed(name: str):
+    """Decorator timing every call of a function as stage `name`. For async generators the
+    stage spans the whole iteration, and `{name}_first_item` the wait for the first item.
+    """
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def agen_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                first = True
+                try:
+                    async for item in fn(*args, **kwargs):
+                        if first:
+                            _record(f"{name}_first_item", time.perf_counter() - started)
+                            first = False
+                        yield item
+                finally:
+                    _record(name, time.perf_counter() - started)
+            return agen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def submit_in_context(pool, fn, *args):
+    """pool.submit() carrying the caller's context, so stages run on the pool's threads
+    are added to the current trace."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
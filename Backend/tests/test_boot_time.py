@@ -0,0 +1,30 @@
+"""Boot-time budget for API workers: importing the backend and the API stays within
+budget, and the heavy dependencies are loaded on first use rather than at import.
+Budgets come from BACKEND_IMPORT_BUDGET_MS / API_IMPORT_BUDGET_MS (see
+benchmarks/check_boot_time.py, which prints the slowest imports on failure).
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import check_boot_time  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def boot():
+    return check_boot_time.measure(runs=int(os.getenv("BOOT_TIME_RUNS", "3")))
+
+
+def test_backend_import_within_budget(boot):
+    assert boot["backend_ms"] <= check_boot_time.BACKEND_IMPORT_BUDGET_MS
+
+
+def test_api_import_within_budget(boot):
+    assert boot["api_ms"] <= check_boot_time.API_IMPORT_BUDGET_MS
+
+
+def test_heavy_dependencies_load_lazily(boot):
+    assert boot["loaded"] == []
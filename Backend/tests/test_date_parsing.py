@@ -0,0 +1,34 @@
+"""Time windows parsed from chat queries; distances and depths are not years."""
+from datetime import datetime
+
+import pytest
+
+from final_backend_code import parse_date_range
+
+DEFAULT_WINDOW = (datetime(2019, 1, 1), datetime(2019, 1, 31, 23, 59, 59))
+
+
+@pytest.mark.parametrize("query", [
+    "floats within 2000 km of Chennai",
+    "temperature at 1500 m near Sri Lanka",
+    "salinity at 1990 dbar",
+    "profiles between 1950 and 2000 m",
+    "show me floats near Mumbai",
+    "",
+])
+def test_numbers_with_units_fall_back_to_default(query):
+    assert parse_date_range(query) == DEFAULT_WINDOW
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("floats in 2020", (datetime(2020, 1, 1), datetime(2020, 12, 31, 23, 59, 59))),
+    ("salinity for the year 2018", (datetime(2018, 1, 1), datetime(2018, 12, 31, 23, 59, 59))),
+    ("within 20 nm of Goa in 2021", (datetime(2021, 1, 1), datetime(2021, 12, 31, 23, 59, 59))),
+    ("March 2021", (datetime(2021, 3, 1), datetime(2021, 3, 31, 23, 59, 59))),
+    ("March to June 2021", (datetime(2021, 3, 1), datetime(2021, 6, 30, 23, 59, 59))),
+    ("November to February 2021", (datetime(2020, 11, 1), datetime(2021, 2, 28, 23, 59, 59))),
+    ("Nov 2020 - Feb 2021", (datetime(2020, 11, 1), datetime(2021, 2, 28, 23, 59, 59))),
+    ("2019–2022", (datetime(2019, 1, 1), datetime(2022, 12, 31, 23, 59, 59))),
+])
+def test_named_windows(query, expected):
+    assert parse_date_range(query) == expected
@@ -0,0 +1,83 @@
+"""Geohash cells, versioned result-cache keys and the memory/disk round trip."""
+from datetime import datetime
+
+import pytest
+
+import final_backend_code
+from columnar import ProfileColumns
+from result_cache import QueryResultCache, geohash_cell, make_result_key
+from sqlite_cache import SQLiteCache
+
+START, END = datetime(2019, 1, 1), datetime(2019, 1, 31, 23, 59, 59)
+ROW = (1, 2019, 1, 2902746, 13.05, 80.3, 5.0, 1980.0, "/data/2902746.nc", datetime(2019, 1, 7, 4, 30),
+       5.0, 1980.0, 900.0, 2.5, 29.1, 12.0, 33.9, 35.2, 34.8)
+
+
+def test_geohash_matches_reference():
+    cell, (lat, lon) = geohash_cell(57.64911, 10.40744, 11)
+    assert cell == "u4pruydqqvj"
+    assert lat == pytest.approx(57.64911, abs=1e-5) and lon == pytest.approx(10.40744, abs=1e-5)
+
+
+def test_nearby_points_share_a_cell():
+    assert geohash_cell(13.0827, 80.2707)[0] == geohash_cell(13.0830, 80.2710)[0]
+    assert geohash_cell(13.0827, 80.2707)[0] != geohash_cell(13.3, 80.2707)[0]
+    # Longitudes are wrapped into [-180, 180)
+    assert geohash_cell(0.0, 190.0)[0] == geohash_cell(0.0, -170.0)[0]
+
+
+def test_key_changes_with_data_version_and_settings():
+    key = make_result_key("tdr1y", START, END, 100, 10, "geodesic", "v1")
+    assert key != make_result_key("tdr1y", START, END, 100, 10, "geodesic", "v2")
+    assert key != make_result_key("tdr1y", START, END, 200, 10, "geodesic", "v1")
+    assert key != make_result_key("tdr1y", START, END, 100, 5, "geodesic", "v1")
+    assert key != make_result_key("tdr1y", START, datetime(2019, 2, 28), 100, 10, "geodesic", "v1")
+    assert key == make_result_key("tdr1y", START, END, 100, 10, "geodesic", "v1")
+
+
+def test_backend_key_follows_data_version(monkeypatch):
+    monkeypatch.setattr(final_backend_code, "RESULT_CACHE_ENABLED", True)
+    monkeypatch.setattr(final_backend_code, "data_version", lambda start, end: "before")
+    before = final_backend_code.result_cache_key(13.08, 80.27, START, END)
+    monkeypatch.setattr(final_backend_code, "data_version", lambda start, end: "after")
+    assert final_backend_code.result_cache_key(13.08, 80.27, START, END) != before
+
+    def unavailable(start, end):
+        raise RuntimeError("database is down")
+    monkeypatch.setattr(final_backend_code, "data_version", unavailable)
+    assert final_backend_code.result_cache_key(13.08, 80.27, START, END) is None
+
+
+def test_round_trip_through_disk(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "results.sqlite"), table="results")
+    key = make_result_key("tdr1y", START, END, version="v1")
+    QueryResultCache(disk=disk).set(key, [2902746], ProfileColumns.from_rows([ROW]))
+
+    # A second worker sees the entry through the shared disk tier, then from memory
+    cache = QueryResultCache(disk=disk)
+    for _ in range(2):
+        nearest_ids, columns = cache.get(key)
+        assert nearest_ids == [2902746]
+        assert columns.rows == [ROW]
+    assert cache.get(make_result_key("tdr1y", START, END, version="v2")) is None
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+
+
+def test_mismatch_lowers_hit_rate():
+    cache = QueryResultCache()
+    key = make_result_key("tdr1y", START, END)
+    cache.set(key, [2902746], ProfileColumns.from_rows([ROW]))
+    assert cache.get(key) is not None
+    assert cache.stats()["hit_rate"] == 1.0
+    cache.record_mismatch()
+    assert cache.stats()["mismatches"] == 1
+    assert cache.stats()["hit_rate"] == 0.0
+
+
+def test_expired_entries_are_dropped():
+    cache = QueryResultCache(ttl=-1)
+    key = make_result_key("tdr1y", START, END)
+    cache.set(key, [2902746], ProfileColumns.from_rows([ROW]))
+    assert cache.get(key) is None
+    assert cache.stats()["memory_entries"] == 0
@@ -0,0 +1,71 @@
+"""Geodesic search in MonthIndex on a handful of hand-placed floats."""
+import pytest
+
+from spatial_index import MonthIndex, haversine_km
+
+pytest.importorskip("faiss")
+
+
+@pytest.fixture(scope="module")
+def index():
+    # (lat, lon, float id); float 4 has two profiles in the month
+    floats = [
+        (0.0, 179.9, "1"),
+        (0.0, -179.9, "2"),
+        (0.0, 170.0, "3"),
+        (10.0, 80.0, "4"),
+        (10.1, 80.1, "4"),
+        (89.5, 0.0, "5"),
+        (89.5, 180.0, "6"),
+    ]
+    lats, lons, ids = zip(*floats)
+    return MonthIndex(lats, lons, ids, [f"/data/{fid}.nc" for fid in ids])
+
+
+def test_haversine_across_antimeridian():
+    assert haversine_km(0.0, 179.9, 0.0, -179.9) == pytest.approx(22.24, abs=0.01)
+
+
+def test_nearest_wraps_the_antimeridian(index):
+    ids, files, dists = index.search_geodesic_batch([0.0], [179.95], k=2)[0]
+    assert ids == ["1", "2"]
+    assert files == ["/data/1.nc", "/data/2.nc"]
+    assert dists == pytest.approx([5.56, 16.68], abs=0.01)
+
+
+def test_radius_search_crosses_the_antimeridian(index):
+    # A planar search from 179.9 would put float 2 at 359.8 degrees
+    ids, _, dists = index.search_geodesic_batch([0.0], [179.9], k=10, radius_km=50)[0]
+    assert ids == ["1", "2"]
+    assert all(d <= 50 for d in dists)
+
+
+def test_radius_search_near_the_pole(index):
+    # 180 degrees of longitude apart, but only about 111 km over the pole
+    ids, _, dists = index.search_geodesic_batch([89.5], [0.0], k=10, radius_km=150)[0]
+    assert ids == ["5", "6"]
+    assert dists[1] == pytest.approx(111.2, abs=0.1)
+
+
+def test_radius_with_no_floats(index):
+    assert index.search_geodesic_batch([-45.0], [-30.0], radius_km=100) == [([], [], [])]
+
+
+def test_k_limits_rows_and_floats_collapse(index):
+    ids, _, _ = index.search_geodesic_batch([10.05], [80.05], k=2)[0]
+    assert ids == ["4"]
+    ids, _, _ = index.search_geodesic_batch([10.05], [80.05], k=3)[0]
+    assert ids[0] == "4" and len(ids) == 2
+
+
+def test_exact_match_is_promoted(index):
+    # About 56 m from float 3, so outside a 10 m radius but within the exact-match tolerance
+    ids, files, dists = index.search_geodesic_batch([0.0005], [170.0], k=10, radius_km=0.01)[0]
+    assert (ids, files, dists) == (["3"], ["/data/3.nc"], [0.0])
+
+
+def test_batch_matches_single_queries(index):
+    points = [(0.0, 179.95), (10.0, 80.0), (89.5, 0.0)]
+    batch = index.search_geodesic_batch([p[0] for p in points], [p[1] for p in points], k=3, radius_km=500)
+    for (lat, lon), result in zip(points, batch):
+        assert index.search_geodesic(lat, lon, k=3, radius_km=500) == result
@@ -0,0 +1,42 @@
+"""LTTB downsampling of raw depth profiles."""
+import numpy as np
+
+from vertical_profiles import downsample_profile, lttb_indices
+
+
+def test_short_input_is_returned_unchanged():
+    x = np.arange(5.0)
+    assert lttb_indices(x, x ** 2, 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(x, x ** 2, 5).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_keeps_endpoints_and_returns_n_sorted_points():
+    x = np.linspace(0, 2000, 500)
+    y = np.sin(x / 100)
+    idx = lttb_indices(x, y, 50)
+    assert len(idx) == 50
+    assert idx[0] == 0 and idx[-1] == 499
+    assert np.all(np.diff(idx) > 0)
+
+
+def test_keeps_a_spike():
+    x = np.arange(100.0)
+    y = np.zeros(100)
+    y[37] = 10.0
+    assert 37 in lttb_indices(x, y, 10)
+
+
+def test_downsample_profile_shares_one_pressure_axis():
+    pressure = np.arange(0.0, 1000.0, 5.0)
+    temperature = 25 - pressure / 50
+    salinity = np.full(len(pressure), 35.0)
+    salinity[:20] = np.nan
+    salinity[100] = 36.0
+    kept, values = downsample_profile(pressure, {"temperature": temperature, "salinity": salinity}, 10)
+    assert np.all(np.diff(kept) > 0)
+    assert kept[0] == 0.0 and kept[-1] == pressure[-1]
+    assert pressure[20] in kept and pressure[100] in kept
+    assert len(kept) <= 20
+    assert set(values) == {"temperature", "salinity"}
+    assert all(len(series) == len(kept) for series in values.values())
+    np.testing.assert_array_equal(values["temperature"], 25 - kept / 50)
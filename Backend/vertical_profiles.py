@@ -0,0 +1,182 @@
+import numpy as np
+
+from schema import partition_exists
+
+
+VARIABLES = ("temperature", "salinity")
+
+# Standard pressure levels (dbar) profiles are binned onto in "levels" mode
+STANDARD_PRESSURE_LEVELS = (
+    5, 10, 20, 30, 50, 75, 100, 125, 150, 200, 250, 300, 400, 500, 600, 700,
+    800, 900, 1000, 1100, 1200, 1300, 1400, 1500, 1750, 2000,
+)
+
+
+def level_edges(levels):
+    """Bin edges halfway between consecutive levels; samples below the first edge fall in the
+    first level's bin and samples above the last in the last level's bin.
+    """
+    levels = np.asarray(levels, dtype=np.float64)
+    return ((levels[:-1] + levels[1:]) / 2).tolist()
+
+
+def build_binned_sql(year):
+    """Per-profile averages over each pressure bin, computed in Postgres so only
+    profiles × levels rows come back, whatever the raw sample count.
+    """
+    return f"""
+        SELECT profile_id,
+               width_bucket(pressure, %s::double precision[]) AS bin,
+               COUNT(*) AS samples,
+               AVG(temperature) AS temperature,
+               AVG(salinity) AS salinity
+        FROM measurements_{year}
+        WHERE profile_id = ANY(%s) AND pressure IS NOT NULL
+        GROUP BY profile_id, bin
+        ORDER BY profile_id, bin
+    """
+
+
+def build_raw_sql(year):
+    return f"""
+        SELECT profile_id, pressure, temperature, salinity
+        FROM measurements_{year}
+        WHERE profile_id = ANY(%s) AND pressure IS NOT NULL
+        ORDER BY profile_id, pressure
+    """
+
+
+def build_select_profiles_sql(year, by_float, with_time_filter):
+    where = "float_id = ANY(%s)" if by_float else "profile_id = ANY(%s)"
+    if with_time_filter:
+        where += " AND profile_datetime BETWEEN %s AND %s"
+    return f"""
+        SELECT profile_id, float_id, profile_datetime, latitude, longitude
+        FROM profiles_{year}
+        WHERE {where}
+        ORDER BY profile_datetime, profile_id
+        LIMIT %s
+    """
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of `n_out` points of (x, y) that keep the
+    visual shape of the curve. `x` must be sorted. Each bucket is scored in one vectorized
+    step; the loop runs once per output point.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = bounds[i], max(bounds[i + 1], bounds[i] + 1)
+        if i + 2 < len(bounds):
+            next_x = x[bounds[i + 1]:bounds[i + 2]].mean()
+            next_y = y[bounds[i + 1]:bounds[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_profile(pressure, values: dict, n_out):
+    """Keep the union of the LTTB points of each variable (so all variables share one
+    pressure axis); at most n_out × len(values) samples.
+    """
+    keep = []
+    for series in values.values():
+        valid = np.flatnonzero(~np.isnan(series))
+        keep.append(valid[lttb_indices(pressure[valid], series[valid], n_out)])
+    idx = np.unique(np.concatenate(keep)) if keep else np.arange(0)
+    return pressure[idx], {name: series[idx] for name, series in values.items()}
+
+
+def _nullable(values):
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(values), None, values.astype(object)).tolist()
+
+
+def select_profiles(conn, year, profile_ids=None, float_ids=None, start_date=None, end_date=None, limit=50):
+    """Profile metadata rows (profile_id, float_id, profile_datetime, latitude, longitude)."""
+    with_time_filter = bool(start_date and end_date)
+    by_float = float_ids is not None
+    params = [[int(v) for v in (float_ids if by_float else profile_ids or [])]]
+    if with_time_filter:
+        params.extend([start_date, end_date])
+    params.append(int(limit))
+    with conn.cursor() as cur:
+        cur.execute(build_select_profiles_sql(int(year), by_float, with_time_filter), params)
+        return cur.fetchall()
+
+
+def query_vertical_profiles(conn, year, profile_ids=None, float_ids=None, start_date=None, end_date=None,
+                            mode="levels", points=200, variables=VARIABLES, levels=STANDARD_PRESSURE_LEVELS,
+                            max_profiles=50):
+    """Depth profiles of the selected profiles (by id, or by float within an optional window).
+
+    - mode "levels": averages on the pressure `levels`, binned in SQL.
+    - mode "lttb": raw samples downsampled to about `points` per variable with LTTB.
+    Returns (profiles, truncated) where each profile carries `pressure` plus one list per
+    variable, and truncated is True when more than `max_profiles` profiles matched.
+    """
+    year = int(year)
+    with conn.cursor() as cur:
+        if not partition_exists(cur, f"profiles_{year}"):
+            return [], False
+    meta = select_profiles(conn, year, profile_ids, float_ids, start_date, end_date, limit=max_profiles + 1)
+    truncated = len(meta) > max_profiles
+    meta = meta[:max_profiles]
+    ids = [row[0] for row in meta]
+    if not ids:
+        return [], truncated
+
+    with conn.cursor() as cur:
+        if mode == "levels":
+            cur.execute(build_binned_sql(year), (level_edges(levels), ids))
+        else:
+            cur.execute(build_raw_sql(year), (ids,))
+        rows = cur.fetchall()
+
+    if rows:
+        data = np.array([r[1:] for r in rows], dtype=np.float64)
+        row_ids = np.array([r[0] for r in rows], dtype=np.int64)
+    else:
+        data = np.empty((0, 4))
+        row_ids = np.empty(0, dtype=np.int64)
+    # Rows are ordered by profile_id; split them into one block per profile
+    unique_ids, starts = np.unique(row_ids, return_index=True)
+    blocks = dict(zip(unique_ids.tolist(), np.split(data, starts[1:])))
+    level_values = np.asarray(levels, dtype=np.float64)
+
+    profiles = []
+    for profile_id, float_id, when, lat, lon in meta:
+        block = blocks.get(profile_id, np.empty((0, 4)))
+        if mode == "levels":
+            # Columns: bin, samples, temperature, salinity
+            pressure = level_values[block[:, 0].astype(np.int64)] if len(block) else np.empty(0)
+            values = {"temperature": block[:, 2], "salinity": block[:, 3]}
+            samples = int(block[:, 1].sum()) if len(block) else 0
+        else:
+            # Columns: pressure, temperature, salinity
+            samples = len(block)
+            pressure, values = downsample_profile(
+                block[:, 0], {name: block[:, 1 + VARIABLES.index(name)] for name in variables}, points,
+            )
+        entry = {
+            "profile_id": profile_id,
+            "float_id": float_id,
+            "datetime": when.strftime("%Y-%m-%dT%H:%M:%SZ") if when else None,
+            "latitude": lat,
+            "longitude": lon,
+            "raw_samples": samples,
+            "pressure": pressure.tolist(),
+        }
+        for name in variables:
+            entry[name] = _nullable(values[name])
+        profiles.append(entry)
+    return profiles, truncated
@@ -9,6 +9,7 @@ import { ChatWindow } from "@/components/chat/chat-window"
 import Dashboard from "@/components/dashboard/Dashboard" // Import Dashboard
 import { Button } from "@/components/ui/button" // Assuming Button is from a UI library like shadcn
 import { Menu, X, PanelLeftIcon } from "lucide-react" // Icons for toggle button
+import { apiService } from "@/services/api"
 
 function AuthPage() {
   const [isLogin, setIsLogin] = useState(true)
@@ -26,6 +27,37 @@ function AuthPage() {
   )
 }
 
+// Render a compact, screen-fitting table
+function renderTable(rows) {
+  const columns = rows.length ? Object.keys(rows[0]) : []
+  const possibleConds = ["temperature", "salinity", "pressure"]
+  const condCols = possibleConds.filter(c => columns.includes(c))
+  // Preferred order without year/month
+  const preferredOrder = ["float_id", ...condCols, "latitude", "longitude", "depth_min", "depth_max"]
+  const orderedColumns = [
+    ...preferredOrder.filter(c => columns.includes(c)),
+    ...columns.filter(c => !preferredOrder.includes(c)),
+  ]
+  return `
+    <div class="overflow-x-auto w-full">
+      <table class="w-full text-sm border-collapse">
+        <thead>
+          <tr>
+            ${orderedColumns.map(c => `<th class="text-left font-medium border-b p-2">${c}</th>`).join('')}
+          </tr>
+        </thead>
+        <tbody>
+          ${rows.map(r => `
+            <tr>
+              ${orderedColumns.map(c => `<td class="border-b p-2 whitespace-nowrap">${r[c] ?? ''}</td>`).join('')}
+            </tr>
+          `).join('')}
+        </tbody>
+      </table>
+    </div>
+  `
+}
+
 function ChatApp() {
   const [messages, setMessages] = useState([])
   const [loading, setLoading] = useState(false)
@@ -50,6 +82,75 @@ function ChatApp() {
     loadChatHistory() // Load chat history by default
   }, [])
 
+  const addBotMessage = (content, offset = 1) => {
+    const botResponse = {
+      id: (Date.now() + offset).toString(),
+      content,
+      sender: "bot",
+      timestamp: new Date().toISOString(),
+    }
+    setMessages((prev) => [...prev, botResponse])
+  }
+
+  const showData = (data) => {
+    if (data.type === 'visualization') {
+      // Open dashboard split view and pass data down
+      setIsSplitView(true)
+      setDashData(data.data || [])
+      addBotMessage('Received data for visualization. Opened dashboard (filtered to requested condition).', 2)
+    } else if (data.type === 'table') {
+      addBotMessage(renderTable(data.data || []))
+    }
+  }
+
+  // Whole answer in one response; used when the WebSocket cannot be opened
+  const sendWithoutStreaming = async (content) => {
+    const data = await apiService.sendMessage({ message: content })
+    if (data.answer) {
+      addBotMessage(data.answer)
+    }
+    showData(data)
+  }
+
+  // Progressive answer: the chart or table renders as soon as its data arrives and the
+  // summary is appended token by token. apiService keeps this tab's session_id, so
+  // follow-ups reuse the previous results.
+  const streamReply = (content) =>
+    new Promise((resolve, reject) => {
+      const replyId = `${Date.now()}-reply`
+      let received = false
+      let replyStarted = false
+      apiService.streamMessage({ message: content }, {
+        onLocation: () => {
+          received = true
+        },
+        onData: (msg) => {
+          received = true
+          setLoading(false)
+          showData(msg)
+        },
+        onToken: (text) => {
+          received = true
+          setLoading(false)
+          if (!replyStarted) {
+            replyStarted = true
+            setMessages((prev) => [
+              ...prev,
+              { id: replyId, content: text, sender: "bot", timestamp: new Date().toISOString() },
+            ])
+          } else {
+            setMessages((prev) => prev.map((m) => (m.id === replyId ? { ...m, content: m.content + text } : m)))
+          }
+        },
+        onAnswer: (answer) => {
+          addBotMessage(answer)
+          resolve()
+        },
+        onDone: resolve,
+        onError: (error) => (received ? reject(error) : resolve(sendWithoutStreaming(content))),
+      })
+    })
+
   const handleSendMessage = async (content) => {
     const userMessage = {
       id: Date.now().toString(),
@@ -62,82 +163,7 @@ function ChatApp() {
     setLoading(true)
 
     try {
-      const base = (process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000')
-      const res = await fetch(base + '/chat/send', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: content })
-      })
-      if (!res.ok) throw new Error('Backend error')
-      const data = await res.json()
-
-      if (data.type === 'answer') {
-        const botResponse = {
-          id: (Date.now() + 1).toString(),
-          content: data.answer,
-          sender: 'bot',
-          timestamp: new Date().toISOString(),
-        }
-        setMessages((prev) => [...prev, botResponse])
-      } else if (data.type === 'visualization') {
-        // Open dashboard split view and pass data down
-        setIsSplitView(true)
-        setDashData(data.data || [])
-        // If backend also sent a textual answer, show it as a bot message
-        if (data.answer) {
-          const textBotResponse = {
-            id: (Date.now() + 1).toString(),
-            content: data.answer,
-            sender: 'bot',
-            timestamp: new Date().toISOString(),
-          }
-          setMessages((prev) => [...prev, textBotResponse])
-        }
-        const botResponse = {
-          id: (Date.now() + 2).toString(),
-          content: 'Received data for visualization. Opened dashboard (filtered to requested condition).',
-          sender: 'bot',
-          timestamp: new Date().toISOString(),
-        }
-        setMessages((prev) => [...prev, botResponse])
-      } else if (data.type === 'table') {
-        // Render a compact, screen-fitting table
-        const rows = data.data || []
-        const columns = rows.length ? Object.keys(rows[0]) : []
-        const possibleConds = ["temperature", "salinity", "pressure"]
-        const condCols = possibleConds.filter(c => columns.includes(c))
-        // Preferred order without year/month
-        const preferredOrder = ["float_id", ...condCols, "latitude", "longitude", "depth_min", "depth_max"]
-        const orderedColumns = [
-          ...preferredOrder.filter(c => columns.includes(c)),
-          ...columns.filter(c => !preferredOrder.includes(c)),
-        ]
-        const tableHtml = `
-          <div class="overflow-x-auto w-full">
-            <table class="w-full text-sm border-collapse">
-              <thead>
-                <tr>
-                  ${orderedColumns.map(c => `<th class="text-left font-medium border-b p-2">${c}</th>`).join('')}
-                </tr>
-              </thead>
-              <tbody>
-                ${rows.map(r => `
-                  <tr>
-                    ${orderedColumns.map(c => `<td class="border-b p-2 whitespace-nowrap">${r[c] ?? ''}</td>`).join('')}
-                  </tr>
-                `).join('')}
-              </tbody>
-            </table>
-          </div>
-        `
-        const botResponse = {
-          id: (Date.now() + 1).toString(),
-          content: tableHtml,
-          sender: 'bot',
-          timestamp: new Date().toISOString(),
-        }
-        setMessages((prev) => [...prev, botResponse])
-      }
+      await streamReply(content)
     } catch (error) {
       console.error("Failed to send message:", error)
     } finally {
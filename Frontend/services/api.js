@@ -51,18 +51,83 @@ class ApiService {
     return response.json()
   }
 
+  // Conversation id issued by the backend; sent with every chat message so follow-ups
+  // ("give me in table") use this tab's history and last results.
+  withSession(data) {
+    const sessionId = sessionStorage.getItem("chat_session_id")
+    return { ...data, ...(sessionId && !data.session_id && { session_id: sessionId }) }
+  }
+
+  rememberSession(msg) {
+    if (msg?.session_id) {
+      sessionStorage.setItem("chat_session_id", msg.session_id)
+    }
+  }
+
   async sendMessage(data) {
     const response = await fetch(`${API_BASE_URL}/chat/send`, {
       method: "POST",
       headers: this.getAuthHeaders(),
-      body: JSON.stringify(data),
+      body: JSON.stringify(this.withSession(data)),
     })
 
     if (!response.ok) {
       throw new Error("Failed to send message")
     }
 
-    return response.json()
+    const result = await response.json()
+    this.rememberSession(result)
+    return result
+  }
+
+  // Progressive chat over WebSocket. Handlers are called as each part arrives:
+  // onLocation({ latitude, longitude, ... }), onData({ type: "visualization" | "table", data }),
+  // onToken(text), onDone(), onAnswer(answer), onError(error). Returns the socket so callers can close it.
+  streamMessage(data, handlers = {}) {
+    const wsUrl = API_BASE_URL.replace(/^http/, "ws") + "/chat/ws"
+    const socket = new WebSocket(wsUrl)
+
+    // Set once a final message (answer/done/error) or a socket failure has been reported
+    let settled = false
+    const settle = (handler, ...args) => {
+      if (!settled) {
+        settled = true
+        handler?.(...args)
+      }
+    }
+
+    socket.onopen = () => socket.send(JSON.stringify(this.withSession(data)))
+    socket.onmessage = (event) => {
+      const msg = JSON.parse(event.data)
+      this.rememberSession(msg)
+      switch (msg.type) {
+        case "location":
+          handlers.onLocation?.(msg)
+          break
+        case "visualization":
+        case "table":
+          handlers.onData?.(msg)
+          break
+        case "token":
+          handlers.onToken?.(msg.text)
+          break
+        case "answer":
+          settle(handlers.onAnswer, msg.answer)
+          socket.close()
+          break
+        case "done":
+          settle(handlers.onDone)
+          socket.close()
+          break
+        case "error":
+          settle(handlers.onError, new Error(msg.error))
+          socket.close()
+          break
+      }
+    }
+    socket.onerror = () => settle(handlers.onError, new Error("Failed to stream message"))
+    socket.onclose = () => settle(handlers.onError, new Error("Connection closed before the answer was complete"))
+    return socket
   }
 
   async getUserProfile() {